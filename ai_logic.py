@@ -3,19 +3,105 @@
 """
 AI логика для бота диагностики рисков ремонта
 Упрощенная версия для работы без внешних зависимостей
+Все тексты — неизменяемые таблицы уровня модуля, собираются один раз при импорте
 """
 
+import functools
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+# ============ ТАБЛИЦЫ ============
+# Рекомендации по стадиям ремонта
+RECOMMENDATIONS = MappingProxyType({
+    "not_started": MappingProxyType({
+        "recommendation": "💡 *Рекомендация:* Сейчас самое время создать детальный план ремонта. Это сэкономит до 80% будущих проблем.",
+        "emotional": "🔥 *Сейчас — лучшее время действовать!* У тебя есть возможность избежать большинства ошибок."
+    }),
+    "demolition": MappingProxyType({
+        "recommendation": "⚡ *Рекомендация:* Зафиксируй ВСЁ на видео до начала работ. Это твоя страховка на случай проблем.",
+        "emotional": "🏗️ *Фундамент ремонта закладывается сейчас!* Качество демонтажа влияет на все последующие этапы."
+    }),
+    "rough": MappingProxyType({
+        "recommendation": "🎯 *Рекомендация:* Проверяй каждый этап черновых работ. Ошибки здесь самые дорогие в исправлении.",
+        "emotional": "🔧 *Сейчас идут самые важные работы!* Именно на этом этапе решается, будет ли ремонт качественным."
+    }),
+    "finishing": MappingProxyType({
+        "recommendation": "🎨 *Рекомендация:* Внимательно проверяй стыки и углы. Мелкие дефекты на финише виднее всего.",
+        "emotional": "✨ *Финальный этап!* Именно сейчас создаётся тот самый «вау-эффект» от ремонта."
+    }),
+    "living": MappingProxyType({
+        "recommendation": "🏠 *Рекомендация:* Проверь все узлы и соединения. Скрытые дефекты могут проявиться со временем.",
+        "emotional": "🛡️ *Ремонт закончен, но защита продолжается!* Гарантийные обязательства — твоя безопасность."
+    })
+})
+
+# Дополнение к рекомендации в зависимости от контроля
+CONTROL_ADVICE = MappingProxyType({
+    "self": "\n\n🤔 *Особенно для тебя:* Без технических знаний легко пропустить ошибки. Нужны чек-листы.",
+    "nobody": "\n\n🚨 *Особенно для тебя:* Отсутствие контроля = 100% риск переплат. Срочно нужна система.",
+    "foreman": "\n\n⚠️ *Особенно для тебя:* Прораб отвечает за процесс, но не за твои деньги. Нужен независимый контроль."
+})
+
+# Эмоциональные ответы: (порог суммы, текст), от большего порога к меньшему
+EMOTIONAL_RESPONSES: Tuple[Tuple[float, str], ...] = (
+    (300000, "🚨 *ЭТО НЕ ШУТКИ:* За эти деньги можно купить новую машину или сделать капитальный ремонт в другой квартире!"),
+    (200000, "⚠️ *ВНИМАНИЕ:* Эта сумма равна годовому платежу по ипотеке или нескольким отпускам за границей!"),
+    (100000, "💰 *СЕРЬЁЗНО:* Такие деньги уходят на переделки, которые можно было предотвратить системой контроля."),
+    (50000, "💸 *ЗНАЧИТЕЛЬНО:* Это стоимость качественной кухни или тёплого пола во всей квартире."),
+    (0, "💡 *МИНИМУМ:* Даже эта сумма важна. Она могла пойти на дизайнерские светильники или умную технику."),
+)
+
+# Шаблоны примеров: (ошибка, доля от средней потери "от", доля "до", сценарий)
+EXAMPLE_TEMPLATES = MappingProxyType({
+    "not_started": (
+        ("Неправильное ТЗ", 0.3, 0.6, "Придётся переделывать проект в процессе работ"),
+        ("Плохой договор", 0.4, 0.7, "Нет ответственности подрядчика за ошибки"),
+    ),
+    "demolition": (
+        ("Повреждение конструкций", 0.5, 1.0, "Ремонт у соседей + восстановление"),
+        ("Неправильный вывоз мусора", 0.2, 0.4, "Штрафы + срочная уборка"),
+    ),
+    "rough": (
+        ("Кривая штукатурка", 0.4, 0.8, "Мебель не встаёт ровно, нужно переделывать"),
+        ("Ошибки в электрике", 0.3, 0.7, "Вскрытие стен + полная переделка"),
+    ),
+    "finishing": (
+        ("Отвалившаяся плитка", 0.5, 0.9, "Новый материал + работа + простой"),
+        ("Неровная покраска", 0.3, 0.6, "Шлифовка + повторная покраска"),
+    ),
+    "living": (
+        ("Протечка в ванной", 0.6, 1.0, "Ремонт у соседей + свой ремонт + компенсации"),
+        ("Неисправная электрика", 0.4, 0.8, "Вскрытие отделки + поиск проблемы"),
+    )
+})
+
+# Дополнительный пример в зависимости от контроля
+CONTROL_EXAMPLES = MappingProxyType({
+    "self": ("Самоконтроль без знаний", 0.3, 0.5, "Не заметил вовремя ошибки, которые заметил бы специалист"),
+    "nobody": ("Работа без контроля", 0.5, 0.8, "Мастера сэкономили на материалах и качестве"),
+})
+
+# Вовлекающие вопросы по стадиям
+ENGAGEMENT_QUESTIONS = MappingProxyType({
+    "not_started": "Что для тебя важнее: сэкономить 50 000 ₽ сейчас на планировании или потерять 200 000 ₽ потом на переделках?",
+    "demolition": "Готов(а) ли ты рискнуть конструкцией своего дома, чтобы сэкономить пару дней на демонтаже?",
+    "rough": "Как думаешь, заметишь ли ты кривую стену под штукатуркой без лазерного уровня?",
+    "finishing": "Хочешь ли ты через год видеть трещины на плитке и отслоившуюся краску?",
+    "living": "Представляешь, как будешь объяснять соседям, что твой ремонт затопил их квартиру?"
+})
+DEFAULT_ENGAGEMENT_QUESTION = "Готов(а) ли ты потерять эти деньги или хочешь их сохранить?"
+
+
+# ============ ФУНКЦИИ (без кэша) ============
 def smart_format_money(amount: float, format_type: str = "normal") -> str:
     """Умное форматирование суммы денег"""
     if amount >= 1000000:
         formatted = f"{amount/1000000:.1f} млн ₽"
-    elif amount >= 100000:
-        formatted = f"{int(amount/1000)} тыс ₽"
     elif amount >= 1000:
         formatted = f"{int(amount/1000)} тыс ₽"
     else:
         formatted = f"{int(amount)} ₽"
-    
+
     if format_type == "emotional":
         if amount >= 300000:
             return f"🚨 *ОЧЕНЬ КРУПНАЯ СУММА:* {formatted}"
@@ -38,120 +124,79 @@ def smart_format_money(amount: float, format_type: str = "normal") -> str:
         return formatted
 
 
-def get_personalized_recommendation(stage: str, control: str, area: str, fixation: str) -> dict:
+def get_personalized_recommendation(stage: str, control: str, area: str, fixation: str) -> Mapping[str, str]:
     """Персонализированная рекомендация на основе параметров пользователя"""
-    
-    recommendations = {
-        "not_started": {
-            "recommendation": "💡 *Рекомендация:* Сейчас самое время создать детальный план ремонта. Это сэкономит до 80% будущих проблем.",
-            "emotional": "🔥 *Сейчас — лучшее время действовать!* У тебя есть возможность избежать большинства ошибок."
-        },
-        "demolition": {
-            "recommendation": "⚡ *Рекомендация:* Зафиксируй ВСЁ на видео до начала работ. Это твоя страховка на случай проблем.",
-            "emotional": "🏗️ *Фундамент ремонта закладывается сейчас!* Качество демонтажа влияет на все последующие этапы."
-        },
-        "rough": {
-            "recommendation": "🎯 *Рекомендация:* Проверяй каждый этап черновых работ. Ошибки здесь самые дорогие в исправлении.",
-            "emotional": "🔧 *Сейчас идут самые важные работы!* Именно на этом этапе решается, будет ли ремонт качественным."
-        },
-        "finishing": {
-            "recommendation": "🎨 *Рекомендация:* Внимательно проверяй стыки и углы. Мелкие дефекты на финише виднее всего.",
-            "emotional": "✨ *Финальный этап!* Именно сейчас создаётся тот самый «вау-эффект» от ремонта."
-        },
-        "living": {
-            "recommendation": "🏠 *Рекомендация:* Проверь все узлы и соединения. Скрытые дефекты могут проявиться со временем.",
-            "emotional": "🛡️ *Ремонт закончен, но защита продолжается!* Гарантийные обязательства — твоя безопасность."
-        }
-    }
-    
     # Получаем базовую рекомендацию для стадии
-    stage_rec = recommendations.get(stage, recommendations["not_started"])
-    
+    stage_rec = RECOMMENDATIONS.get(stage, RECOMMENDATIONS["not_started"])
+
     # Адаптируем под контроль
-    if control == "self":
-        stage_rec["recommendation"] += "\n\n🤔 *Особенно для тебя:* Без технических знаний легко пропустить ошибки. Нужны чек-листы."
-    elif control == "nobody":
-        stage_rec["recommendation"] += "\n\n🚨 *Особенно для тебя:* Отсутствие контроля = 100% риск переплат. Срочно нужна система."
-    elif control == "foreman":
-        stage_rec["recommendation"] += "\n\n⚠️ *Особенно для тебя:* Прораб отвечает за процесс, но не за твои деньги. Нужен независимый контроль."
-    
-    return stage_rec
+    advice = CONTROL_ADVICE.get(control)
+    if advice is None:
+        return stage_rec
+    return MappingProxyType({
+        "recommendation": stage_rec["recommendation"] + advice,
+        "emotional": stage_rec["emotional"],
+    })
 
 
 def get_emotional_response(amount: float) -> str:
     """Эмоциональный ответ на сумму потерь"""
-    if amount >= 300000:
-        return "🚨 *ЭТО НЕ ШУТКИ:* За эти деньги можно купить новую машину или сделать капитальный ремонт в другой квартире!"
-    elif amount >= 200000:
-        return "⚠️ *ВНИМАНИЕ:* Эта сумма равна годовому платежу по ипотеке или нескольким отпускам за границей!"
-    elif amount >= 100000:
-        return "💰 *СЕРЬЁЗНО:* Такие деньги уходят на переделки, которые можно было предотвратить системой контроля."
-    elif amount >= 50000:
-        return "💸 *ЗНАЧИТЕЛЬНО:* Это стоимость качественной кухни или тёплого пола во всей квартире."
-    else:
-        return "💡 *МИНИМУМ:* Даже эта сумма важна. Она могла пойти на дизайнерские светильники или умную технику."
+    for threshold, text in EMOTIONAL_RESPONSES:
+        if amount >= threshold:
+            return text
+    return EMOTIONAL_RESPONSES[-1][1]
 
 
-def generate_personalized_examples(stage: str, control: str, avg_loss: float) -> list:
+def generate_personalized_examples(stage: str, control: str, avg_loss: float) -> Tuple[Tuple[str, str, str], ...]:
     """Персонализированные примеры для пользователя"""
-    
-    base_examples = {
-        "not_started": [
-            ("Неправильное ТЗ", f"{int(avg_loss*0.3)}-{int(avg_loss*0.6)} тыс ₽", "Придётся переделывать проект в процессе работ"),
-            ("Плохой договор", f"{int(avg_loss*0.4)}-{int(avg_loss*0.7)} тыс ₽", "Нет ответственности подрядчика за ошибки"),
-        ],
-        "demolition": [
-            ("Повреждение конструкций", f"{int(avg_loss*0.5)}-{int(avg_loss)} тыс ₽", "Ремонт у соседей + восстановление"),
-            ("Неправильный вывоз мусора", f"{int(avg_loss*0.2)}-{int(avg_loss*0.4)} тыс ₽", "Штрафы + срочная уборка"),
-        ],
-        "rough": [
-            ("Кривая штукатурка", f"{int(avg_loss*0.4)}-{int(avg_loss*0.8)} тыс ₽", "Мебель не встаёт ровно, нужно переделывать"),
-            ("Ошибки в электрике", f"{int(avg_loss*0.3)}-{int(avg_loss*0.7)} тыс ₽", "Вскрытие стен + полная переделка"),
-        ],
-        "finishing": [
-            ("Отвалившаяся плитка", f"{int(avg_loss*0.5)}-{int(avg_loss*0.9)} тыс ₽", "Новый материал + работа + простой"),
-            ("Неровная покраска", f"{int(avg_loss*0.3)}-{int(avg_loss*0.6)} тыс ₽", "Шлифовка + повторная покраска"),
-        ],
-        "living": [
-            ("Протечка в ванной", f"{int(avg_loss*0.6)}-{int(avg_loss)} тыс ₽", "Ремонт у соседей + свой ремонт + компенсации"),
-            ("Неисправная электрика", f"{int(avg_loss*0.4)}-{int(avg_loss*0.8)} тыс ₽", "Вскрытие отделки + поиск проблемы"),
-        ]
-    }
-    
-    examples = base_examples.get(stage, base_examples["not_started"])
-    
-    # Добавляем примеры в зависимости от контроля
-    if control == "self":
-        examples.append(("Самоконтроль без знаний", 
-                        f"{int(avg_loss*0.3)}-{int(avg_loss*0.5)} тыс ₽", 
-                        "Не заметил вовремя ошибки, которые заметил бы специалист"))
-    elif control == "nobody":
-        examples.append(("Работа без контроля", 
-                        f"{int(avg_loss*0.5)}-{int(avg_loss*0.8)} тыс ₽", 
-                        "Мастера сэкономили на материалах и качестве"))
-    
-    return examples
+    templates = EXAMPLE_TEMPLATES.get(stage, EXAMPLE_TEMPLATES["not_started"])
+
+    # Добавляем пример в зависимости от контроля
+    control_example = CONTROL_EXAMPLES.get(control)
+    if control_example is not None:
+        templates = templates + (control_example,)
+
+    # Форматируем только то, что возвращаем
+    return tuple(
+        (title, f"{int(avg_loss*low)}-{int(avg_loss*high)} тыс ₽", scenario)
+        for title, low, high, scenario in templates
+    )
 
 
 def get_engagement_question(stage: str) -> str:
     """Вовлекающий вопрос для пользователя"""
-    questions = {
-        "not_started": "Что для тебя важнее: сэкономить 50 000 ₽ сейчас на планировании или потерять 200 000 ₽ потом на переделках?",
-        "demolition": "Готов(а) ли ты рискнуть конструкцией своего дома, чтобы сэкономить пару дней на демонтаже?",
-        "rough": "Как думаешь, заметишь ли ты кривую стену под штукатуркой без лазерного уровня?",
-        "finishing": "Хочешь ли ты через год видеть трещины на плитке и отслоившуюся краску?",
-        "living": "Представляешь, как будешь объяснять соседям, что твой ремонт затопил их квартиру?"
-    }
-    return questions.get(stage, "Готов(а) ли ты потерять эти деньги или хочешь их сохранить?")
+    return ENGAGEMENT_QUESTIONS.get(stage, DEFAULT_ENGAGEMENT_QUESTION)
 
 
-# Создаем объект ai_engine для импорта
+# ============ ДВИЖОК С КЭШЕМ ============
 class AIEngine:
-    def __init__(self):
-        self.get_personalized_recommendation = get_personalized_recommendation
-        self.get_emotional_response = get_emotional_response
-        self.generate_personalized_examples = generate_personalized_examples
-        self.smart_format_money = smart_format_money
+    """Движок персонализации: таблицы модуля + кэш готовых ответов.
+
+    Результаты неизменяемы и запоминаются по (стадия, контроль, сумма).
+    Суммы приходят из калькулятора уже округлёнными до тысяч,
+    поэтому различных ключей — считанные сотни.
+    """
+
+    def __init__(self, cache_size: Optional[int] = 4096):
+        self._recommendation = functools.lru_cache(maxsize=cache_size)(self._build_recommendation)
+        self.get_emotional_response = functools.lru_cache(maxsize=cache_size)(get_emotional_response)
+        self.generate_personalized_examples = functools.lru_cache(maxsize=cache_size)(generate_personalized_examples)
+        self.smart_format_money = functools.lru_cache(maxsize=cache_size)(smart_format_money)
         self.get_engagement_question = get_engagement_question
 
-ai_engine = AIEngine()
\ No newline at end of file
+    def get_personalized_recommendation(self, stage: str, control: str, area: str, fixation: str) -> Mapping[str, str]:
+        # Рекомендация зависит только от стадии и контроля
+        return self._recommendation(stage, control)
+
+    @staticmethod
+    def _build_recommendation(stage: str, control: str) -> Mapping[str, str]:
+        return get_personalized_recommendation(stage, control, "", "")
+
+    def cache_clear(self):
+        """Сбросить все кэши движка"""
+        for cached in (self._recommendation, self.get_emotional_response,
+                       self.generate_personalized_examples, self.smart_format_money):
+            cached.cache_clear()
+
+
+ai_engine = AIEngine()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш ответов AI-консультаций
+Ключ — нормализованный вопрос: токены без стоп-слов и окончаний,
+отсортированные, так что "Сколько стоит ремонт?" и "ремонт сколько
+стоит" дают один ответ. Вытеснение LRU + TTL, счётчики попаданий
+и необязательное сохранение на диск между перезапусками
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from knowledge import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+def question_key(question: str) -> str:
+    """Нормализованная форма вопроса для ключа кэша"""
+    return " ".join(sorted(set(tokenize(question))))
+
+
+class AnswerCache:
+    """LRU-кэш ответов с временем жизни записи.
+
+    Время жизни считается по часам системы, чтобы записи, сохранённые
+    на диск, корректно устаревали и после перезапуска. generation —
+    версия источника, на котором построены ответы (хэш базы знаний):
+    сохранённые при другой версии записи не загружаются.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 7 * 24 * 3600,
+                 path: Optional[str] = None, save_interval: float = 60.0, generation: str = ""):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.generation = generation
+        self.save_interval = save_interval
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()  # ключ -> (ответ, истекает)
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._saver: Optional[asyncio.Task] = None
+        # Запись файла, которая сейчас идёт в потоке
+        self._pending: Optional[asyncio.Future] = None
+        if path:
+            self.load()
+
+    # ---------- доступ ----------
+    def get(self, question: str) -> Optional[str]:
+        key = question_key(question)
+        entry = self._entries.get(key) if key else None
+        if entry is None or entry[1] <= time.time():
+            if entry is not None:
+                del self._entries[key]
+                self._dirty = True
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, question: str, answer: str) -> None:
+        key = question_key(question)
+        if not key:
+            return
+        self._entries[key] = (answer, time.time() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._dirty = True
+
+    def reset(self, generation: str) -> None:
+        """Источник ответов сменился: старые ответы больше не годятся"""
+        if generation != self.generation:
+            self.generation = generation
+            self.clear()
+            logger.info("🧹 Кэш ответов сброшен: обновилась база знаний")
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
+
+    # ---------- диск ----------
+    def load(self) -> None:
+        """Прочитать сохранённые записи, пропуская устаревшие"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Кэш ответов не прочитан ({self.path}): {e}")
+            return
+        if saved.get("generation", "") != self.generation:
+            logger.info("📦 Кэш ответов построен на другой версии базы знаний — не загружается")
+            return
+        now = time.time()
+        for key, answer, expires in saved.get("entries", []):
+            if expires > now:
+                self._entries[key] = (answer, expires)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        logger.info(f"📦 Кэш ответов: загружено {len(self._entries)} записей")
+
+    def save(self) -> None:
+        """Записать кэш на диск атомарно (в порядке LRU, старые первыми)"""
+        if self.path:
+            self._write(self._snapshot())
+
+    def _snapshot(self) -> dict:
+        self._dirty = False
+        return {"generation": self.generation,
+                "entries": [[key, answer, expires] for key, (answer, expires) in self._entries.items()]}
+
+    def _write(self, snapshot: dict) -> None:
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self._dirty = True
+            logger.error(f"Ошибка сохранения кэша ответов: {e}")
+
+    async def start(self) -> None:
+        """Периодически сохранять изменившийся кэш"""
+        if self.path and self._saver is None:
+            self._saver = asyncio.create_task(self._save_loop())
+
+    async def close(self) -> None:
+        if self._saver is not None:
+            self._saver.cancel()
+            self._saver = None
+        # Фоновая запись в потоке отменой не прерывается: дождаться её, иначе
+        # последнее сохранение пишет тот же .tmp одновременно с ней
+        if self._pending is not None:
+            await self._pending
+            self._pending = None
+        if self._dirty:
+            self.save()
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            if self._dirty:
+                # Снимок берём в цикле событий, а пишем файл в потоке
+                self._pending = asyncio.get_running_loop().run_in_executor(None, self._write, self._snapshot())
+                await asyncio.shield(self._pending)
+                self._pending = None
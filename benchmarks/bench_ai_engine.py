@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк AIEngine: стоимость одного вызова без кэша и с кэшем
+Для сравнения со старой версией передайте путь к её ai_logic.py:
+
+    git show <коммит>:ai_logic.py > /tmp/ai_logic_old.py
+    python benchmarks/bench_ai_engine.py /tmp/ai_logic_old.py
+"""
+
+import importlib.util
+import os
+import sys
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import ai_logic
+
+NUMBER = 100_000
+STAGE, CONTROL, AREA, FIXATION, AMOUNT = "rough", "self", "large", "none", 231000
+
+CALLS = {
+    "get_personalized_recommendation": lambda m: m.get_personalized_recommendation(STAGE, CONTROL, AREA, FIXATION),
+    "generate_personalized_examples": lambda m: m.generate_personalized_examples(STAGE, CONTROL, AMOUNT),
+    "get_emotional_response": lambda m: m.get_emotional_response(AMOUNT),
+    "smart_format_money": lambda m: m.smart_format_money(AMOUNT, "emotional"),
+    "get_engagement_question": lambda m: m.get_engagement_question(STAGE),
+}
+
+
+def per_call(fn) -> float:
+    """Лучшее из пяти повторов, наносекунды на вызов"""
+    return min(timeit.repeat(fn, number=NUMBER, repeat=5)) / NUMBER * 1e9
+
+
+def load_legacy(path: str):
+    spec = importlib.util.spec_from_file_location("ai_logic_legacy", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def main():
+    legacy = load_legacy(sys.argv[1]) if len(sys.argv) > 1 else None
+    engine = ai_logic.ai_engine
+
+    header = f"{'функция':34} {'старая':>10} {'без кэша':>10} {'с кэшем':>10}"
+    print(header)
+    print("-" * len(header))
+    for name, call in CALLS.items():
+        before = f"{per_call(lambda: call(legacy.ai_engine)):8.0f}нс" if legacy else f"{'—':>10}"
+        uncached = per_call(lambda: call(ai_logic))
+        cached = per_call(lambda: call(engine))
+        print(f"{name:34} {before:>10} {uncached:8.0f}нс {cached:8.0f}нс")
+
+
+if __name__ == "__main__":
+    main()
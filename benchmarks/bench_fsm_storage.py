@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк FSM-хранилищ: SQLiteFSMStorage против MemoryStorage
+Сценарий повторяет диагностику: set_state + update_data + get_data на каждый ответ
+
+Запуск: python benchmarks/bench_fsm_storage.py [пользователей] [шагов]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from fsm_storage import SQLiteFSMStorage
+
+STEPS = ["stage", "area", "control", "fixation", "calculating", "results", "offer"]
+
+
+async def run_funnel(storage, users: int, steps: int) -> float:
+    keys = [StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in range(users)]
+    started = time.perf_counter()
+    for step in range(steps):
+        name = STEPS[step % len(STEPS)]
+        for key in keys:
+            await storage.set_state(key, f"RepairStates:{name}")
+            await storage.update_data(key, {name: "code", f"{name}_text": "Текст ответа пользователя"})
+            await storage.get_data(key)
+            await storage.get_state(key)
+    return time.perf_counter() - started
+
+
+async def main(users: int, steps: int):
+    ops = users * steps * 4
+    print(f"👥 Пользователей: {users}, шагов: {steps}, операций: {ops}")
+
+    memory = MemoryStorage()
+    elapsed = await run_funnel(memory, users, steps)
+    print(f"MemoryStorage:     {elapsed:.3f} с  ({ops / elapsed:,.0f} оп/с)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "fsm.db")
+        sqlite_storage = SQLiteFSMStorage(path)
+        elapsed = await run_funnel(sqlite_storage, users, steps)
+        print(f"SQLiteFSMStorage:  {elapsed:.3f} с  ({ops / elapsed:,.0f} оп/с), холодный кэш")
+        elapsed = await run_funnel(sqlite_storage, users, steps)
+        print(f"SQLiteFSMStorage:  {elapsed:.3f} с  ({ops / elapsed:,.0f} оп/с), тёплый кэш")
+
+        started = time.perf_counter()
+        await sqlite_storage.close()
+        print(f"Финальный сброс и закрытие: {time.perf_counter() - started:.3f} с")
+
+        # Состояние переживает "перезапуск"
+        reopened = SQLiteFSMStorage(path)
+        key = StorageKey(bot_id=1, chat_id=0, user_id=0)
+        print(f"После перезапуска: state={await reopened.get_state(key)!r}, "
+              f"ключей в data={len(await reopened.get_data(key))}")
+        await reopened.close()
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    steps = int(sys.argv[2]) if len(sys.argv) > 2 else 7
+    asyncio.run(main(users, steps))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк холодного старта базы знаний: разбор JSON против снимка
+База размножается до нужного числа ответов, затем сравнивается время
+загрузки индекса и проверяется, что поиск по снимку отвечает так же,
+а каждый вопрос исходной базы находит свой ответ
+
+Запуск: python benchmarks/bench_kb_snapshot.py [ответов]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from knowledge import (MIN_SCORE, KnowledgeIndex, compile_snapshot, load_snapshot, source_digest,
+                       unresolved_questions)
+
+
+def scaled_kb(answers: int) -> dict:
+    """Исходная база, размноженная до answers ответов с уникальными словами"""
+    with open(os.path.join(ROOT_DIR, "knowledge_base.json"), "r", encoding="utf-8") as f:
+        data = json.load(f)
+    base = list(data["categories"].items())
+    categories = {}
+    copy = 0
+    while sum(len(c["answers"]) for c in categories.values()) < answers:
+        for name, content in base:
+            categories[f"{name}_{copy}"] = {
+                "questions": [f"{q} вариант{copy}" for q in content["questions"]],
+                "answers": [f"{a} Пример номер{copy} объект{copy % 97}" for a in content["answers"]],
+            }
+        copy += 1
+    data["categories"] = categories
+    return data
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(answers: int):
+    with open(os.path.join(ROOT_DIR, "knowledge_base.json"), "r", encoding="utf-8") as f:
+        original = json.load(f)
+    unresolved = unresolved_questions(original, KnowledgeIndex.from_data(original), MIN_SCORE)
+    assert not unresolved, f"Вопросы без своего ответа: {unresolved}"
+    print(f"✅ Все вопросы базы находят свой ответ (порог {MIN_SCORE})")
+
+    data = scaled_kb(answers)
+    curated = [q for c in list(data["categories"].values())[:20] for q in c["questions"]]
+    # Вопросы базы находятся по ключу; лишнее слово уводит их в ранжирование BM25
+    free = [f"{q} подскажи" for q in curated]
+    questions = curated + free
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "kb.json")
+        snapshot_path = os.path.join(tmp, "kb.kbs")
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+
+        started = time.perf_counter()
+        index = compile_snapshot(json_path, snapshot_path)
+        compile_time = time.perf_counter() - started
+        print(f"📚 Ответов: {len(index.docs)}, терминов: {len(index.terms)}, "
+              f"снимок: {os.path.getsize(snapshot_path) / 1024:.0f} КБ, сборка {compile_time:.2f} с")
+
+        from_json = best_of(lambda: KnowledgeIndex.from_file(json_path))
+        from_snapshot = best_of(lambda: load_snapshot(snapshot_path, source_digest(json_path)))
+        print(f"Старт из JSON:   {from_json * 1000:8.1f} мс")
+        print(f"Старт из снимка: {from_snapshot * 1000:8.1f} мс  (×{from_json / from_snapshot:.0f})")
+
+        snapshot = load_snapshot(snapshot_path, source_digest(json_path))
+        for question in questions:
+            assert snapshot.search(question) == index.search(question), f"Расхождение: {question}"
+        print(f"✅ Ответы совпадают на {len(questions)} вопросах")
+        for label, batch in (("вопросы базы", curated), ("свободный текст", free)):
+            started = time.perf_counter()
+            for question in batch:
+                snapshot.search(question)
+            per_query = (time.perf_counter() - started) / len(batch)
+            print(f"Поиск по снимку, {label}: {per_query * 1e6:.0f} мкс")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк журнала заявок: запись миллионов строк и потоковая выгрузка
+Запись идёт через LeadJournal.record (буфер + пакетный fsync), заявки
+раскладываются по дням; выгрузка за часть периода читает только нужные
+файлы. Пиковый RSS показывает, что выгрузка не грузит журнал в память
+
+Запуск: python benchmarks/bench_leads.py [--rows 1000000] [--days 30]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import leads as leads_module
+from leads import LeadExportFile, LeadJournal
+
+# Первый день синтетического журнала
+FIRST_DAY = date(2026, 1, 1)
+# Заявок в одной пачке записи
+BATCH = 10000
+
+
+def rss_mb() -> float:
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class _Clock:
+    """Подменяет datetime в leads.py: заявки ложатся на разные дни"""
+
+    current = datetime.combine(FIRST_DAY, datetime.min.time())
+
+    @classmethod
+    def now(cls):
+        return cls.current
+
+
+async def write(journal: LeadJournal, rows: int, days: int) -> float:
+    per_day = max(1, rows // days)
+    started = time.perf_counter()
+    with mock.patch.object(leads_module, "datetime", _Clock):
+        for index in range(rows):
+            _Clock.current = datetime.combine(FIRST_DAY + timedelta(days=index // per_day), datetime.min.time())
+            if index % 2:
+                journal.record("phone", user_id=100000 + index, username=f"user{index}",
+                               name="Иван Петров", phone="+7 999 123 45 67")
+            else:
+                journal.record("question", user_id=100000 + index, username=None,
+                               name="Мария", question="Сколько стоит ремонт ванной под ключ?")
+            if index % BATCH == BATCH - 1:
+                # В боте пачку набирают обработчики за flush_interval; здесь — цикл без пауз
+                await journal.flush()
+        await journal.flush()
+    return time.perf_counter() - started
+
+
+async def export(journal: LeadJournal, fmt: str, date_from=None, date_to=None):
+    files = await journal.files(date_from, date_to)
+    document = LeadExportFile([path for path, _ in files], fmt)
+    started = time.perf_counter()
+    size = 0
+    async for chunk in document.read(None):
+        size += len(chunk)
+    return time.perf_counter() - started, size, len(files)
+
+
+async def run(args, directory: str):
+    journal = LeadJournal(directory)
+    await journal.start()
+    elapsed = await write(journal, args.rows, args.days)
+    stats = journal.stats()
+    print(f"✍️ Запись: {args.rows} заявок за {elapsed:.2f} с → {args.rows / elapsed:,.0f} заявок/с, "
+          f"пачек с fsync: {stats['batches']}")
+    print(f"💾 RSS после записи: {rss_mb():.1f} МБ")
+
+    week_from = FIRST_DAY + timedelta(days=args.days // 2)
+    week_to = week_from + timedelta(days=6)
+    for fmt in ("jsonl", "csv"):
+        for label, bounds in (("весь журнал", (None, None)), ("неделя", (week_from, week_to))):
+            elapsed, size, files = await export(journal, fmt, *bounds)
+            print(f"📤 {fmt:<5} {label:<11} файлов {files:>3}, {size / 1024 / 1024:8.1f} МБ "
+                  f"за {elapsed:.2f} с → {size / 1024 / 1024 / elapsed:,.0f} МБ/с")
+    print(f"💾 Пиковый RSS: {rss_mb():.1f} МБ")
+    await journal.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(args, directory))
+
+
+if __name__ == "__main__":
+    main()
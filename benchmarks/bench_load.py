@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный прогон бота: тысячи синтетических пользователей через настоящий dp
+Каждый пользователь жмёт кнопки из последней клавиатуры бота, поэтому
+проходит все ветви воронки: стадии ремонта, кнопку "назад", меню
+предложений, ввод телефона, вопросы эксперту и AI. Telegram заменён
+сессией, которая записывает вызовы и отвечает сразу (или с заданной
+задержкой); паузы планировщика выключены.
+Токен не нужен — подставляется фиктивный, сеть не используется
+
+Запуск: python benchmarks/bench_load.py [--users 2000] [--concurrency 200] [--latency 0] [--storage sqlite]
+Код выхода 1, если хоть один обработчик упал (для CI)
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage
+from aiogram.types import Message, Update
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from simulated_users import MAX_STEPS, ChatView, SimulatedUser, Step, update_payload
+
+def rss_mb() -> float:
+    """Пиковый RSS процесса, МБ (ru_maxrss в Linux — КБ, в macOS — байты)"""
+    if resource is None:
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values: List[float], share: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))] if values else 0.0
+
+
+def configure_environment(storage: str, workdir: str) -> None:
+    """Окружение до импорта bot2: фиктивный токен, без сети, без пауз и лишних логов.
+
+    Значения ставятся явно, а не setdefault: load_dotenv не перезаписывает
+    окружение, поэтому настоящий токен и ключи LLM из .env не подхватятся.
+    """
+    os.environ.update({
+        "REPAIR_BOT_TOKEN": "123456:LOAD-TEST",
+        "REPAIR_LLM_API_KEY": "", "OPENAI_API_KEY": "", "REPAIR_LLM_BASE_URL": "",
+        "TELEGRAM_API_URL": "",
+        "REPAIR_PACING_SCALE": "0",
+        "REPAIR_METRICS_PORT": "0",
+        "REPAIR_LOG_PATH": "", "REPAIR_LOG_LEVEL": "WARNING",
+        "REPAIR_ANSWER_CACHE_PATH": "",
+        "REPAIR_KB_RELOAD_INTERVAL": "0",
+        "REPAIR_STORAGE": storage, "REPAIR_FSM_STORAGE": storage,
+        "REPAIR_DB_URL": f"sqlite:///{os.path.join(workdir, 'repair_bot.db')}",
+        "REPAIR_FSM_PATH": os.path.join(workdir, "fsm.db"),
+        "REPAIR_LEADS_DIR": os.path.join(workdir, "leads"),
+    })
+
+
+async def run(args) -> int:
+    # bot2 читает окружение при импорте, поэтому импортируется только здесь
+    import bot2
+    from metrics import handler_name
+
+    latency = args.latency
+    calls: Counter = Counter()
+    views: Dict[int, ChatView] = defaultdict(ChatView)
+    message_ids = itertools.count(1)
+
+    class RecordingSession(BaseSession):
+        async def make_request(self, bot, method, timeout=None):
+            calls[method.__api_method__] += 1
+            if latency:
+                await asyncio.sleep(latency)
+            if isinstance(method, SendMessage):
+                views[method.chat_id].show(method.reply_markup)
+                return Message.model_validate({
+                    "message_id": next(message_ids), "date": 0, "text": method.text,
+                    "chat": {"id": method.chat_id, "type": "private"},
+                }, context={"bot": bot})
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    handler_times: Dict[str, List[float]] = defaultdict(list)
+    errors: Counter = Counter()
+
+    class Timing(BaseMiddleware):
+        """Внутренняя middleware последней в цепочке: время только самого обработчика"""
+
+        async def __call__(self, handler, event, data: Dict[str, Any]):
+            name = handler_name(data)
+            started = time.perf_counter()
+            try:
+                return await handler(event, data)
+            except Exception:
+                errors[name] += 1
+                raise
+            finally:
+                handler_times[name].append(time.perf_counter() - started)
+
+    app = bot2.create_app()
+    bot, dp = app.bot, app.dp
+    bot.session = RecordingSession()
+    dp.message.middleware(Timing())
+    dp.callback_query.middleware(Timing())
+    await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+
+    rng = random.Random(args.seed)
+    update_ids = itertools.count(1)
+    update_times: List[float] = []
+    failed_updates = 0
+
+    def make_update(user_id: int, step: Step) -> Update:
+        return Update.model_validate(update_payload(next(update_ids), user_id, step), context={"bot": bot})
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def simulate(user_id: int, user: SimulatedUser):
+        nonlocal failed_updates
+        async with semaphore:
+            step: Optional[Step] = ("text", "/start")
+            for _ in range(MAX_STEPS):
+                started = time.perf_counter()
+                try:
+                    await dp.feed_update(bot, make_update(user_id, step))
+                except Exception:
+                    failed_updates += 1
+                update_times.append(time.perf_counter() - started)
+                # Пользователь отвечает, когда увидел ответ бота целиком
+                await bot2.pacer.drain_chat(user_id)
+                step = user.next_step(views[user_id])
+                if step is None:
+                    break
+                if args.think:
+                    await asyncio.sleep(rng.uniform(0, 2 * args.think))
+
+    rss_before = rss_mb()
+    started = time.perf_counter()
+    users = [SimulatedUser(random.Random(rng.random())) for _ in range(args.users)]
+    await asyncio.gather(*(simulate(100000 + index, user) for index, user in enumerate(users)))
+    handled = time.perf_counter() - started
+    await bot2.pacer.drain()
+    elapsed = time.perf_counter() - started
+    await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+
+    total_updates = len(update_times)
+    print(f"\n👥 Пользователей: {args.users}, одновременно: {args.concurrency}, "
+          f"хранилище: {args.storage}, задержка API: {latency * 1000:.0f} мс")
+    print(f"📨 Апдейтов: {total_updates} за {elapsed:.2f} с → {total_updates / elapsed:.0f} апд/с "
+          f"(обработка {handled:.2f} с, дописывание очередей {elapsed - handled:.2f} с)")
+    print(f"⏱️ Апдейт целиком: p50 {percentile(update_times, 0.5) * 1000:.2f} мс, "
+          f"p99 {percentile(update_times, 0.99) * 1000:.2f} мс")
+    print(f"📤 Запросов к Bot API: {sum(calls.values())} — " + ", ".join(f"{k} {v}" for k, v in calls.most_common()))
+    print(f"💾 Пиковый RSS: {rss_mb():.1f} МБ (до прогона {rss_before:.1f} МБ)")
+    print(f"\n{'обработчик':<28}{'вызовов':>9}{'p50, мс':>10}{'p99, мс':>10}{'среднее, мс':>13}{'ошибок':>8}")
+    for name, times in sorted(handler_times.items(), key=lambda item: -len(item[1])):
+        print(f"{name:<28}{len(times):>9}{percentile(times, 0.5) * 1000:>10.2f}"
+              f"{percentile(times, 0.99) * 1000:>10.2f}{statistics.mean(times) * 1000:>13.2f}{errors[name]:>8}")
+
+    if errors or failed_updates:
+        print(f"\n❌ Ошибок обработчиков: {sum(errors.values())}, упавших апдейтов: {failed_updates}")
+        return 1
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200, help="сколько пользователей идут одновременно")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--think", type=float, default=0.0, help="средняя пауза пользователя между шагами, с")
+    parser.add_argument("--storage", choices=("sqlite", "memory"), default="sqlite")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(args.storage, workdir)
+        return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк логирования: сколько стоит вызов logger.info для обработчика
+Старая схема — FileHandler в потоке цикла событий; новая — очередь и
+поток записи (logpipe). "Медленный диск" имитирует редкие задержки
+записи (fsync, сетевой том), которые раньше останавливали весь бот
+
+Запуск: python benchmarks/bench_logging.py [вызовов]
+"""
+
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import logpipe
+from logpipe import CompressingRotatingFileHandler, setup_logging
+
+# Каждая сотая запись на "медленном диске" пишется 20 мс
+SLOW_EVERY = 100
+SLOW_DELAY = 0.02
+
+
+def slow_disk(handler_class):
+    class SlowHandler(handler_class):
+        written = 0
+
+        def emit(self, record):
+            SlowHandler.written += 1
+            if SlowHandler.written % SLOW_EVERY == 0:
+                time.sleep(SLOW_DELAY)
+            super().emit(record)
+    return SlowHandler
+
+
+def measure(calls: int):
+    log = logging.getLogger("bench")
+    timings = []
+    for i in range(calls):
+        started = time.perf_counter()
+        log.info(f"Пользователь {i} выбрал этап", extra={"user_id": i})
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return statistics.mean(timings) * 1e6, timings[int(len(timings) * 0.99)] * 1e6, sum(timings)
+
+
+def sync_file(path: str, slow: bool):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    handler_class = slow_disk(logging.FileHandler) if slow else logging.FileHandler
+    handler = handler_class(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter(logpipe.CONSOLE_FORMAT))
+    root.addHandler(handler)
+    root.setLevel(logging.INFO)
+
+
+def queued(path: str, slow: bool):
+    original = logpipe.CompressingRotatingFileHandler
+    if slow:
+        logpipe.CompressingRotatingFileHandler = slow_disk(CompressingRotatingFileHandler)
+    try:
+        return setup_logging(path, console=False)
+    finally:
+        logpipe.CompressingRotatingFileHandler = original
+
+
+def main(calls: int):
+    print(f"Вызовов logger.info: {calls}; медленный диск: {SLOW_DELAY * 1000:.0f} мс на каждую {SLOW_EVERY}-ю запись")
+    print(f"{'схема':<28}{'среднее, мкс':>14}{'p99, мкс':>12}{'всего в цикле, мс':>20}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for slow in (False, True):
+            for name, configure in (("FileHandler (было)", sync_file), ("очередь + поток (logpipe)", queued)):
+                listener = configure(os.path.join(tmp, f"{configure.__name__}-{slow}.log"), slow)
+                mean, p99, total = measure(calls)
+                label = f"{name}{' *' if slow else ''}"
+                print(f"{label:<28}{mean:>14.1f}{p99:>12.1f}{total * 1000:>20.1f}")
+                for handler in logging.getLogger().handlers:
+                    handler.close()
+    print("* — медленный диск")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк пакетного расчёта потерь на numpy
+Сверяет calculate_loss_batch с построчным calculate_intelligent_loss
+и сравнивает скорость на большом наборе случайных ответов
+
+Запуск: python benchmarks/bench_loss_batch.py [строк]
+"""
+
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import numpy as np
+
+from calculator import IntelligentLossCalculator as Calc
+
+
+def random_answers(rows: int):
+    rng = random.Random(42)
+    # Немного неизвестных кодов — проверяем значения по умолчанию
+    stages = list(Calc.STAGE_BASE_LOSSES) + ["???"]
+    areas = list(Calc.AREA_MULTIPLIERS) + ["???"]
+    controls = list(Calc.CONTROL_MULTIPLIERS) + ["???"]
+    fixations = list(Calc.FIXATION_MULTIPLIERS) + ["???"]
+    return (
+        np.array([rng.choice(stages) for _ in range(rows)]),
+        np.array([rng.choice(areas) for _ in range(rows)]),
+        np.array([rng.choice(controls) for _ in range(rows)]),
+        np.array([rng.choice(fixations) for _ in range(rows)]),
+    )
+
+
+def main(rows: int):
+    columns = random_answers(rows)
+
+    started = time.perf_counter()
+    scalar = {"min": [], "avg": [], "max": []}
+    for stage, area, control, fixation in zip(*(column.tolist() for column in columns)):
+        result = Calc.calculate_intelligent_loss(stage, area, control, fixation)
+        for name in scalar:
+            scalar[name].append(result[name])
+    scalar_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = Calc.calculate_loss_batch(*columns)
+    batch_time = time.perf_counter() - started
+
+    for name in scalar:
+        assert np.array_equal(batch[name], np.array(scalar[name])), f"Расхождение в колонке {name}"
+    print(f"✅ Пакетный расчёт совпадает с построчным: {rows:,} строк")
+    print(f"Построчно: {scalar_time:.3f} с  ({rows / scalar_time:,.0f} строк/с)")
+    print(f"numpy:     {batch_time:.3f} с  ({rows / batch_time:,.0f} строк/с)")
+    print(f"Ускорение: ×{scalar_time / batch_time:.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300_000)
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Проверка и микробенчмарк предрасчитанной таблицы потерь
+Сверяет каждую запись LOSS_TABLE с прямым расчётом compute_loss
+и сравнивает стоимость вызова: расчёт против поиска в таблице
+
+Запуск: python benchmarks/bench_loss_table.py
+"""
+
+import os
+import sys
+import timeit
+from itertools import product
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from calculator import IntelligentLossCalculator as Calc
+
+
+def thaw(result) -> dict:
+    """Обычный dict из замороженного результата — для сравнения с эталоном"""
+    plain = dict(result)
+    plain["examples"] = list(result["examples"])
+    plain["multipliers"] = dict(result["multipliers"])
+    return plain
+
+
+def check_equality() -> int:
+    keys = list(product(Calc.STAGE_BASE_LOSSES, Calc.AREA_MULTIPLIERS,
+                        Calc.CONTROL_MULTIPLIERS, Calc.FIXATION_MULTIPLIERS))
+    # Неизвестные коды идут мимо таблицы, но должны давать тот же ответ
+    keys += [("???", "small", "self", "none"), ("rough", "???", "???", "???")]
+    for key in keys:
+        expected = Calc.compute_loss(*key)
+        actual = thaw(Calc.calculate_intelligent_loss(*key))
+        assert actual == expected, f"Расхождение для {key}: {actual} != {expected}"
+    return len(keys)
+
+
+def main():
+    checked = check_equality()
+    print(f"✅ Таблица совпадает с прямым расчётом: {checked} сочетаний")
+
+    args = ("rough", "large", "nobody", "none")
+    number = 200_000
+    direct = min(timeit.repeat(lambda: Calc.compute_loss(*args), number=number, repeat=5))
+    lookup = min(timeit.repeat(lambda: Calc.calculate_intelligent_loss(*args), number=number, repeat=5))
+    print(f"compute_loss:               {direct / number * 1e9:8.0f} нс/вызов")
+    print(f"calculate_intelligent_loss: {lookup / number * 1e9:8.0f} нс/вызов")
+    print(f"Ускорение: ×{direct / lookup:.1f}")
+
+
+if __name__ == "__main__":
+    main()
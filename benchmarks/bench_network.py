@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Сквозной прогон по HTTP: бот в отдельном процессе против заглушки Bot API
+В отличие от bench_load.py, здесь работает настоящая сессия aiogram:
+сериализация запросов, пул соединений, long polling или вебхук, флуд-контроль
+и его повторы после 429. Сеть не нужна — всё на 127.0.0.1
+
+Запуск: python benchmarks/bench_network.py [--mode polling|webhook|both] [--users 200]
+        [--latency 0.05] [--flood-rate 0.01] [--limits] [--workers 1]
+"""
+
+import argparse
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+
+from aiohttp import web
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from telegram_stub import FakeTelegram
+
+STUB_PORT = 8181
+BOT_PORT = 8182
+
+
+def bot_environment(args, mode: str, workdir: str) -> dict:
+    """Окружение процесса бота: только заглушка, фиктивный токен, без LLM и файловых логов"""
+    env = dict(os.environ)
+    env.update({
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{STUB_PORT}",
+        "REPAIR_BOT_TOKEN": "123456:NETWORK-TEST",
+        "REPAIR_LLM_API_KEY": "", "OPENAI_API_KEY": "", "REPAIR_LLM_BASE_URL": "",
+        "REPAIR_PACING_SCALE": str(args.pacing_scale),
+        "REPAIR_METRICS_PORT": "0",
+        "REPAIR_LOG_PATH": "", "REPAIR_LOG_LEVEL": "WARNING",
+        "REPAIR_ANSWER_CACHE_PATH": "",
+        "REPAIR_KB_RELOAD_INTERVAL": "0",
+        "REPAIR_DB_URL": f"sqlite:///{os.path.join(workdir, 'repair_bot.db')}",
+        "REPAIR_FSM_PATH": os.path.join(workdir, "fsm.db"),
+        "REPAIR_LEADS_DIR": os.path.join(workdir, "leads"),
+        "REPAIR_MODE": mode,
+        "REPAIR_WEBHOOK_URL": f"http://127.0.0.1:{BOT_PORT}",
+        "REPAIR_WEBHOOK_HOST": "127.0.0.1",
+        "PORT": str(BOT_PORT),
+        "REPAIR_WORKERS": str(args.workers),
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+async def run(args, mode: str) -> dict:
+    fake = FakeTelegram(latency=args.latency, jitter=args.latency / 2, flood_rate=args.flood_rate,
+                        limits=args.limits, users=args.users, concurrency=args.concurrency, think=args.think)
+    runner = web.AppRunner(fake.build_app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host="127.0.0.1", port=STUB_PORT).start()
+    with tempfile.TemporaryDirectory() as workdir:
+        bot = subprocess.Popen([sys.executable, "bot2.py"], cwd=ROOT_DIR, env=bot_environment(args, mode, workdir),
+                               stdout=subprocess.DEVNULL)
+        try:
+            await asyncio.wait_for(fake.done.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Прогон {mode} не уложился в {args.timeout} с")
+        finally:
+            bot.send_signal(signal.SIGINT)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, bot.wait, 30)
+            except subprocess.TimeoutExpired:
+                bot.kill()
+            await runner.cleanup()
+    return fake.stats()
+
+
+def report(mode: str, stats: dict) -> None:
+    print(f"\n🌐 Режим: {mode}")
+    print(f"👥 Пользователей: дошли {stats['users_finished']}, потеряны {stats['users_lost']}; "
+          f"за {stats['elapsed']} с")
+    print(f"📨 Апдейтов: {stats['updates_pushed']} ({stats['updates_per_second']} апд/с), "
+          f"доставлено {stats['updates_delivered']}, ошибок вебхука {stats['webhook_errors']}")
+    p50, p99 = stats["reply_p50"], stats["reply_p99"]
+    if p50 is not None:
+        print(f"⏱️ До первого ответа бота: p50 {p50 * 1000:.1f} мс, p99 {p99 * 1000:.1f} мс")
+    print(f"🚦 429: случайных {stats['flood_injected']}, по лимитам {stats['flood_limited']}")
+    print("📤 Запросы: " + ", ".join(f"{method} {count}" for method, count in
+                                     sorted(stats["requests"].items(), key=lambda item: -item[1])))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Сквозной прогон бота против заглушки Bot API")
+    parser.add_argument("--mode", choices=("polling", "webhook", "both"), default="both")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05, help="задержка ответа Bot API, с")
+    parser.add_argument("--flood-rate", type=float, default=0.0)
+    parser.add_argument("--limits", action="store_true", help="заглушка соблюдает лимиты Telegram")
+    parser.add_argument("--think", type=float, default=1.2)
+    parser.add_argument("--pacing-scale", type=float, default=0.1, help="множитель пауз бота")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    failed = False
+    for mode in (("polling", "webhook") if args.mode == "both" else (args.mode,)):
+        stats = asyncio.run(run(args, mode))
+        report(mode, stats)
+        failed = failed or stats["users_lost"] > 0 or stats["users_finished"] < args.users
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк многопроцессного режима: пропускная способность от числа воркеров
+Полная воронка диагностики (6 апдейтов на чат) прогоняется через настоящий
+dp бота в N процессах; Telegram заменён записывающей сессией, паузы
+выключены, так что измеряется именно CPU-работа обработчиков и отправок
+
+Запуск: python benchmarks/bench_sharding.py [чатов] [воркеры через запятую]
+Нужен .env с токеном (запросы в Telegram не уходят)
+"""
+
+import itertools
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from sharding import WorkerPool
+
+FUNNEL = [
+    "/start",
+    "👉 НАЧАТЬ ДИАГНОСТИКУ",
+    "Черновые работы (штукатурка, электрика)",
+    "50-80 м² (2-комнатная)",
+    "Никто толком не контролирует",
+    "Фотографировал(а) частично",
+]
+
+
+def fake_telegram(app):
+    """Вызывается в воркере: сессия без сети и планировщик без пауз"""
+    from aiogram.client.session.base import BaseSession
+    from aiogram.methods import SendMessage
+    from aiogram.types import Message
+
+    class RecordingSession(BaseSession):
+        def __init__(self):
+            super().__init__()
+            self.message_ids = itertools.count(1)
+
+        async def make_request(self, bot, method, timeout=None):
+            if isinstance(method, SendMessage):
+                return Message.model_validate({
+                    "message_id": next(self.message_ids), "date": 0, "text": method.text,
+                    "chat": {"id": method.chat_id, "type": "private"},
+                }, context={"bot": bot})
+            return True
+
+        async def stream_content(self, *args, **kwargs):
+            yield b""
+
+        async def close(self):
+            pass
+
+    app.bot.session = RecordingSession()
+    app.pacer.time_scale = 0
+    app.pacer.typing = False
+
+
+def funnel_updates(chats: int):
+    """Апдейты всех чатов по шагам воронки: порядок внутри чата сохраняется"""
+    update_ids = itertools.count(1)
+    for text in FUNNEL:
+        for chat_id in range(1, chats + 1):
+            yield {
+                "update_id": next(update_ids),
+                "message": {
+                    "message_id": next(update_ids), "date": 0, "text": text,
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+                },
+            }
+
+
+def run(workers: int, chats: int) -> float:
+    # bot2 читает окружение при импорте, поэтому импортируется после настройки в main();
+    # воркеры получают модуль через fork и собирают бота фабрикой
+    import bot2
+
+    pool = WorkerPool(bot2.create_app, workers=workers, setup=fake_telegram)
+    pool.start()
+    updates = list(funnel_updates(chats))
+    started = time.perf_counter()
+    for update in updates:
+        pool.route(update)
+    pool.stop()
+    elapsed = time.perf_counter() - started
+    print(f"Воркеров: {workers}  апдейтов: {len(updates)}  {elapsed:6.2f} с  "
+          f"{len(updates) / elapsed:8.0f} апд/с  (по воркерам: {pool.routed})")
+    return elapsed
+
+
+def main(chats: int, worker_counts):
+    print(f"🖥️ Ядер CPU: {os.cpu_count()}, чатов: {chats}")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ.update({
+            "REPAIR_FSM_PATH": os.path.join(tmp, "fsm.db"),
+            "REPAIR_DB_URL": f"sqlite:///{os.path.join(tmp, 'repair_bot.db')}",
+            "REPAIR_LEADS_DIR": os.path.join(tmp, "leads"),
+            "REPAIR_ANSWER_CACHE_PATH": "",
+            "REPAIR_KB_RELOAD_INTERVAL": "0",
+        })
+        baseline = None
+        for workers in worker_counts:
+            elapsed = run(workers, chats)
+            if baseline is None:
+                baseline = elapsed
+            else:
+                print(f"   ускорение относительно {worker_counts[0]}: ×{baseline / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    chats = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    counts = [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else [1, 2, 4]
+    main(chats, counts)
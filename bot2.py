@@ -11,21 +11,38 @@
 """
 
 import asyncio
+import functools
 import logging
 import os
 import sys
 import random
-from typing import Dict, Optional, List, Tuple
-from datetime import datetime
-from aiogram import Bot, Dispatcher, F
+from typing import Dict, NamedTuple, Optional, List, Tuple
+from datetime import date, datetime
+from aiogram import Bot, Dispatcher, F, Router
 from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
 from dotenv import load_dotenv
 from ai_logic import ai_engine
+from calculator import calculator
+from pacing import MessagePacer
+from webhook import derive_secret, run_webhook
+from markup_cache import CachedMarkupSession, frozen_markup
+from storage import RepairStorage, SQLRepairStorage
+from fsm_storage import SQLiteFSMStorage
+from knowledge import KnowledgeBase
+from llm import ANSWER_PARSE_MODE, LLMGateway, stream_to_chat
+from answer_cache import AnswerCache
+from flood import FloodControl
+from coalesce import CoalesceMiddleware
+from sharding import BotApp, WorkerPool, poll_updates, run_sharded, serve_webhook
+from logpipe import LogContextMiddleware, process_log_path, setup_logging
+from metrics import HandlerMetricsMiddleware, Metrics, TelegramMetricsMiddleware
+from leads import EXPORT_FORMATS, LeadExportFile, LeadJournal
 
 # ============ НАСТРОЙКА ПУТЕЙ ============
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -35,31 +52,32 @@ if CURRENT_DIR not in sys.path:
 print(f"📁 Текущая папка: {CURRENT_DIR}")
 
 # ============ ЛОГИРОВАНИЕ ============
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler("repair_bot_fixed_v2.log", encoding="utf-8")
-    ]
-)
+# .env читается до настройки логов: их параметры тоже могут лежать в нём
+env_path = os.path.join(CURRENT_DIR, ".env")
+load_dotenv(dotenv_path=env_path)
+
+# JSON-строки с ротацией по размеру и возрасту, архивы .gz; пустой путь — только консоль
+LOG_PATH = os.getenv("REPAIR_LOG_PATH", os.path.join(CURRENT_DIR, "logs", "repair_bot.jsonl")).strip()
+LOG_LEVEL = os.getenv("REPAIR_LOG_LEVEL", "INFO").strip()
+LOG_MAX_MB = float(os.getenv("REPAIR_LOG_MAX_MB", "10"))
+LOG_MAX_AGE_HOURS = float(os.getenv("REPAIR_LOG_MAX_AGE_HOURS", "24"))
+LOG_BACKUPS = int(os.getenv("REPAIR_LOG_BACKUPS", "14"))
+
+setup_logging(LOG_PATH, level=LOG_LEVEL, max_bytes=int(LOG_MAX_MB * 1024 * 1024),
+              backup_count=LOG_BACKUPS, max_age=LOG_MAX_AGE_HOURS * 3600)
 logger = logging.getLogger(__name__)
 
 # ============ КОНФИГ ============
-env_path = os.path.join(CURRENT_DIR, ".env")
+# Без .env настройки берутся из окружения процесса (CI, контейнер)
 if not os.path.exists(env_path):
-    logger.error(f"❌ Файл .env не найден: {env_path}")
-    print(f"❌ Создайте файл .env в папке: {CURRENT_DIR}")
-    sys.exit(1)
-
-load_dotenv(dotenv_path=env_path)
+    logger.warning(f"⚠️ Файл .env не найден: {env_path}, настройки берутся из окружения")
 
 REPAIR_TOKEN = os.getenv("REPAIR_BOT_TOKEN", "").strip()
 REPAIR_ADMIN = os.getenv("REPAIR_ADMIN_ID", "0").strip()
 
 if not REPAIR_TOKEN:
     logger.error("❌ REPAIR_BOT_TOKEN не установлен")
-    print("❌ Установите REPAIR_BOT_TOKEN в файле .env")
+    print(f"❌ Установите REPAIR_BOT_TOKEN в файле .env ({CURRENT_DIR}) или в окружении")
     sys.exit(1)
 
 try:
@@ -67,6 +85,73 @@ try:
 except ValueError:
     REPAIR_ADMIN = 0
 
+# Режим работы: polling (по умолчанию) или webhook
+REPAIR_MODE = os.getenv("REPAIR_MODE", "polling").strip().lower()
+# Публичный адрес для вебхука (на Railway берётся из RAILWAY_PUBLIC_DOMAIN)
+RAILWAY_DOMAIN = os.getenv("RAILWAY_PUBLIC_DOMAIN", "").strip()
+WEBHOOK_BASE_URL = os.getenv("REPAIR_WEBHOOK_URL", f"https://{RAILWAY_DOMAIN}" if RAILWAY_DOMAIN else "").strip()
+WEBHOOK_PATH = os.getenv("REPAIR_WEBHOOK_PATH", "/webhook").strip()
+WEBHOOK_SECRET = os.getenv("REPAIR_WEBHOOK_SECRET", "").strip() or derive_secret(REPAIR_TOKEN)
+WEBHOOK_HOST = os.getenv("REPAIR_WEBHOOK_HOST", "0.0.0.0").strip()
+WEBHOOK_PORT = int(os.getenv("PORT", "8080"))
+# Хранилище данных пользователей: sqlite (по умолчанию) или memory
+REPAIR_STORAGE = os.getenv("REPAIR_STORAGE", "sqlite").strip().lower()
+REPAIR_DB_URL = os.getenv("REPAIR_DB_URL", f"sqlite:///{os.path.join(CURRENT_DIR, 'repair_bot.db')}").strip()
+# FSM-состояния: sqlite (переживают перезапуск) или memory
+REPAIR_FSM_STORAGE = os.getenv("REPAIR_FSM_STORAGE", "sqlite").strip().lower()
+REPAIR_FSM_PATH = os.getenv("REPAIR_FSM_PATH", os.path.join(CURRENT_DIR, "fsm.db")).strip()
+
+# Анимация расчёта: edit — одно сообщение правится по шагам и становится результатом,
+# messages — каждый шаг отдельным сообщением
+PROGRESS_MODE = os.getenv("REPAIR_PROGRESS_MODE", "edit").strip().lower()
+
+# Число процессов-воркеров: больше 1 — апдейты распределяются по ним по пользователю
+REPAIR_WORKERS = int(os.getenv("REPAIR_WORKERS", "1"))
+
+# Метрики Prometheus на http://HOST:PORT/metrics (0 — выключить);
+# воркер N многопроцессного режима слушает PORT + 1 + N
+METRICS_HOST = os.getenv("REPAIR_METRICS_HOST", "127.0.0.1").strip()
+METRICS_PORT = int(os.getenv("REPAIR_METRICS_PORT", "9108"))
+
+# Множитель пауз между сообщениями: 1 — как задумано, 0 — без пауз (нагрузочные тесты)
+PACING_SCALE = float(os.getenv("REPAIR_PACING_SCALE", "1"))
+
+# Склейка ответов одного обработчика в меньшее число сообщений (1 — включить)
+COALESCE_REPLIES = os.getenv("REPAIR_COALESCE", "0").strip().lower() in ("1", "true", "yes", "on")
+
+# Сколько разных сочетаний ответов держать в кэше готовых результатов
+RESULTS_CACHE_SIZE = int(os.getenv("REPAIR_RESULTS_CACHE_SIZE", "2048"))
+
+# Альтернативный адрес Bot API (локальный сервер или тестовая заглушка)
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "").strip()
+
+# База знаний AI-консультанта и порог уверенности ответа (0..1, см. KnowledgeIndex.search)
+KNOWLEDGE_PATH = os.getenv("REPAIR_KB_PATH", os.path.join(CURRENT_DIR, "knowledge_base.json")).strip()
+# Скомпилированный снимок базы знаний (python knowledge.py); устаревший игнорируется
+KNOWLEDGE_SNAPSHOT = os.getenv("REPAIR_KB_SNAPSHOT", os.path.splitext(KNOWLEDGE_PATH)[0] + ".kbs").strip()
+KNOWLEDGE_MIN_SCORE = float(os.getenv("REPAIR_KB_MIN_SCORE", "0.6"))
+# Как часто проверять, не изменился ли файл базы знаний (0 — не проверять)
+KNOWLEDGE_RELOAD_INTERVAL = float(os.getenv("REPAIR_KB_RELOAD_INTERVAL", "5"))
+
+# LLM для AI-консультаций (OpenAI-совместимый API); без ключа и адреса — только база знаний
+LLM_API_KEY = os.getenv("REPAIR_LLM_API_KEY", os.getenv("OPENAI_API_KEY", "")).strip()
+LLM_BASE_URL = os.getenv("REPAIR_LLM_BASE_URL", "").strip()
+LLM_MODEL = os.getenv("REPAIR_LLM_MODEL", "gpt-4o-mini").strip()
+LLM_CONCURRENCY = int(os.getenv("REPAIR_LLM_CONCURRENCY", "8"))
+LLM_TIMEOUT = float(os.getenv("REPAIR_LLM_TIMEOUT", "30"))
+
+# Кэш ответов AI-консультаций по нормализованному вопросу ("" в пути — без сохранения на диск)
+ANSWER_CACHE_SIZE = int(os.getenv("REPAIR_ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL = float(os.getenv("REPAIR_ANSWER_CACHE_TTL", str(7 * 24 * 3600)))
+ANSWER_CACHE_PATH = os.getenv("REPAIR_ANSWER_CACHE_PATH", os.path.join(CURRENT_DIR, "answer_cache.json")).strip()
+
+# Журнал заявок (телефоны и вопросы эксперту): по файлу на день, выгрузка — /export у админа
+LEADS_DIR = os.getenv("REPAIR_LEADS_DIR", os.path.join(CURRENT_DIR, "leads")).strip()
+# Предел размера выгрузки: Bot API принимает документы до 50 МБ (локальный сервер — до 2000 МБ)
+EXPORT_MAX_MB = float(os.getenv("REPAIR_EXPORT_MAX_MB", "50"))
+# Загрузка большого документа идёт дольше обычного запроса
+EXPORT_TIMEOUT = 600
+
 # Контактные данные эксперта
 EXPERT_PHONE = "+79615223190"
 EXPERT_TELEGRAM = "@systemkontrolrem"
@@ -96,331 +181,20 @@ class RepairStates(StatesGroup):
     repair_changing_answer = State()  # новое состояние для изменения ответов
 
 # ============ ХРАНИЛИЩЕ ============
-class RepairStorage:
-    def __init__(self):
-        self.user_data: Dict[int, Dict] = {}
-    
-    async def save(self, user_id: int, data: dict):
-        if user_id not in self.user_data:
-            self.user_data[user_id] = {"history": []}
-        self.user_data[user_id].update(data)
-        if "answer" in data:
-            self.user_data[user_id]["history"].append({
-                "state": data.get("state"),
-                "answer": data.get("answer"),
-                "timestamp": datetime.now().isoformat()
-            })
-    
-    async def get(self, user_id: int) -> Optional[Dict]:
-        return self.user_data.get(user_id)
-    
-    async def get_history(self, user_id: int) -> List:
-        data = await self.get(user_id)
-        return data.get("history", []) if data else []
-    
-    async def clear_last_answer(self, user_id: int):
-        """Удалить последний ответ из истории"""
-        if user_id in self.user_data and self.user_data[user_id]["history"]:
-            self.user_data[user_id]["history"].pop()
-
-repair_db = RepairStorage()
-
-# ============ УМНЫЙ КАЛЬКУЛЯТОР С РЕАЛЬНЫМИ ЦИФРАМИ ============
-class IntelligentLossCalculator:
-    """Умный калькулятор потерь с логикой ответвлений"""
-    
-    # Базовые потери для разных стадий (в тыс руб)
-    STAGE_BASE_LOSSES = {
-        "not_started": {
-            "name": "Ещё не начали",
-            "base_range": (50, 300),  # в тыс ₽
-            "risk_factors": [
-                ("planning", 1.3, "Отсутствие детального плана"),
-                ("contract", 1.4, "Неправильный договор"),
-                ("specs", 1.2, "Нет технического задания"),
-                ("budget", 1.3, "Неполный бюджет"),
-            ],
-            "skip_fixation": True,  # пропустить вопрос о фиксации
-            "skip_control": False,  # НЕ пропускать вопрос о контроле
-            "examples": [
-                ("Переделки электрики", "80-150 тыс ₽", "После начала работ оказалось, что розетки не там"),
-                ("Доплаты за изменения", "30-80 тыс ₽", "Постоянные правки в процессе"),
-                ("Штрафы за просрочку", "20-50 тыс ₽", "Нет чётких сроков в договоре"),
-            ],
-            "emotional_hook": "💰 *Это деньги на новую кухню или диван*",
-        },
-        "demolition": {
-            "name": "Демонтаж",
-            "base_range": (30, 200),
-            "risk_factors": [
-                ("damage", 1.4, "Повреждение конструкций"),
-                ("documentation", 1.3, "Нет фотофиксации ДО"),
-                ("rubbish", 1.2, "Проблемы с вывозом мусора"),
-                ("neighbors", 1.5, "Конфликты с соседями"),
-            ],
-            "skip_fixation": False,
-            "skip_control": False,
-            "examples": [
-                ("Повреждён стояк", "100-200 тыс ₽", "Замена + компенсация соседям"),
-                ("Не вывезли мусор", "20-50 тыс ₽", "Штрафы + срочный вывоз"),
-                ("Сломали не то", "30-80 тыс ₽", "Восстановление + доплата"),
-            ],
-            "emotional_hook": "🏗️ *Эти деньги могли пойти на новые окна*",
-        },
-        "rough": {
-            "name": "Черновые работы",
-            "base_range": (80, 300),
-            "risk_factors": [
-                ("plaster", 1.5, "Кривая штукатурка"),
-                ("electric", 1.4, "Ошибки в электрике"),
-                ("plumbing", 1.6, "Проблемы с сантехникой"),
-                ("levels", 1.3, "Неровные полы/потолки"),
-            ],
-            "skip_fixation": False,
-            "skip_control": False,
-            "examples": [
-                ("Кривые стены", "80-250 тыс ₽", "Мебель не встаёт ровно"),
-                ("Электрика не работает", "50-200 тыс ₽", "Вскрытие штроб + переделка"),
-                ("Протечки сантехники", "60-180 тыс ₽", "Ремонт у соседей + свой ремонт"),
-            ],
-            "emotional_hook": "🔧 *Сумма, за которую можно сделать весь пол с подогревом*",
-        },
-        "finishing": {
-            "name": "Чистовая отделка",
-            "base_range": (60, 250),
-            "risk_factors": [
-                ("tiles", 1.4, "Плитка отваливается"),
-                ("paint", 1.3, "Кривая покраска"),
-                ("joints", 1.2, "Неровные стыки"),
-                ("materials", 1.4, "Не те материалы"),
-            ],
-            "skip_fixation": False,
-            "skip_control": False,
-            "examples": [
-                ("Отвалилась плитка", "50-200 тыс ₽", "Новый материал + работа"),
-                ("Неровная покраска", "60-120 тыс ₽", "Шлифовка + перекраска"),
-                ("Щели в стыках", "40-100 тыс ₽", "Демонтаж + переделка"),
-            ],
-            "emotional_hook": "🎨 *Этих денег хватило бы на дизайнерскую мебель*",
-        },
-        "living": {
-            "name": "Уже живём",
-            "base_range": (100, 500),
-            "risk_factors": [
-                ("hidden_defects", 1.6, "Скрытые дефекты"),
-                ("warranty", 1.8, "Гарантия закончилась"),
-                ("repairs", 1.4, "Дорогие переделки"),
-                ("stress", 1.3, "Стресс и нервы"),
-            ],
-            "skip_fixation": False,  # всё равно спрашиваем о фиксации (ретроспективно)
-            "skip_control": True,   # пропустить вопрос о контроле (уже поздно)
-            "examples": [
-                ("Протечка в ванной", "100-300 тыс ₽", "Ремонт соседей + свой ремонт"),
-                ("Электрика не работает", "50-150 тыс ₽", "Вскрытие стен + поиск проблемы"),
-                ("Отслоилась отделка", "80-200 тыс ₽", "Полный передел участка"),
-            ],
-            "emotional_hook": "🏠 *Сумма, которую ты мог вложить в следующую квартиру*",
-        }
-    }
-    
-    # Мультипликаторы для площади (база = 50-80 м²)
-    AREA_MULTIPLIERS = {
-        "small": 0.6,      # до 50 м²
-        "medium": 1.0,     # 50-80 м²
-        "large": 1.3,      # 80-120 м²
-        "xlarge": 1.7,     # 120+ м²
-        "unknown": 1.0,
-    }
-    
-    # Мультипликаторы для контроля
-    CONTROL_MULTIPLIERS = {
-        "self": 1.4,       # сам/сама
-        "foreman": 1.0,    # прораб
-        "nobody": 1.8,     # никто
-        "unknown": 1.5,    # не думал(а)
-        "skip": 1.0,       # если вопрос пропущен
-    }
-    
-    # Мультипликаторы для фиксации
-    FIXATION_MULTIPLIERS = {
-        "full": 0.9,           # полностью зафиксировано
-        "partial": 1.0,        # частично
-        "none": 1.3,           # никак
-        "planned_full": 1.0,   # планирую фиксировать всё
-        "planned_none": 1.4,   # не думал(а) об этом
-        "skip": 1.0,           # если вопрос пропущен
-    }
-    
-    @staticmethod
-    def get_stage_code(text: str) -> str:
-        mapping = {
-            "Ещё не начали (только планирую)": "not_started",
-            "Демонтаж (ломаем, убираем старое)": "demolition",
-            "Черновые работы (штукатурка, электрика)": "rough",
-            "Чистовая отделка (плитка, обои, покраска)": "finishing",
-            "Уже живём после ремонта": "living"
-        }
-        return mapping.get(text, "not_started")
-    
-    @staticmethod
-    def get_area_code(text: str) -> str:
-        mapping = {
-            "До 50 м² (студия/1-комнатная)": "small",
-            "50-80 м² (2-комнатная)": "medium",
-            "80-120 м² (3-комнатная)": "large",
-            "120+ м² (4+ комнат/дом)": "xlarge",
-            "Не знаю точно": "unknown"
-        }
-        return mapping.get(text, "unknown")
-    
-    @staticmethod
-    def get_control_code(text: str) -> str:
-        mapping = {
-            "Я сам/сама (но не специалист)": "self",
-            "Прораб/подрядчик (он отвечает за всё)": "foreman",
-            "Никто толком не контролирует": "nobody",
-            "Не думал(а) об этом": "unknown",
-            "Уже поздно (ремонт закончен)": "skip"
-        }
-        return mapping.get(text, "unknown")
-    
-    @staticmethod
-    def get_fixation_code(text: str, stage: str = "not_started") -> str:
-        if stage == "not_started":
-            mapping = {
-                "Планирую фиксировать всё фото/видео": "planned_full",
-                "Ещё не думал(а) об этом": "planned_none"
-            }
-        elif stage == "living":
-            mapping = {
-                "Были зафиксированы фото/видео": "full",
-                "Фотографировали частично": "partial",
-                "Ничего не фиксировали": "none",
-                "Не помню/не знаю": "planned_none"
-            }
-        else:
-            mapping = {
-                "Зафиксированы фото/видео полностью": "full",
-                "Фотографировал(а) частично": "partial",
-                "Никак не фиксировались, надеюсь на мастеров": "none"
-            }
-        return mapping.get(text, "planned_none")
-    
-    @classmethod
-    def should_skip_control(cls, stage: str) -> bool:
-        """Нужно ли пропускать вопрос о контроле для этой стадии"""
-        stage_data = cls.STAGE_BASE_LOSSES.get(stage)
-        return stage_data.get("skip_control", False) if stage_data else False
-    
-    @classmethod
-    def should_skip_fixation(cls, stage: str) -> bool:
-        """Нужно ли пропускать вопрос о фиксации для этой стадии"""
-        stage_data = cls.STAGE_BASE_LOSSES.get(stage)
-        return stage_data.get("skip_fixation", False) if stage_data else False
-    
-    @classmethod
-    def calculate_intelligent_loss(cls, stage: str, area: str, control: str, fixation: str) -> dict:
-        """Умный расчёт потерь с учётом всех факторов"""
-        stage_data = cls.STAGE_BASE_LOSSES.get(stage, cls.STAGE_BASE_LOSSES["not_started"])
-        
-        # Базовые значения
-        base_min, base_max = stage_data["base_range"]
-        base_avg = (base_min + base_max) / 2
-        
-        # Мультипликаторы
-        area_mult = cls.AREA_MULTIPLIERS.get(area, 1.0)
-        
-        # Если контроль пропущен (для стадии "living")
-        if control == "skip":
-            control_mult = cls.CONTROL_MULTIPLIERS["skip"]
-        else:
-            control_mult = cls.CONTROL_MULTIPLIERS.get(control, 1.0)
-        
-        # Если фиксация пропущена (для стадии "not_started")
-        if fixation == "skip":
-            fixation_mult = cls.FIXATION_MULTIPLIERS["skip"]
-        else:
-            fixation_mult = cls.FIXATION_MULTIPLIERS.get(fixation, 1.0)
-        
-        # Комбинированный мультипликатор
-        total_mult = area_mult * control_mult * fixation_mult
-        
-        # Итоговые потери (в тыс ₽)
-        loss_min = base_min * total_mult
-        loss_max = base_max * total_mult
-        loss_avg = base_avg * total_mult
-        
-        # Округление до тысяч
-        loss_min = round(loss_min) * 1000
-        loss_max = round(loss_max) * 1000
-        loss_avg = round(loss_avg) * 1000
-        
-        # Выбор персонализированных примеров
-        examples = stage_data["examples"]
-        if stage == "not_started" and control == "self":
-            examples = [
-                ("Самоконтроль без знаний", "80-200 тыс ₽", "Не заметил ошибок вовремя"),
-                ("Нет технической экспертизы", "50-150 тыс ₽", "Принял некачественную работу"),
-            ] + examples[:1]
-        
-        # Эмоциональный якорь
-        emotional_hook = stage_data["emotional_hook"]
-        
-        # Ключевая контрольная точка
-        checkpoints = {
-            "not_started": "📝 Детальное ТЗ + прописанный договор с ответственностью",
-            "demolition": "📸 Фотофиксация ДО/ПОСЛЕ + акт скрытых работ",
-            "rough": "📐 Лазерный уровень + проверка СНИПов + фото всех узлов",
-            "finishing": "🔍 Проверка стыков + тест на адгезию + поэтапная оплата",
-            "living": "⚖️ Гарантийные акты + тесты под нагрузкой + видеофиксация состояния"
-        }
-        checkpoint = checkpoints.get(stage, "Регулярный контроль всех этапов")
-        
-        return {
-            "min": loss_min,
-            "max": loss_max,
-            "avg": loss_avg,
-            "stage_name": stage_data["name"],
-            "examples": examples,
-            "emotional_hook": emotional_hook,
-            "checkpoint": checkpoint,
-            "multipliers": {
-                "area": area_mult,
-                "control": control_mult,
-                "fixation": fixation_mult,
-                "total": round(total_mult, 2)
-            }
-        }
-    
-    @staticmethod
-    def format_money(amount: float) -> str:
-        """Форматирование суммы денег"""
-        if amount >= 1000000:
-            return f"{amount/1000000:.1f} млн ₽"
-        elif amount >= 100000:
-            return f"{int(amount/1000)} тыс ₽"
-        elif amount >= 1000:
-            return f"{int(amount/1000)} тыс ₽"
-        else:
-            return f"{int(amount)} ₽"
-
-calculator = IntelligentLossCalculator()
-
-# ============ УМНЫЕ ПАУЗЫ ============
-async def smart_pause(seconds: float = 1.5):
-    """Умная пауза с обработкой ошибок"""
-    try:
-        await asyncio.sleep(seconds)
-    except (asyncio.CancelledError, Exception):
-        pass
+def record_lead(kind: str, message: Message, **fields):
+    """Заявка в журнал: кто оставил и что"""
+    user = message.from_user
+    leads.record(kind, user_id=user.id, username=user.username, name=user.full_name, **fields)
 
 # ============ КЛАВИАТУРЫ ============
+@frozen_markup
 def get_repair_kb_start() -> ReplyKeyboardMarkup:
     return ReplyKeyboardMarkup(
         keyboard=[[KeyboardButton(text="👉 НАЧАТЬ ДИАГНОСТИКУ")]],
         resize_keyboard=True
     )
 
+@frozen_markup
 def get_repair_kb_stage(show_back: bool = False) -> ReplyKeyboardMarkup:
     buttons = [
         [KeyboardButton(text="Ещё не начали (только планирую)")],
@@ -433,6 +207,7 @@ def get_repair_kb_stage(show_back: bool = False) -> ReplyKeyboardMarkup:
         buttons.append([KeyboardButton(text="◀️ Изменить предыдущий ответ")])
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True, one_time_keyboard=True)
 
+@frozen_markup
 def get_repair_kb_area(show_back: bool = False) -> ReplyKeyboardMarkup:
     buttons = [
         [KeyboardButton(text="До 50 м² (студия/1-комнатная)")],
@@ -445,6 +220,7 @@ def get_repair_kb_area(show_back: bool = False) -> ReplyKeyboardMarkup:
         buttons.append([KeyboardButton(text="◀️ Изменить предыдущий ответ")])
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True, one_time_keyboard=True)
 
+@frozen_markup
 def get_repair_kb_control(show_back: bool = False, for_living: bool = False) -> ReplyKeyboardMarkup:
     """Клавиатура для контроля (разные варианты для living)"""
     if for_living:
@@ -469,6 +245,13 @@ def get_repair_kb_control(show_back: bool = False, for_living: bool = False) ->
 
 def get_repair_kb_fixation(show_back: bool = False, stage: str = "not_started") -> ReplyKeyboardMarkup:
     """Клавиатура для фиксации с учётом стадии"""
+    # Для всех стадий, кроме not_started и living, клавиатура одна
+    if stage not in ("not_started", "living"):
+        stage = "other"
+    return _repair_kb_fixation(show_back, stage)
+
+@frozen_markup
+def _repair_kb_fixation(show_back: bool, stage: str) -> ReplyKeyboardMarkup:
     if stage == "not_started":
         buttons = [
             [KeyboardButton(text="Планирую фиксировать всё фото/видео")],
@@ -493,6 +276,7 @@ def get_repair_kb_fixation(show_back: bool = False, stage: str = "not_started")
     
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True, one_time_keyboard=True)
 
+@frozen_markup
 def get_repair_kb_results() -> ReplyKeyboardMarkup:
     buttons = [
         [KeyboardButton(text="👉 ПОКАЖИ РЕШЕНИЕ")],
@@ -500,6 +284,7 @@ def get_repair_kb_results() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
 
+@frozen_markup
 def get_repair_kb_offer() -> ReplyKeyboardMarkup:
     buttons = [
         [KeyboardButton(text="💳 Купить систему")],
@@ -509,6 +294,7 @@ def get_repair_kb_offer() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True)
 
+@frozen_markup
 def get_repair_kb_phone() -> ReplyKeyboardMarkup:
     buttons = [
         [KeyboardButton(text="📞 Отправить мой номер", request_contact=True)],
@@ -517,6 +303,7 @@ def get_repair_kb_phone() -> ReplyKeyboardMarkup:
     ]
     return ReplyKeyboardMarkup(keyboard=buttons, resize_keyboard=True, one_time_keyboard=True)
 
+@frozen_markup
 def get_inline_payment_kb() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton(text="💳 Купить систему за 4 900 ₽", url="https://t.me/systemkontrolrem")],
@@ -526,6 +313,7 @@ def get_inline_payment_kb() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+@frozen_markup
 def get_inline_expert_kb() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton(text="📞 Позвонить сейчас", url=f"tel:{EXPERT_PHONE}")],
@@ -534,6 +322,24 @@ def get_inline_expert_kb() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
+def prebuild_keyboards():
+    """Построить все варианты клавиатур заранее, до первого сообщения"""
+    get_repair_kb_start()
+    get_repair_kb_results()
+    get_repair_kb_offer()
+    get_repair_kb_phone()
+    get_inline_payment_kb()
+    get_inline_expert_kb()
+    for show_back in (False, True):
+        get_repair_kb_stage(show_back=show_back)
+        get_repair_kb_area(show_back=show_back)
+        for for_living in (False, True):
+            get_repair_kb_control(show_back=show_back, for_living=for_living)
+        for stage in ("not_started", "living", "other"):
+            get_repair_kb_fixation(show_back=show_back, stage=stage)
+
+prebuild_keyboards()
+
 # ============ ТЕКСТЫ С ВЕТВЛЕНИЯМИ ============
 REPAIR_TEXTS = {
     "start": """🏠 *ПРИВЕТ!*
@@ -717,59 +523,209 @@ ROI: *4 000%* (в 40 раз больше)
     "ai_consultation": """
 🤖 *AI-консультант по ремонту*
 
-У меня есть *умный AI-консультант*, который поможет:
-
-• Ответить на вопросы по ремонту 24/7
-• Проанализировать фото проблем
-• Подсказать решения на основе базы знаний
-• Помочь с выбором материалов
-
-*AI использует:*
-1. Мою базу знаний (15 лет опыта)
-2. Технические нормативы (СНИПы, ГОСТы)
-3. Практические кейсы
-4. Актуальные цены на материалы
+Задай вопрос — отвечу сразу по моей базе знаний (15 лет опыта):
 
-*Переходи к AI-консультанту:*
-👉 @repair_ai_bot
+• Планирование и порядок работ
+• Бюджет и смета
+• Подрядчики и контроль работ
+• Выбор материалов
+• Проблемы и их решение
 
-*P.S.* Это отдельный бот, начни с команды /start
+*Напиши свой вопрос одним сообщением* 👇
 """,
 }
 
 # ============ ИНИЦИАЛИЗАЦИЯ БОТА ============
-bot = Bot(token=REPAIR_TOKEN, default=DefaultBotProperties(parse_mode="Markdown"))
-dp = Dispatcher(storage=MemoryStorage())
+# Обработчики регистрируются на роутере при импорте, а бот, диспетчер и всё
+# их окружение создаёт create_app() — один раз на процесс. Обработчики берут
+# эти объекты из глобалов модуля
+router = Router()
+
+bot: Bot
+dp: Dispatcher
+pacer: MessagePacer
+metrics: Metrics
+repair_db: RepairStorage
+leads: LeadJournal
+knowledge: KnowledgeBase
+llm: Optional[LLMGateway]
+answer_cache: AnswerCache
+
+async def reset_answers_on_reload():
+    # Перезагрузка идёт в потоке проверки файла, а кэш живёт в цикле событий
+    loop = asyncio.get_running_loop()
+    knowledge.on_reload = lambda: loop.call_soon_threadsafe(answer_cache.reset, knowledge.digest)
+
+def create_app(worker_index: Optional[int] = None) -> BotApp:
+    """Создать бота, диспетчер, хранилища, кэши и метрики и опубликовать их в глобалы модуля.
+
+    Обычный режим вызывает её из __main__, многопроцессный — в каждом
+    воркере (фабрика для WorkerPool): модуль при этом не импортируется
+    заново, и его объекты не создаются дважды. worker_index — номер
+    воркера: метрики воркера N слушают METRICS_PORT + 1 + N.
+    """
+    global bot, dp, pacer, metrics, repair_db, leads, knowledge, llm, answer_cache
+    if worker_index is not None:
+        # Поток записи логов родителя в дочерний процесс не переходит
+        setup_logging(LOG_PATH, level=LOG_LEVEL, max_bytes=int(LOG_MAX_MB * 1024 * 1024),
+                      backup_count=LOG_BACKUPS, max_age=LOG_MAX_AGE_HOURS * 3600)
+    
+    # Сессия с кэшем JSON для неизменяемых клавиатур
+    session = CachedMarkupSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else CachedMarkupSession()
+    # Все исходящие запросы идут через бакеты флуд-лимитов и переживают 429
+    flood_control = FloodControl()
+    session.middleware(flood_control)
+    # Время запросов к Bot API по обработчикам (после флуд-контроля: без его ожиданий)
+    metrics = Metrics()
+    session.middleware(TelegramMetricsMiddleware(metrics))
+    bot = Bot(token=REPAIR_TOKEN, session=session, default=DefaultBotProperties(parse_mode="Markdown"))
+    if REPAIR_FSM_STORAGE == "memory":
+        fsm_storage = MemoryStorage()
+    else:
+        fsm_storage = SQLiteFSMStorage(REPAIR_FSM_PATH)
+    dp = Dispatcher(storage=fsm_storage)
+    dp.include_router(router)
+    
+    # Паузы между сообщениями выдерживает планировщик, а не обработчик
+    pacer = MessagePacer(bot, time_scale=PACING_SCALE)
+    pacer.on_pause = metrics.observe_pause
+    dp.shutdown.register(pacer.close)
+    
+    # Контекст апдейта (пользователь, состояние, обработчик) и время обработки в логах
+    log_context_middleware = LogContextMiddleware()
+    dp.message.middleware(log_context_middleware)
+    dp.callback_query.middleware(log_context_middleware)
+    # Время и ошибки обработчиков; раньше склейки, чтобы её отправки получили имя обработчика
+    handler_metrics = HandlerMetricsMiddleware(metrics)
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
+    
+    if COALESCE_REPLIES:
+        coalescer = CoalesceMiddleware(pacer)
+        dp.message.middleware(coalescer)
+        dp.callback_query.middleware(coalescer)
+    
+    if REPAIR_STORAGE == "memory":
+        repair_db = RepairStorage()
+    else:
+        repair_db = SQLRepairStorage(REPAIR_DB_URL)
+        dp.startup.register(repair_db.start)
+        dp.shutdown.register(repair_db.close)
+    
+    # Заявки пишутся отдельно от данных пользователей: журнал только дописывается и не вытесняется
+    leads = LeadJournal(LEADS_DIR)
+    dp.startup.register(leads.start)
+    dp.shutdown.register(leads.close)
+    
+    # База знаний: индекс строится при старте и перестраивается при изменении файла
+    knowledge = KnowledgeBase(KNOWLEDGE_PATH, min_score=KNOWLEDGE_MIN_SCORE,
+                              reload_interval=KNOWLEDGE_RELOAD_INTERVAL, snapshot_path=KNOWLEDGE_SNAPSHOT)
+    dp.startup.register(knowledge.start_watching)
+    dp.shutdown.register(knowledge.stop_watching)
+    
+    # Общий клиент LLM: один пул соединений и лимит параллельных запросов на процесс
+    llm = None
+    if LLM_API_KEY or LLM_BASE_URL:
+        llm = LLMGateway(LLM_API_KEY or "local", base_url=LLM_BASE_URL, model=LLM_MODEL,
+                         max_concurrency=LLM_CONCURRENCY, max_connections=LLM_CONCURRENCY * 2, timeout=LLM_TIMEOUT)
+        dp.shutdown.register(llm.close)
+    
+    # Повторные вопросы к LLM отвечаются из кэша. Ответ LLM опирается на текст базы знаний,
+    # поэтому кэш привязан к её версии: новая версия сбрасывает его и в памяти, и на диске.
+    # У каждого воркера свой файл: общий файл перезаписывался бы наперегонки
+    answer_cache = AnswerCache(ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                               path=process_log_path(ANSWER_CACHE_PATH) if ANSWER_CACHE_PATH else None,
+                               generation=knowledge.digest)
+    dp.startup.register(answer_cache.start)
+    dp.shutdown.register(answer_cache.close)
+    dp.startup.register(reset_answers_on_reload)
+    
+    # Состояние флуд-контроля, кэша ответов и склейки — в тех же /metrics
+    metrics.add_gauges("repair_flood", flood_control.stats)
+    metrics.add_gauges("repair_answer_cache", answer_cache.stats)
+    if COALESCE_REPLIES:
+        metrics.add_gauges("repair_coalesce", coalescer.stats)
+    metrics.add_gauges("repair_leads", leads.stats)
+    
+    if METRICS_PORT:
+        port = METRICS_PORT if worker_index is None else METRICS_PORT + 1 + worker_index
+        
+        async def start_metrics():
+            await metrics.start_server(METRICS_HOST, port)
+        
+        dp.startup.register(start_metrics)
+    dp.shutdown.register(metrics.close)
+    return BotApp(dp, bot, pacer)
 
 # ============ ОСНОВНЫЕ ОБРАБОТЧИКИ ============
-@dp.message(CommandStart())
+@router.message(CommandStart())
 async def cmd_start(message: Message, state: FSMContext):
     await state.clear()
-    await message.answer(REPAIR_TEXTS["start"], reply_markup=get_repair_kb_start())
+    pacer.cancel(message.chat.id)
+    pacer.answer(message, REPAIR_TEXTS["start"], reply_markup=get_repair_kb_start())
     logger.info(f"Пользователь {message.from_user.id} начал работу")
 
-@dp.message(F.text == "👉 НАЧАТЬ ДИАГНОСТИКУ")
+# Команда админа — до обработчиков состояний, иначе в состоянии вопроса
+# эксперту /export ушёл бы в журнал заявок как вопрос
+@router.message(Command("export"), F.from_user.id == REPAIR_ADMIN)
+async def cmd_export(message: Message, command: CommandObject):
+    """Выгрузка заявок админу: /export [С [ПО]] [csv|jsonl], даты ГГГГ-ММ-ДД"""
+    fmt = "csv"
+    dates = []
+    for arg in (command.args or "").split():
+        if arg.lower() in EXPORT_FORMATS:
+            fmt = arg.lower()
+            continue
+        try:
+            dates.append(date.fromisoformat(arg))
+        except ValueError:
+            pacer.answer(message, "Формат: /export [С [ПО]] [csv|jsonl], даты ГГГГ-ММ-ДД", parse_mode=None)
+            return
+    date_from = dates[0] if dates else None
+    date_to = dates[1] if len(dates) > 1 else None
+    
+    # Свежие заявки этого процесса ещё в буфере — сначала на диск
+    await leads.flush()
+    files = await leads.files(date_from, date_to)
+    period = f"{date_from or 'начала'} — {date_to or 'сегодня'}"
+    if not files:
+        pacer.answer(message, f"Заявок за период {period} нет", parse_mode=None)
+        return
+    total_mb = sum(size for _, size in files) / (1024 * 1024)
+    if total_mb > EXPORT_MAX_MB:
+        pacer.answer(message, f"Журнал за период {period} — {total_mb:.1f} МБ, больше предела "
+                              f"{EXPORT_MAX_MB:.0f} МБ. Сузь период.", parse_mode=None)
+        return
+    
+    filename = f"leads_{date_from or 'all'}_{date_to or date.today()}.{fmt}"
+    document = LeadExportFile([path for path, _ in files], fmt, filename)
+    pacer.send(message.chat.id, lambda: bot.send_document(
+        message.chat.id, document, caption=f"Заявки за период {period}", parse_mode=None,
+        request_timeout=EXPORT_TIMEOUT))
+    logger.info(f"Админ {message.from_user.id} выгрузил заявки {period} ({fmt}, {total_mb:.1f} МБ)")
+
+@router.message(F.text == "👉 НАЧАТЬ ДИАГНОСТИКУ")
 async def start_diagnostic(message: Message, state: FSMContext):
     await state.clear()
     await repair_db.save(message.from_user.id, {"started_at": datetime.now().isoformat()})
     await state.set_state(RepairStates.repair_waiting_stage)
-    await message.answer(REPAIR_TEXTS["stage_question"], reply_markup=get_repair_kb_stage(show_back=False))
-    await smart_pause(0.5)
+    pacer.cancel(message.chat.id)
+    pacer.answer(message, REPAIR_TEXTS["stage_question"], reply_markup=get_repair_kb_stage(show_back=False))
 
 # ============ ВЕТВЛЯЩАЯСЯ ЛОГИКА ВОПРОСОВ ============
-@dp.message(RepairStates.repair_waiting_stage)
+@router.message(RepairStates.repair_waiting_stage)
 async def process_stage(message: Message, state: FSMContext):
     """Обработка стадии ремонта с ветвлением"""
     user_text = message.text
     
     if user_text == "◀️ Изменить предыдущий ответ":
-        await message.answer("Это первый вопрос, назад нельзя.")
+        pacer.answer(message, "Это первый вопрос, назад нельзя.")
         return
     
     stage_code = calculator.get_stage_code(user_text)
     if not stage_code:
-        await message.answer("Пожалуйста, выберите вариант из списка", 
-                           reply_markup=get_repair_kb_stage(show_back=False))
+        pacer.answer(message, "Пожалуйста, выберите вариант из списка",
+                     reply_markup=get_repair_kb_stage(show_back=False))
         return
     
     await repair_db.save(message.from_user.id, {
@@ -789,33 +745,32 @@ async def process_stage(message: Message, state: FSMContext):
         "living": "🏠 *Ремонт завершён.* Но это не значит, что риски прошли."
     }
     
+    delay = 1.0
     if stage_code in stage_comments:
-        await message.answer(stage_comments[stage_code])
-        await smart_pause(2.0)
+        pacer.answer(message, stage_comments[stage_code])
+        delay += 2.0
     
     # Переход к следующему вопросу
     await state.set_state(RepairStates.repair_waiting_area)
-    await smart_pause(1.0)
-    await message.answer(REPAIR_TEXTS["area_question"], 
-                        reply_markup=get_repair_kb_area(show_back=True))
+    pacer.answer(message, REPAIR_TEXTS["area_question"], delay=delay,
+                 reply_markup=get_repair_kb_area(show_back=True))
 
-@dp.message(RepairStates.repair_waiting_area)
+@router.message(RepairStates.repair_waiting_area)
 async def process_area(message: Message, state: FSMContext):
     """Обработка площади с возможностью вернуться назад"""
     user_text = message.text
     
     if user_text == "◀️ Изменить предыдущий ответ":
         await state.set_state(RepairStates.repair_waiting_stage)
-        await message.answer("Возвращаю к вопросу о стадии ремонта...")
-        await smart_pause(1.0)
-        await message.answer(REPAIR_TEXTS["stage_question"], 
-                           reply_markup=get_repair_kb_stage(show_back=False))
+        pacer.answer(message, "Возвращаю к вопросу о стадии ремонта...")
+        pacer.answer(message, REPAIR_TEXTS["stage_question"], delay=1.0,
+                     reply_markup=get_repair_kb_stage(show_back=False))
         return
     
     area_code = calculator.get_area_code(user_text)
     if not area_code:
-        await message.answer("Пожалуйста, выберите вариант из списка",
-                           reply_markup=get_repair_kb_area(show_back=True))
+        pacer.answer(message, "Пожалуйста, выберите вариант из списка",
+                     reply_markup=get_repair_kb_area(show_back=True))
         return
     
     await repair_db.save(message.from_user.id, {
@@ -828,11 +783,9 @@ async def process_area(message: Message, state: FSMContext):
     
     # Комментарий в зависимости от площади
     if area_code != "unknown":
-        await message.answer(f"📊 *Запомнил.* Рассчитаю риски для {user_text}.")
+        pacer.answer(message, f"📊 *Запомнил.* Рассчитаю риски для {user_text}.")
     else:
-        await message.answer("👌 *Без проблем.* Использую средние значения.")
-    
-    await smart_pause(1.5)
+        pacer.answer(message, "👌 *Без проблем.* Использую средние значения.")
     
     # ВЕТВЛЕНИЕ: проверяем, нужно ли спрашивать о контроле
     user_data = await state.get_data()
@@ -859,13 +812,12 @@ async def process_area(message: Message, state: FSMContext):
             
             # Идём сразу к расчётам
             await state.set_state(RepairStates.repair_calculating)
-            await show_calculations(message, state)
+            await show_calculations(message, state, delay=1.5)
         else:
             # Задаём вопрос о фиксации (для living)
             await state.set_state(RepairStates.repair_waiting_fixation)
-            await smart_pause(1.0)
-            await message.answer(REPAIR_TEXTS["fixation_question_living"],
-                               reply_markup=get_repair_kb_fixation(show_back=True, stage="living"))
+            pacer.answer(message, REPAIR_TEXTS["fixation_question_living"], delay=2.5,
+                         reply_markup=get_repair_kb_fixation(show_back=True, stage="living"))
     else:
         # Спрашиваем о контроле
         await state.set_state(RepairStates.repair_waiting_control)
@@ -878,20 +830,19 @@ async def process_area(message: Message, state: FSMContext):
             question_text = REPAIR_TEXTS["control_question"]
             for_living = False
             
-        await message.answer(question_text,
-                           reply_markup=get_repair_kb_control(show_back=True, for_living=for_living))
+        pacer.answer(message, question_text, delay=1.5,
+                     reply_markup=get_repair_kb_control(show_back=True, for_living=for_living))
 
-@dp.message(RepairStates.repair_waiting_control)
+@router.message(RepairStates.repair_waiting_control)
 async def process_control(message: Message, state: FSMContext):
     """Обработка контроля с ветвлением"""
-    user_text = message.text
+    user_text = message.text or ""
     
     if user_text == "◀️ Изменить предыдущий ответ":
         await state.set_state(RepairStates.repair_waiting_area)
-        await message.answer("Возвращаю к вопросу о площади...")
-        await smart_pause(1.0)
-        await message.answer(REPAIR_TEXTS["area_question"],
-                           reply_markup=get_repair_kb_area(show_back=True))
+        pacer.answer(message, "Возвращаю к вопросу о площади...")
+        pacer.answer(message, REPAIR_TEXTS["area_question"], delay=1.0,
+                     reply_markup=get_repair_kb_area(show_back=True))
         return
     
     # Определяем код контроля
@@ -906,8 +857,8 @@ async def process_control(message: Message, state: FSMContext):
     if not control_code:
         # Определяем правильную клавиатуру
         for_living = stage == "living"
-        await message.answer("Пожалуйста, выберите вариант из списка",
-                           reply_markup=get_repair_kb_control(show_back=True, for_living=for_living))
+        pacer.answer(message, "Пожалуйста, выберите вариант из списка",
+                     reply_markup=get_repair_kb_control(show_back=True, for_living=for_living))
         return
     
     await repair_db.save(message.from_user.id, {
@@ -927,9 +878,10 @@ async def process_control(message: Message, state: FSMContext):
         "skip": "📝 *Понятно.* Раз ремонт уже закончен, оценим риски по факту."
     }
     
+    delay = 0.0
     if control_code in control_comments:
-        await message.answer(control_comments[control_code])
-        await smart_pause(2.0)
+        pacer.answer(message, control_comments[control_code])
+        delay = 2.0
     
     # ВЕТВЛЕНИЕ: проверяем, нужно ли спрашивать о фиксации
     if calculator.should_skip_fixation(stage):
@@ -943,11 +895,10 @@ async def process_control(message: Message, state: FSMContext):
         
         # Идём сразу к расчётам
         await state.set_state(RepairStates.repair_calculating)
-        await show_calculations(message, state)
+        await show_calculations(message, state, delay=delay)
     else:
         # Задаём вопрос о фиксации
         await state.set_state(RepairStates.repair_waiting_fixation)
-        await smart_pause(1.0)
         
         # Разный текст в зависимости от стадии
         if stage == "not_started":
@@ -960,18 +911,17 @@ async def process_control(message: Message, state: FSMContext):
             question_text = REPAIR_TEXTS["fixation_question"]
             kb_stage = "other"
         
-        await message.answer(question_text,
-                           reply_markup=get_repair_kb_fixation(show_back=True, stage=kb_stage))
+        pacer.answer(message, question_text, delay=delay + 1.0,
+                     reply_markup=get_repair_kb_fixation(show_back=True, stage=kb_stage))
 
-@dp.message(RepairStates.repair_waiting_fixation)
+@router.message(RepairStates.repair_waiting_fixation)
 async def process_fixation(message: Message, state: FSMContext):
     """Обработка фиксации с учётом стадии"""
     user_text = message.text
     
     if user_text == "◀️ Изменить предыдущий ответ":
         await state.set_state(RepairStates.repair_waiting_control)
-        await message.answer("Возвращаю к вопросу о контроле...")
-        await smart_pause(1.0)
+        pacer.answer(message, "Возвращаю к вопросу о контроле...")
         
         user_data = await state.get_data()
         stage = user_data.get("stage", "not_started")
@@ -982,8 +932,8 @@ async def process_fixation(message: Message, state: FSMContext):
             question_text = REPAIR_TEXTS["control_question"]
             for_living = False
             
-        await message.answer(question_text,
-                           reply_markup=get_repair_kb_control(show_back=True, for_living=for_living))
+        pacer.answer(message, question_text, delay=1.0,
+                     reply_markup=get_repair_kb_control(show_back=True, for_living=for_living))
         return
     
     # Определяем код фиксации
@@ -993,8 +943,8 @@ async def process_fixation(message: Message, state: FSMContext):
     
     if not fixation_code:
         # Определяем правильную клавиатуру
-        await message.answer("Пожалуйста, выберите вариант из списка",
-                           reply_markup=get_repair_kb_fixation(show_back=True, stage=stage))
+        pacer.answer(message, "Пожалуйста, выберите вариант из списка",
+                     reply_markup=get_repair_kb_fixation(show_back=True, stage=stage))
         return
     
     await repair_db.save(message.from_user.id, {
@@ -1007,40 +957,46 @@ async def process_fixation(message: Message, state: FSMContext):
     
     # Комментарий в зависимости от фиксации
     if fixation_code in ["full", "planned_full"]:
-        await message.answer("📸 *Отлично!* Фотофиксация — твой главный инструмент защиты.")
+        pacer.answer(message, "📸 *Отлично!* Фотофиксация — твой главный инструмент защиты.")
     elif fixation_code in ["partial", "none"]:
-        await message.answer("⚠️ *Внимание:* без фотофиксации сложно доказать, что было ДО ремонта.")
+        pacer.answer(message, "⚠️ *Внимание:* без фотофиксации сложно доказать, что было ДО ремонта.")
     else:
-        await message.answer("🤔 *Понял.* Давай посчитаем риски.")
-    
-    await smart_pause(1.5)
+        pacer.answer(message, "🤔 *Понял.* Давай посчитаем риски.")
     
     # Переходим к расчётам
     await state.set_state(RepairStates.repair_calculating)
-    await show_calculations(message, state)
+    await show_calculations(message, state, delay=1.5)
 
 # ============ РАСЧЁТЫ И РЕЗУЛЬТАТЫ ============
-async def show_calculations(message: Message, state: FSMContext):
-    """Показ расчётов с анимацией"""
+async def show_calculations(message: Message, state: FSMContext, delay: float = 0.0):
+    """Показ расчётов с анимацией (delay — пауза перед первым шагом)"""
     steps = REPAIR_TEXTS["calculating"]
     
+    if PROGRESS_MODE == "edit":
+        # Последний шаг ("Готово!") заменяет сам результат
+        await state.set_state(RepairStates.repair_showing_results)
+        await show_results(message, state, delay=delay, progress=tuple(steps[:-1]))
+        return
+    
     for text in steps:
-        await message.answer(text)
-        await smart_pause(1.5)
+        pacer.answer(message, text, delay=delay)
+        delay = 1.5
     
     # Переходим в состояние показа результатов
     await state.set_state(RepairStates.repair_showing_results)
-    await show_results(message, state)
+    await show_results(message, state, delay=delay)
 
-async def show_results(message: Message, state: FSMContext):
-    """Показ результатов диагностики с ИИ-персонализацией"""
-    user_data = await state.get_data()
-    
-    stage = user_data.get("stage", "not_started")
-    area = user_data.get("area", "unknown")
-    control = user_data.get("control", "unknown")
-    fixation = user_data.get("fixation", "planned_none")
-    
+class RenderedResults(NamedTuple):
+    """Готовые тексты результатов для одного сочетания ответов"""
+    message: str
+    engagement: Optional[str]
+    recommendation: str
+
+
+@functools.lru_cache(maxsize=RESULTS_CACHE_SIZE)
+def render_results(stage: str, area: str, control: str, fixation: str,
+                   stage_text: str, area_text: str, control_text: str, fixation_text: str) -> RenderedResults:
+    """Сборка текстов результатов; зависит только от ответов, поэтому кэшируется"""
     # Рассчитываем потери
     losses = calculator.calculate_intelligent_loss(stage, area, control, fixation)
     
@@ -1062,10 +1018,10 @@ async def show_results(message: Message, state: FSMContext):
     result_msg = f"""
 🎯 *ТВОЙ ПЕРСОНАЛИЗИРОВАННЫЙ ДИАГНОЗ:*
 
-🔹 *Стадия:* {user_data.get('stage_text', 'Не указано')}
-🔹 *Площадь:* {user_data.get('area_text', 'Не указано')}
-{f"🔹 *Контроль:* {user_data.get('control_text', 'Не указано')}" if control != "skip" else ""}
-{f"🔹 *Фиксация:* {user_data.get('fixation_text', 'Не указано')}" if fixation != "skip" else ""}
+🔹 *Стадия:* {stage_text}
+🔹 *Площадь:* {area_text}
+{f"🔹 *Контроль:* {control_text}" if control != "skip" else ""}
+{f"🔹 *Фиксация:* {fixation_text}" if fixation != "skip" else ""}
 
 {ai_recommendation['recommendation']}
 
@@ -1097,33 +1053,53 @@ async def show_results(message: Message, state: FSMContext):
 💰 *ТВОЙ СРЕДНИЙ РИСК:* {ai_engine.smart_format_money(losses['avg'], 'result')}
 """
     
-    await message.answer(result_msg)
-    await smart_pause(5.0)
-    
     # ИИ: Вовлекающий вопрос
     engagement_question = ai_engine.get_engagement_question(stage)
-    if engagement_question:
-        await message.answer(f"💭 *Вопрос для размышления:*\n\n{engagement_question}")
-        await smart_pause(3.0)
+    engagement = f"💭 *Вопрос для размышления:*\n\n{engagement_question}" if engagement_question else None
+    
+    return RenderedResults(result_msg, engagement, ai_recommendation['recommendation'])
+
+
+async def show_results(message: Message, state: FSMContext, delay: float = 0.0, progress: Tuple[str, ...] = ()):
+    """Показ результатов диагностики с ИИ-персонализацией (progress — кадры анимации перед ними)"""
+    user_data = await state.get_data()
+    
+    rendered = render_results(
+        user_data.get("stage", "not_started"),
+        user_data.get("area", "unknown"),
+        user_data.get("control", "unknown"),
+        user_data.get("fixation", "planned_none"),
+        user_data.get("stage_text", "Не указано"),
+        user_data.get("area_text", "Не указано"),
+        user_data.get("control_text", "Не указано"),
+        user_data.get("fixation_text", "Не указано"),
+    )
+    
+    if progress:
+        pacer.animate(message.chat.id, progress, interval=1.5, delay=delay, final=rendered.message)
+    else:
+        pacer.answer(message, rendered.message, delay=delay)
+    delay = 5.0
+    
+    # ИИ: Вовлекающий вопрос
+    if rendered.engagement:
+        pacer.answer(message, rendered.engagement, delay=delay)
+        delay = 3.0
     
     # Пауза для эмоционального вовлечения
-    await message.answer(REPAIR_TEXTS["results_pause"])
-    await smart_pause(3.0)
+    pacer.answer(message, REPAIR_TEXTS["results_pause"], delay=delay)
     
     # Предлагаем следующий шаг
-    await message.answer("👉 *Хочешь узнать, как сохранить эти деньги?*", 
-                        reply_markup=get_repair_kb_results())
+    pacer.answer(message, "👉 *Хочешь узнать, как сохранить эти деньги?*", delay=3.0,
+                 reply_markup=get_repair_kb_results())
 
 
 # ============ ИСПРАВЛЕННЫЕ ОБРАБОТЧИКИ КНОПОК РЕЗУЛЬТАТОВ ============
-@dp.message(RepairStates.repair_showing_results, F.text == "👉 ПОКАЖИ РЕШЕНИЕ")
+@router.message(RepairStates.repair_showing_results, F.text == "👉 ПОКАЖИ РЕШЕНИЕ")
 async def show_solution(message: Message, state: FSMContext):
     """Показ решения (системы контроля)"""
-    await message.answer(REPAIR_TEXTS["solution_intro"])
-    await smart_pause(2.0)
-    
-    await message.answer(REPAIR_TEXTS["system_details"])
-    await smart_pause(2.0)
+    pacer.answer(message, REPAIR_TEXTS["solution_intro"])
+    pacer.answer(message, REPAIR_TEXTS["system_details"], delay=2.0)
     
     price_text = REPAIR_TEXTS["price_info"].format(
         normal_price=PRICE_NORMAL,
@@ -1131,32 +1107,32 @@ async def show_solution(message: Message, state: FSMContext):
         vip_price=PRICE_VIP
     )
     
-    await message.answer(price_text)
-    await smart_pause(2.0)
+    pacer.answer(message, price_text, delay=2.0)
     
     # Переходим в состояние выбора предложения
     await state.set_state(RepairStates.repair_choosing_offer)
-    await message.answer("*Теперь выбор за тобой.*\n\nВыбери следующий шаг:", 
-                        reply_markup=get_repair_kb_offer())
+    pacer.answer(message, "*Теперь выбор за тобой.*\n\nВыбери следующий шаг:", delay=2.0,
+                 reply_markup=get_repair_kb_offer())
 
 # ============ УНИВЕРСАЛЬНЫЕ ОБРАБОТЧИКИ КНОПОК ============
 # Обработчик для кнопки "🤔 НУЖНА КОНСУЛЬТАЦИЯ" - работает ИЗ ЛЮБОГО СОСТОЯНИЯ
-@dp.message(F.text == "🤔 НУЖНА КОНСУЛЬТАЦИЯ")
+@router.message(F.text == "🤔 НУЖНА КОНСУЛЬТАЦИЯ")
 async def need_consultation_anywhere(message: Message, state: FSMContext):
     """Обработчик кнопки 'Нужна консультация' из любого состояния"""
     await handle_contact_expert(message, state)
 
 # Обработчик для кнопки "📞 Связаться с экспертом" - работает ИЗ ЛЮБОГО СОСТОЯНИЯ  
-@dp.message(F.text == "📞 Связаться с экспертом")
+@router.message(F.text == "📞 Связаться с экспертом")
 async def contact_expert_anywhere(message: Message, state: FSMContext):
     """Обработчик кнопки 'Связаться с экспертом' из любого состояния"""
     await handle_contact_expert(message, state)
 
 # ============ ОБРАБОТКА 5 ВАРИАНТОВ ПРЕДЛОЖЕНИЙ ============
-@dp.message(RepairStates.repair_choosing_offer)
+@router.message(RepairStates.repair_choosing_offer)
 async def process_offer_choice(message: Message, state: FSMContext):
     """Обработка выбора варианта из предложений"""
-    choice = message.text
+    # Контакт или фото со старой клавиатуры — не выбор варианта
+    choice = message.text or ""
     
     if "Купить" in choice:
         await handle_buy_system(message, state)
@@ -1169,17 +1145,17 @@ async def process_offer_choice(message: Message, state: FSMContext):
     elif "AI" in choice.upper() or "консультацию" in choice.lower():
         await handle_ai_consultation(message, state)
     else:
-        await message.answer("Пожалуйста, выберите вариант из списка", 
-                           reply_markup=get_repair_kb_offer())
+        pacer.answer(message, "Пожалуйста, выберите вариант из списка",
+                     reply_markup=get_repair_kb_offer())
 
 async def handle_buy_system(message: Message, state: FSMContext):
     """Обработка покупки системы"""
-    await message.answer(REPAIR_TEXTS["buy_options"], reply_markup=get_inline_payment_kb())
+    pacer.answer(message, REPAIR_TEXTS["buy_options"], reply_markup=get_inline_payment_kb())
     logger.info(f"Пользователь {message.from_user.id} выбрал покупку системы")
 
 async def handle_contact_expert(message: Message, state: FSMContext):
     """Обработка связи с экспертом - ТЕПЕРЬ РАБОТАЕТ ИЗ ЛЮБОГО СОСТОЯНИЯ!"""
-    await message.answer(REPAIR_TEXTS["contact_expert"], reply_markup=get_inline_expert_kb())
+    pacer.answer(message, REPAIR_TEXTS["contact_expert"], reply_markup=get_inline_expert_kb())
     logger.info(f"Пользователь {message.from_user.id} запросил связь с экспертом")
 
 async def handle_collect_phone(message: Message, state: FSMContext):
@@ -1200,32 +1176,33 @@ async def handle_collect_phone(message: Message, state: FSMContext):
 *Выбери способ:*
 """
     
-    await message.answer(phone_text, reply_markup=get_repair_kb_phone())
+    pacer.answer(message, phone_text, reply_markup=get_repair_kb_phone())
 
-@dp.message(RepairStates.repair_waiting_phone)
+@router.message(RepairStates.repair_waiting_phone)
 async def process_phone_input(message: Message, state: FSMContext):
     """Обработка ввода номера телефона"""
     if message.text == "⏪ Назад к выбору":
         await state.set_state(RepairStates.repair_choosing_offer)
-        await message.answer("Возвращаю к выбору вариантов...", 
-                           reply_markup=get_repair_kb_offer())
+        pacer.answer(message, "Возвращаю к выбору вариантов...",
+                     reply_markup=get_repair_kb_offer())
         return
     
     phone_number = None
     
     if message.text == "✏️ Ввести номер вручную":
-        await message.answer("Напиши свой номер телефона в формате:\n+7 XXX XXX XX XX\nили\n8 XXX XXX XX XX")
+        pacer.answer(message, "Напиши свой номер телефона в формате:\n+7 XXX XXX XX XX\nили\n8 XXX XXX XX XX")
         return
     
     if message.contact:
         phone_number = message.contact.phone_number
-        await message.answer(f"✅ *Спасибо!* Получил твой номер: {phone_number}")
+        pacer.answer(message, f"✅ *Спасибо!* Получил твой номер: {phone_number}")
     elif message.text and any(char.isdigit() for char in message.text):
         phone_number = message.text.strip()
-        await message.answer(f"✅ *Спасибо!* Записал твой номер: {phone_number}")
+        pacer.answer(message, f"✅ *Спасибо!* Записал твой номер: {phone_number}")
     
     if phone_number:
         await repair_db.save(message.from_user.id, {"phone": phone_number})
+        record_lead("phone", message, phone=phone_number)
         
         confirmation = f"""
 ✅ *Номер получен!*
@@ -1242,32 +1219,58 @@ async def process_phone_input(message: Message, state: FSMContext):
 Если есть срочный вопрос — напиши прямо сейчас в Telegram: {EXPERT_TELEGRAM}
 """
         
-        await message.answer(confirmation)
+        pacer.answer(message, confirmation)
         logger.info(f"Пользователь {message.from_user.id} оставил номер: {phone_number}")
     else:
-        await message.answer("Пожалуйста, введи номер телефона или используй кнопку 'Отправить мой номер'",
-                           reply_markup=get_repair_kb_phone())
+        pacer.answer(message, "Пожалуйста, введи номер телефона или используй кнопку 'Отправить мой номер'",
+                     reply_markup=get_repair_kb_phone())
         return
     
     await state.set_state(RepairStates.repair_choosing_offer)
-    await message.answer("Выбери следующий шаг:", reply_markup=get_repair_kb_offer())
+    pacer.answer(message, "Выбери следующий шаг:", reply_markup=get_repair_kb_offer())
 
 async def handle_calculate_estimate(message: Message, state: FSMContext):
     """Обработка запроса калькулятора сметы"""
-    await message.answer(REPAIR_TEXTS["calculate_estimate"])
+    pacer.answer(message, REPAIR_TEXTS["calculate_estimate"])
     logger.info(f"Пользователь {message.from_user.id} запросил калькулятор сметы")
 
 async def handle_ai_consultation(message: Message, state: FSMContext):
     """Обработка запроса AI-консультации"""
-    await message.answer(REPAIR_TEXTS["ai_consultation"])
+    await state.set_state(RepairStates.repair_waiting_question)
+    await state.update_data(consultation="ai")
+    pacer.answer(message, REPAIR_TEXTS["ai_consultation"])
     logger.info(f"Пользователь {message.from_user.id} запросил AI-консультацию")
 
+async def reply_by_intent(message: Message, state: FSMContext, reply_markup=None) -> bool:
+    """Ответ по намерению из patterns базы знаний; False — если ответить нечем"""
+    intents = knowledge.intents(message.text or "")
+    if "expert" in intents:
+        await handle_contact_expert(message, state)
+        return True
+    for kind in ("thanks", "greeting"):
+        if kind in intents:
+            pacer.answer(message, knowledge.generic(kind), reply_markup=reply_markup)
+            return True
+    if intents & {"help", "cost", "time"}:
+        found = knowledge.find(message.text)
+        if found:
+            pacer.answer(message, f"🤖 {found.text}", reply_markup=reply_markup)
+            return True
+    return False
+
+async def stream_ai_answer(chat_id: int, question: str, found, fallback: str):
+    """Стриминг ответа LLM в чат; полный ответ запоминается в кэше"""
+    answer = await stream_to_chat(bot, chat_id, llm.stream(question, found.text if found else None), fallback)
+    if answer:
+        answer_cache.put(question, answer)
+
 # ============ INLINE ОБРАБОТЧИКИ ============
-@dp.callback_query(F.data == "ask_question")
+@router.callback_query(F.data == "ask_question")
 async def ask_question_callback(callback: CallbackQuery, state: FSMContext):
     """Обработчик inline-кнопки 'Задать вопрос'"""
     await state.set_state(RepairStates.repair_waiting_question)
-    await callback.message.answer("""
+    await state.update_data(consultation="expert")
+    pacer.answer(callback.message, """
 💬 *Задай свой вопрос эксперту:*
 
 Напиши его здесь, и я передам напрямую эксперту.
@@ -1283,11 +1286,12 @@ async def ask_question_callback(callback: CallbackQuery, state: FSMContext):
 """)
     await callback.answer()
 
-@dp.callback_query(F.data == "ask_question_bot")
+@router.callback_query(F.data == "ask_question_bot")
 async def ask_question_bot_callback(callback: CallbackQuery, state: FSMContext):
     """Обработчик inline-кнопки 'Задать вопрос в боте'"""
     await state.set_state(RepairStates.repair_waiting_question)
-    await callback.message.answer("""
+    await state.update_data(consultation="expert")
+    pacer.answer(callback.message, """
 💬 *Задай свой вопрос эксперту:*
 
 Напиши его здесь, и я передам напрямую эксперту.
@@ -1303,15 +1307,43 @@ async def ask_question_bot_callback(callback: CallbackQuery, state: FSMContext):
 """)
     await callback.answer()
 
-@dp.message(RepairStates.repair_waiting_question)
+@router.message(RepairStates.repair_waiting_question)
 async def process_expert_question(message: Message, state: FSMContext):
-    """Обработка вопроса для эксперта"""
-    question = message.text
+    """Обработка вопроса: ответ из базы знаний, для эксперта — ещё и пересылка"""
+    question = message.text or ""
     user_id = message.from_user.id
+    data = await state.get_data()
+    found = knowledge.find(question)
+    
+    if data.get("consultation") == "ai":
+        await state.set_state(RepairStates.repair_choosing_offer)
+        cached = answer_cache.get(question)
+        if cached:
+            pacer.answer(message, cached, parse_mode=ANSWER_PARSE_MODE, reply_markup=get_repair_kb_offer())
+        elif llm is not None:
+            # Ответ стримится в очереди чата и не держит обработчик
+            fallback = f"🤖 {found.text}" if found else f"🤖 {knowledge.generic('unknown')}"
+            pacer.send(message.chat.id, lambda: stream_ai_answer(message.chat.id, question, found, fallback))
+            # Клавиатуру нельзя добавить правкой сообщения — она уходит следом, после стриминга
+            pacer.answer(message, "Выбери следующий шаг:", reply_markup=get_repair_kb_offer())
+        elif found:
+            # Ответ из базы знаний и так дешёвый: в кэш не кладётся и не переживёт её правку
+            pacer.answer(message, f"🤖 {found.text}", reply_markup=get_repair_kb_offer())
+        elif await reply_by_intent(message, state, get_repair_kb_offer()):
+            pass
+        else:
+            pacer.answer(message, f"🤖 {knowledge.generic('unknown')}\n\nДля сложного вопроса — {EXPERT_TELEGRAM}",
+                         reply_markup=get_repair_kb_offer())
+        logger.info(f"Пользователь {user_id} спросил AI ({found.category if found else 'нет ответа'}): {question[:50]}...")
+        return
+    
+    if found:
+        pacer.answer(message, f"💡 *Пока ждёшь эксперта:*\n\n{found.text}")
     
     await repair_db.save(user_id, {"expert_question": question, "question_time": datetime.now().isoformat()})
+    record_lead("question", message, question=question)
     
-    await message.answer(f"""
+    pacer.answer(message, f"""
 ✅ *Вопрос отправлен эксперту!*
 
 Твой вопрос:
@@ -1329,10 +1361,10 @@ async def process_expert_question(message: Message, state: FSMContext):
     await state.set_state(RepairStates.repair_choosing_offer)
     logger.info(f"Пользователь {user_id} задал вопрос эксперту: {question[:50]}...")
 
-@dp.callback_query(F.data == "call_expert")
+@router.callback_query(F.data == "call_expert")
 async def call_expert_callback(callback: CallbackQuery):
     """Обработчик inline-кнопки 'Позвонить эксперту'"""
-    await callback.message.answer(f"""
+    pacer.answer(callback.message, f"""
 📞 *Позвонить эксперту:*
 
 *Номер телефона:* {EXPERT_PHONE}
@@ -1347,7 +1379,7 @@ async def call_expert_callback(callback: CallbackQuery):
     await callback.answer()
 
 # ============ КОМАНДЫ ============
-@dp.message(Command("help"))
+@router.message(Command("help"))
 async def cmd_help(message: Message):
     """Команда помощи"""
     help_text = f"""
@@ -1371,32 +1403,35 @@ async def cmd_help(message: Message):
 3. Реальные цифры из опыта
 4. Решения для экономии
 """
-    await message.answer(help_text)
+    pacer.answer(message, help_text)
 
-@dp.message(Command("cancel"))
+@router.message(Command("cancel"))
 async def cmd_cancel(message: Message, state: FSMContext):
     """Команда отмены"""
     await state.clear()
-    await message.answer("Диагностика отменена. Начни заново с /start",
-                        reply_markup=get_repair_kb_start())
+    pacer.cancel(message.chat.id)
+    pacer.answer(message, "Диагностика отменена. Начни заново с /start",
+                 reply_markup=get_repair_kb_start())
 
 # ============ ОБРАБОТКА ЛЮБЫХ ДРУГИХ СООБЩЕНИЙ ============
-@dp.message()
+@router.message()
 async def handle_unknown(message: Message, state: FSMContext):
     """Обработчик любых других сообщений"""
     current_state = await state.get_state()
     
     if not current_state:
-        await message.answer("Начни диагностику с команды /start", 
-                           reply_markup=get_repair_kb_start())
+        if await reply_by_intent(message, state, get_repair_kb_start()):
+            return
+        pacer.answer(message, "Начни диагностику с команды /start",
+                     reply_markup=get_repair_kb_start())
     elif current_state == RepairStates.repair_showing_results:
-        await message.answer("Выбери вариант выше 👆", 
-                           reply_markup=get_repair_kb_results())
+        pacer.answer(message, "Выбери вариант выше 👆",
+                     reply_markup=get_repair_kb_results())
     elif current_state == RepairStates.repair_choosing_offer:
-        await message.answer("Выбери вариант из списка 👆", 
-                           reply_markup=get_repair_kb_offer())
+        pacer.answer(message, "Выбери вариант из списка 👆",
+                     reply_markup=get_repair_kb_offer())
     else:
-        await message.answer("Пожалуйста, используй кнопки для ответа. Или отправь /cancel для отмены.")
+        pacer.answer(message, "Пожалуйста, используй кнопки для ответа. Или отправь /cancel для отмены.")
 
 # ============ ЗАПУСК ============
 async def main():
@@ -1428,18 +1463,54 @@ async def main():
         
         logger.info(f"Бот @{bot_info.username} запущен")
         
-        await dp.start_polling(bot)
+        if REPAIR_MODE == "webhook":
+            await run_webhook(dp, bot,
+                              base_url=WEBHOOK_BASE_URL,
+                              path=WEBHOOK_PATH,
+                              secret=WEBHOOK_SECRET,
+                              host=WEBHOOK_HOST,
+                              port=WEBHOOK_PORT)
+        else:
+            # Активный вебхук не даёт работать getUpdates
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
         
     except Exception as e:
         logger.error(f"Ошибка запуска: {e}")
         print(f"💥 ОШИБКА: {e}")
         sys.exit(1)
 
+def main_sharded():
+    """Многопроцессный режим: этот процесс только принимает апдейты, обрабатывают их воркеры"""
+    api = TelegramAPIServer.from_base(TELEGRAM_API_URL) if TELEGRAM_API_URL else PRODUCTION
+    allowed_updates = router.resolve_used_update_types()
+    pool = WorkerPool(create_app, workers=REPAIR_WORKERS)
+    print(f"🧩 Воркеров: {REPAIR_WORKERS}, приём: {REPAIR_MODE}")
+    
+    if REPAIR_MODE == "webhook":
+        async def ingress(pool):
+            await serve_webhook(pool, REPAIR_TOKEN, api,
+                                base_url=WEBHOOK_BASE_URL,
+                                path=WEBHOOK_PATH,
+                                secret=WEBHOOK_SECRET,
+                                host=WEBHOOK_HOST,
+                                port=WEBHOOK_PORT,
+                                allowed_updates=allowed_updates)
+    else:
+        async def ingress(pool):
+            await poll_updates(pool, REPAIR_TOKEN, api, allowed_updates)
+    
+    run_sharded(pool, ingress)
+
 if __name__ == "__main__":
     print("Запуск полностью исправленной версии бота v2.0...")
     
     try:
-        asyncio.run(main())
+        if REPAIR_WORKERS > 1:
+            main_sharded()
+        else:
+            create_app()
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("\n❌ Бот остановлен")
         logger.info("Бот остановлен пользователем")
@@ -0,0 +1,377 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Калькулятор потерь для бота диагностики рисков ремонта
+Все сочетания ответов (5 стадий × 5 площадей × 5 вариантов контроля × 6 фиксаций)
+рассчитываются один раз при импорте и дальше отдаются из неизменяемой таблицы
+"""
+
+from itertools import product
+from types import MappingProxyType
+from typing import Dict, Mapping, Tuple
+
+LossKey = Tuple[str, str, str, str]
+
+
+class IntelligentLossCalculator:
+    """Умный калькулятор потерь с логикой ответвлений"""
+    
+    # Базовые потери для разных стадий (в тыс руб)
+    STAGE_BASE_LOSSES = {
+        "not_started": {
+            "name": "Ещё не начали",
+            "base_range": (50, 300),  # в тыс ₽
+            "risk_factors": [
+                ("planning", 1.3, "Отсутствие детального плана"),
+                ("contract", 1.4, "Неправильный договор"),
+                ("specs", 1.2, "Нет технического задания"),
+                ("budget", 1.3, "Неполный бюджет"),
+            ],
+            "skip_fixation": True,  # пропустить вопрос о фиксации
+            "skip_control": False,  # НЕ пропускать вопрос о контроле
+            "examples": [
+                ("Переделки электрики", "80-150 тыс ₽", "После начала работ оказалось, что розетки не там"),
+                ("Доплаты за изменения", "30-80 тыс ₽", "Постоянные правки в процессе"),
+                ("Штрафы за просрочку", "20-50 тыс ₽", "Нет чётких сроков в договоре"),
+            ],
+            "emotional_hook": "💰 *Это деньги на новую кухню или диван*",
+        },
+        "demolition": {
+            "name": "Демонтаж",
+            "base_range": (30, 200),
+            "risk_factors": [
+                ("damage", 1.4, "Повреждение конструкций"),
+                ("documentation", 1.3, "Нет фотофиксации ДО"),
+                ("rubbish", 1.2, "Проблемы с вывозом мусора"),
+                ("neighbors", 1.5, "Конфликты с соседями"),
+            ],
+            "skip_fixation": False,
+            "skip_control": False,
+            "examples": [
+                ("Повреждён стояк", "100-200 тыс ₽", "Замена + компенсация соседям"),
+                ("Не вывезли мусор", "20-50 тыс ₽", "Штрафы + срочный вывоз"),
+                ("Сломали не то", "30-80 тыс ₽", "Восстановление + доплата"),
+            ],
+            "emotional_hook": "🏗️ *Эти деньги могли пойти на новые окна*",
+        },
+        "rough": {
+            "name": "Черновые работы",
+            "base_range": (80, 300),
+            "risk_factors": [
+                ("plaster", 1.5, "Кривая штукатурка"),
+                ("electric", 1.4, "Ошибки в электрике"),
+                ("plumbing", 1.6, "Проблемы с сантехникой"),
+                ("levels", 1.3, "Неровные полы/потолки"),
+            ],
+            "skip_fixation": False,
+            "skip_control": False,
+            "examples": [
+                ("Кривые стены", "80-250 тыс ₽", "Мебель не встаёт ровно"),
+                ("Электрика не работает", "50-200 тыс ₽", "Вскрытие штроб + переделка"),
+                ("Протечки сантехники", "60-180 тыс ₽", "Ремонт у соседей + свой ремонт"),
+            ],
+            "emotional_hook": "🔧 *Сумма, за которую можно сделать весь пол с подогревом*",
+        },
+        "finishing": {
+            "name": "Чистовая отделка",
+            "base_range": (60, 250),
+            "risk_factors": [
+                ("tiles", 1.4, "Плитка отваливается"),
+                ("paint", 1.3, "Кривая покраска"),
+                ("joints", 1.2, "Неровные стыки"),
+                ("materials", 1.4, "Не те материалы"),
+            ],
+            "skip_fixation": False,
+            "skip_control": False,
+            "examples": [
+                ("Отвалилась плитка", "50-200 тыс ₽", "Новый материал + работа"),
+                ("Неровная покраска", "60-120 тыс ₽", "Шлифовка + перекраска"),
+                ("Щели в стыках", "40-100 тыс ₽", "Демонтаж + переделка"),
+            ],
+            "emotional_hook": "🎨 *Этих денег хватило бы на дизайнерскую мебель*",
+        },
+        "living": {
+            "name": "Уже живём",
+            "base_range": (100, 500),
+            "risk_factors": [
+                ("hidden_defects", 1.6, "Скрытые дефекты"),
+                ("warranty", 1.8, "Гарантия закончилась"),
+                ("repairs", 1.4, "Дорогие переделки"),
+                ("stress", 1.3, "Стресс и нервы"),
+            ],
+            "skip_fixation": False,  # всё равно спрашиваем о фиксации (ретроспективно)
+            "skip_control": True,   # пропустить вопрос о контроле (уже поздно)
+            "examples": [
+                ("Протечка в ванной", "100-300 тыс ₽", "Ремонт соседей + свой ремонт"),
+                ("Электрика не работает", "50-150 тыс ₽", "Вскрытие стен + поиск проблемы"),
+                ("Отслоилась отделка", "80-200 тыс ₽", "Полный передел участка"),
+            ],
+            "emotional_hook": "🏠 *Сумма, которую ты мог вложить в следующую квартиру*",
+        }
+    }
+    
+    # Мультипликаторы для площади (база = 50-80 м²)
+    AREA_MULTIPLIERS = {
+        "small": 0.6,      # до 50 м²
+        "medium": 1.0,     # 50-80 м²
+        "large": 1.3,      # 80-120 м²
+        "xlarge": 1.7,     # 120+ м²
+        "unknown": 1.0,
+    }
+    
+    # Мультипликаторы для контроля
+    CONTROL_MULTIPLIERS = {
+        "self": 1.4,       # сам/сама
+        "foreman": 1.0,    # прораб
+        "nobody": 1.8,     # никто
+        "unknown": 1.5,    # не думал(а)
+        "skip": 1.0,       # если вопрос пропущен
+    }
+    
+    # Мультипликаторы для фиксации
+    FIXATION_MULTIPLIERS = {
+        "full": 0.9,           # полностью зафиксировано
+        "partial": 1.0,        # частично
+        "none": 1.3,           # никак
+        "planned_full": 1.0,   # планирую фиксировать всё
+        "planned_none": 1.4,   # не думал(а) об этом
+        "skip": 1.0,           # если вопрос пропущен
+    }
+    
+    # Ключевая контрольная точка для каждой стадии
+    CHECKPOINTS = {
+        "not_started": "📝 Детальное ТЗ + прописанный договор с ответственностью",
+        "demolition": "📸 Фотофиксация ДО/ПОСЛЕ + акт скрытых работ",
+        "rough": "📐 Лазерный уровень + проверка СНИПов + фото всех узлов",
+        "finishing": "🔍 Проверка стыков + тест на адгезию + поэтапная оплата",
+        "living": "⚖️ Гарантийные акты + тесты под нагрузкой + видеофиксация состояния"
+    }
+    
+    # Предрасчитанные результаты по (stage, area, control, fixation), заполняется при импорте
+    LOSS_TABLE: Mapping[LossKey, Mapping] = MappingProxyType({})
+    
+    @staticmethod
+    def get_stage_code(text: str) -> str:
+        mapping = {
+            "Ещё не начали (только планирую)": "not_started",
+            "Демонтаж (ломаем, убираем старое)": "demolition",
+            "Черновые работы (штукатурка, электрика)": "rough",
+            "Чистовая отделка (плитка, обои, покраска)": "finishing",
+            "Уже живём после ремонта": "living"
+        }
+        return mapping.get(text, "not_started")
+    
+    @staticmethod
+    def get_area_code(text: str) -> str:
+        mapping = {
+            "До 50 м² (студия/1-комнатная)": "small",
+            "50-80 м² (2-комнатная)": "medium",
+            "80-120 м² (3-комнатная)": "large",
+            "120+ м² (4+ комнат/дом)": "xlarge",
+            "Не знаю точно": "unknown"
+        }
+        return mapping.get(text, "unknown")
+    
+    @staticmethod
+    def get_control_code(text: str) -> str:
+        mapping = {
+            "Я сам/сама (но не специалист)": "self",
+            "Прораб/подрядчик (он отвечает за всё)": "foreman",
+            "Никто толком не контролирует": "nobody",
+            "Не думал(а) об этом": "unknown",
+            "Уже поздно (ремонт закончен)": "skip"
+        }
+        return mapping.get(text, "unknown")
+    
+    @staticmethod
+    def get_fixation_code(text: str, stage: str = "not_started") -> str:
+        if stage == "not_started":
+            mapping = {
+                "Планирую фиксировать всё фото/видео": "planned_full",
+                "Ещё не думал(а) об этом": "planned_none"
+            }
+        elif stage == "living":
+            mapping = {
+                "Были зафиксированы фото/видео": "full",
+                "Фотографировали частично": "partial",
+                "Ничего не фиксировали": "none",
+                "Не помню/не знаю": "planned_none"
+            }
+        else:
+            mapping = {
+                "Зафиксированы фото/видео полностью": "full",
+                "Фотографировал(а) частично": "partial",
+                "Никак не фиксировались, надеюсь на мастеров": "none"
+            }
+        return mapping.get(text, "planned_none")
+    
+    @classmethod
+    def should_skip_control(cls, stage: str) -> bool:
+        """Нужно ли пропускать вопрос о контроле для этой стадии"""
+        stage_data = cls.STAGE_BASE_LOSSES.get(stage)
+        return stage_data.get("skip_control", False) if stage_data else False
+    
+    @classmethod
+    def should_skip_fixation(cls, stage: str) -> bool:
+        """Нужно ли пропускать вопрос о фиксации для этой стадии"""
+        stage_data = cls.STAGE_BASE_LOSSES.get(stage)
+        return stage_data.get("skip_fixation", False) if stage_data else False
+    
+    @classmethod
+    def calculate_intelligent_loss(cls, stage: str, area: str, control: str, fixation: str) -> Mapping:
+        """Умный расчёт потерь с учётом всех факторов (готовый результат из таблицы)"""
+        result = cls.LOSS_TABLE.get((stage, area, control, fixation))
+        if result is None:
+            # Неизвестный код — считаем так же, как для таблицы, с подстановкой значений по умолчанию
+            result = _freeze(cls.compute_loss(stage, area, control, fixation))
+        return result
+    
+    @classmethod
+    def compute_loss(cls, stage: str, area: str, control: str, fixation: str) -> dict:
+        """Прямой расчёт потерь без таблицы (эталон для предрасчёта)"""
+        stage_data = cls.STAGE_BASE_LOSSES.get(stage, cls.STAGE_BASE_LOSSES["not_started"])
+        
+        # Базовые значения
+        base_min, base_max = stage_data["base_range"]
+        base_avg = (base_min + base_max) / 2
+        
+        # Мультипликаторы
+        area_mult = cls.AREA_MULTIPLIERS.get(area, 1.0)
+        
+        # Если контроль пропущен (для стадии "living")
+        if control == "skip":
+            control_mult = cls.CONTROL_MULTIPLIERS["skip"]
+        else:
+            control_mult = cls.CONTROL_MULTIPLIERS.get(control, 1.0)
+        
+        # Если фиксация пропущена (для стадии "not_started")
+        if fixation == "skip":
+            fixation_mult = cls.FIXATION_MULTIPLIERS["skip"]
+        else:
+            fixation_mult = cls.FIXATION_MULTIPLIERS.get(fixation, 1.0)
+        
+        # Комбинированный мультипликатор
+        total_mult = area_mult * control_mult * fixation_mult
+        
+        # Итоговые потери (в тыс ₽)
+        loss_min = base_min * total_mult
+        loss_max = base_max * total_mult
+        loss_avg = base_avg * total_mult
+        
+        # Округление до тысяч
+        loss_min = round(loss_min) * 1000
+        loss_max = round(loss_max) * 1000
+        loss_avg = round(loss_avg) * 1000
+        
+        # Выбор персонализированных примеров
+        examples = stage_data["examples"]
+        if stage == "not_started" and control == "self":
+            examples = [
+                ("Самоконтроль без знаний", "80-200 тыс ₽", "Не заметил ошибок вовремя"),
+                ("Нет технической экспертизы", "50-150 тыс ₽", "Принял некачественную работу"),
+            ] + examples[:1]
+        
+        # Эмоциональный якорь
+        emotional_hook = stage_data["emotional_hook"]
+        
+        # Ключевая контрольная точка
+        checkpoint = cls.CHECKPOINTS.get(stage, "Регулярный контроль всех этапов")
+        
+        return {
+            "min": loss_min,
+            "max": loss_max,
+            "avg": loss_avg,
+            "stage_name": stage_data["name"],
+            "examples": examples,
+            "emotional_hook": emotional_hook,
+            "checkpoint": checkpoint,
+            "multipliers": {
+                "area": area_mult,
+                "control": control_mult,
+                "fixation": fixation_mult,
+                "total": round(total_mult, 2)
+            }
+        }
+    
+    @classmethod
+    def build_loss_table(cls) -> Mapping[LossKey, Mapping]:
+        """Рассчитать все сочетания кодов ответов"""
+        table: Dict[LossKey, Mapping] = {}
+        for key in product(cls.STAGE_BASE_LOSSES, cls.AREA_MULTIPLIERS,
+                           cls.CONTROL_MULTIPLIERS, cls.FIXATION_MULTIPLIERS):
+            table[key] = _freeze(cls.compute_loss(*key))
+        return MappingProxyType(table)
+    
+    @classmethod
+    def calculate_loss_batch(cls, stages, areas, controls, fixations) -> Dict[str, "np.ndarray"]:
+        """Векторный расчёт min/avg/max для массивов кодов ответов (нужен numpy).
+
+        Использует те же таблицы и тот же порядок операций, что и
+        compute_loss, поэтому результат совпадает с ним поэлементно.
+        """
+        try:
+            import numpy as np
+        except ImportError as e:
+            raise ImportError("Для пакетного расчёта нужен numpy: pip install numpy") from e
+
+        stage_codes = list(cls.STAGE_BASE_LOSSES)
+        base = np.array([cls.STAGE_BASE_LOSSES[code]["base_range"] for code in stage_codes], dtype=np.float64)
+        base_min, base_max = base[:, 0], base[:, 1]
+        base_avg = (base_min + base_max) / 2
+
+        stage_idx = _code_indices(np, stages, stage_codes, default=stage_codes.index("not_started"))
+        area_mult = _multipliers(np, areas, cls.AREA_MULTIPLIERS)
+        control_mult = _multipliers(np, controls, cls.CONTROL_MULTIPLIERS)
+        fixation_mult = _multipliers(np, fixations, cls.FIXATION_MULTIPLIERS)
+
+        # Тот же порядок умножений, что и в compute_loss: (area * control) * fixation
+        total_mult = area_mult * control_mult * fixation_mult
+
+        # np.round, как и round(), округляет половины к чётному
+        return {
+            "min": np.round(base_min[stage_idx] * total_mult).astype(np.int64) * 1000,
+            "avg": np.round(base_avg[stage_idx] * total_mult).astype(np.int64) * 1000,
+            "max": np.round(base_max[stage_idx] * total_mult).astype(np.int64) * 1000,
+        }
+    
+    @staticmethod
+    def format_money(amount: float) -> str:
+        """Форматирование суммы денег"""
+        if amount >= 1000000:
+            return f"{amount/1000000:.1f} млн ₽"
+        elif amount >= 100000:
+            return f"{int(amount/1000)} тыс ₽"
+        elif amount >= 1000:
+            return f"{int(amount/1000)} тыс ₽"
+        else:
+            return f"{int(amount)} ₽"
+
+
+def _code_indices(np, values, codes: list, default: int):
+    """Индексы кодов в списке codes; неизвестные коды получают default"""
+    values = np.asarray(values)
+    indices = np.full(values.shape, default, dtype=np.intp)
+    # Кодов не больше шести: несколько векторных сравнений дешевле сортировки строк
+    for i, code in enumerate(codes):
+        indices[values == code] = i
+    return indices
+
+
+def _multipliers(np, values, table: Dict[str, float]):
+    """Массив мультипликаторов; неизвестный код даёт 1.0, как table.get(code, 1.0)"""
+    codes = list(table)
+    factors = np.array([table[code] for code in codes] + [1.0], dtype=np.float64)
+    return factors[_code_indices(np, values, codes, default=len(codes))]
+
+
+def _freeze(result: dict) -> Mapping:
+    """Неизменяемая копия результата: таблица общая для всех пользователей"""
+    frozen = dict(result)
+    frozen["examples"] = tuple(result["examples"])
+    frozen["multipliers"] = MappingProxyType(dict(result["multipliers"]))
+    return MappingProxyType(frozen)
+
+
+IntelligentLossCalculator.LOSS_TABLE = IntelligentLossCalculator.build_loss_table()
+
+calculator = IntelligentLossCalculator()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Склейка ответов одного обработчика
+Пока обработчик работает, его отправки через MessagePacer копятся
+в буфере; после него подряд идущие сообщения в один чат склеиваются
+в как можно меньшее число сообщений до лимита Telegram в 4096 символов
+"""
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.methods import SendMessage
+from aiogram.types import InlineKeyboardMarkup, TelegramObject
+
+from pacing import Job, MessagePacer, turn_buffer
+
+MESSAGE_LIMIT = 4096
+SEPARATOR = "\n\n"
+
+
+def _joinable(first: SendMessage, second: SendMessage) -> bool:
+    """Можно ли дописать second в first, не меняя того, что увидит пользователь"""
+    # Inline-кнопки привязаны к своему сообщению — после них склейка рвётся
+    if isinstance(first.reply_markup, InlineKeyboardMarkup):
+        return False
+    if len(first.text) + len(SEPARATOR) + len(second.text) > MESSAGE_LIMIT:
+        return False
+    # Остальные параметры (чат, разметка, превью...) должны совпадать
+    exclude = {"text", "reply_markup"}
+    return first.model_dump(exclude=exclude) == second.model_dump(exclude=exclude)
+
+
+def merge(items: List[Tuple[int, Job, float]]) -> List[Tuple[int, Job, float]]:
+    """Склеить соседние SendMessage одного чата.
+
+    Склеенное сообщение уходит с паузой первого и клавиатурой последнего
+    из склеенных (у кого она есть); прочие задачи (анимации, правки)
+    остаются на своих местах и разделяют склейку.
+    """
+    merged: List[Tuple[int, Job, float]] = []
+    for chat_id, job, delay in items:
+        if merged and isinstance(job, SendMessage):
+            last_chat, last_job, last_delay = merged[-1]
+            if last_chat == chat_id and isinstance(last_job, SendMessage) and _joinable(last_job, job):
+                joined = last_job.model_copy(update={
+                    "text": last_job.text + SEPARATOR + job.text,
+                    "reply_markup": job.reply_markup if job.reply_markup is not None else last_job.reply_markup,
+                })
+                merged[-1] = (chat_id, joined, last_delay)
+                continue
+        merged.append((chat_id, job, delay))
+    return merged
+
+
+class CoalesceMiddleware(BaseMiddleware):
+    """Middleware обработчиков: буферизует отправки хода и отдаёт их планировщику склеенными"""
+
+    def __init__(self, pacer: MessagePacer):
+        self.pacer = pacer
+        self.buffered = 0
+        self.sent = 0
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        if turn_buffer.get() is not None:
+            # Вложенный вызов — буфер уже открыт внешним ходом
+            return await handler(event, data)
+        buffer: List[Tuple[int, Job, float]] = []
+        token = turn_buffer.set(buffer)
+        try:
+            return await handler(event, data)
+        finally:
+            turn_buffer.reset(token)
+            self.flush(buffer)
+
+    def flush(self, buffer: List[Tuple[int, Job, float]]) -> None:
+        merged = merge(buffer)
+        self.buffered += len(buffer)
+        self.sent += len(merged)
+        for chat_id, job, delay in merged:
+            self.pacer.enqueue(chat_id, job, delay)
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        return {"buffered": self.buffered, "sent": self.sent,
+                "ratio": self.sent / self.buffered if self.buffered else None}
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Контроль флуд-лимитов Telegram для всех исходящих запросов бота
+Middleware сессии: каждый запрос с chat_id проходит через бакет чата
+и общий бакет бота, а ответ 429 выдерживает retry_after и повторяется
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, SendChatAction, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота, ~1 в секунду в личный
+# чат (с небольшими всплесками) и 20 в минуту в группу
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+PRIVATE_RATE = 1.0
+PRIVATE_BURST = 3
+GROUP_RATE = 20 / 60
+GROUP_BURST = 3
+
+# Бакет, который не трогали дольше этого, снова полон — его можно забыть
+IDLE_BUCKET_TTL = 60.0
+
+
+class TokenBucket:
+    """Бакет с резервированием: токен берётся сразу, даже в долг.
+
+    Долг превращается во время ожидания, поэтому очередь к бакету
+    обслуживается строго по порядку обращения без блокировок.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = now
+
+    def reserve(self, now: float) -> float:
+        """Занять токен; вернуть, сколько секунд ждать до отправки"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= 1
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def refund(self) -> None:
+        """Вернуть токен запроса, который так и не ушёл (отменён, пока ждал очереди)"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block(self, until: float) -> None:
+        """Не отправлять ничего до until (ответ 429 с retry_after).
+
+        Бакет "переносится в будущее": к моменту until в нём ровно один
+        токен, и следующие запросы после паузы снова идут с интервалом.
+        """
+        if until > self.updated:
+            self.tokens = 1.0
+            self.updated = until
+
+
+class FloodControl(BaseRequestMiddleware):
+    """Очередь исходящих запросов с бакетами на чат и на бота и повтором после 429"""
+
+    def __init__(self, global_rate: float = GLOBAL_RATE, global_burst: int = GLOBAL_BURST,
+                 private_rate: float = PRIVATE_RATE, private_burst: int = PRIVATE_BURST,
+                 group_rate: float = GROUP_RATE, group_burst: int = GROUP_BURST, max_retries: int = 3):
+        self.private = (private_rate, private_burst)
+        self.group = (group_rate, group_burst)
+        self.max_retries = max_retries
+        self.global_bucket = TokenBucket(global_rate, global_burst, time.monotonic())
+        self._chats: Dict[int, TokenBucket] = {}
+        self._last_sweep = time.monotonic()
+        # Метрики
+        self.waiting = 0
+        self.max_waiting = 0
+        self.sent = 0
+        self.delayed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.flood_errors = 0
+        self.dropped = 0
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        chat_id = self._chat_id(method)
+        attempt = 0
+        while True:
+            await self._acquire(chat_id)
+            try:
+                response = await make_request(bot, method)
+                self.sent += 1
+                return response
+            except TelegramRetryAfter as e:
+                self.flood_errors += 1
+                until = time.monotonic() + e.retry_after
+                bucket = self._bucket(chat_id, time.monotonic()) if chat_id is not None else self.global_bucket
+                bucket.block(until)
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.dropped += 1
+                    raise
+                logger.warning(f"429 от Telegram для {method.__api_method__} в чат {chat_id}: "
+                               f"жду {e.retry_after} с (попытка {attempt}/{self.max_retries})")
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self.waiting, "queue_depth_max": self.max_waiting,
+            "sent": self.sent, "delayed": self.delayed,
+            "wait_avg": self.wait_total / self.delayed if self.delayed else 0.0,
+            "wait_max": self.wait_max, "flood_errors": self.flood_errors,
+            "dropped": self.dropped, "chats_tracked": len(self._chats),
+        }
+
+    # ---------- бакеты ----------
+    @staticmethod
+    def _chat_id(method: TelegramMethod) -> Optional[int]:
+        """Чат, на который действует лимит; индикатор "печатает..." не лимитируем"""
+        if isinstance(method, SendChatAction):
+            return None
+        chat_id = getattr(method, "chat_id", None)
+        return chat_id if isinstance(chat_id, int) else None
+
+    def _bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            rate, burst = self.group if chat_id < 0 else self.private
+            bucket = self._chats[chat_id] = TokenBucket(rate, burst, now)
+        return bucket
+
+    async def _acquire(self, chat_id: Optional[int]):
+        """Дождаться токена чата, затем общего токена бота"""
+        started = time.monotonic()
+        self._sweep(started)
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        reserved = []
+        try:
+            if chat_id is not None:
+                bucket = self._bucket(chat_id, started)
+                wait = bucket.reserve(started)
+                reserved.append(bucket)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            now = time.monotonic()
+            wait = self.global_bucket.reserve(now)
+            reserved.append(self.global_bucket)
+            if wait > 0:
+                await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # pacer.cancel() или /start отменили отправку — занятые токены возвращаются,
+            # иначе следующие сообщения чата ждали бы за несуществующие
+            for bucket in reserved:
+                bucket.refund()
+            raise
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - started
+        if waited > 0.001:
+            self.delayed += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def _sweep(self, now: float):
+        """Забыть бакеты чатов, которые давно молчат (они уже полны)"""
+        if now - self._last_sweep < IDLE_BUCKET_TTL:
+            return
+        self._last_sweep = now
+        stale = [chat_id for chat_id, bucket in self._chats.items() if now - bucket.updated > IDLE_BUCKET_TTL]
+        for chat_id in stale:
+            del self._chats[chat_id]
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Постоянное FSM-хранилище для aiogram на SQLite
+Состояния и данные читаются из памяти процесса, а изменения
+сливаются по ключу и пачками записываются в файл в фоне
+"""
+
+import asyncio
+import copy
+import json
+import logging
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Set, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteFSMStorage(BaseStorage):
+    """FSM-хранилище в файле SQLite с кэшем чтения и слиянием записей.
+
+    Каждый ключ держится в памяти как [state, data]; при изменении
+    ключ помечается грязным, и раз в flush_interval секунд в файл
+    уходит только последнее значение каждого ключа одной транзакцией.
+    Кэш ограничен max_cached ключами в порядке последнего обращения:
+    вытесняются только уже записанные, а очищенные ключи ([None, {}])
+    после записи сразу забываются. Данные отдаются и принимаются глубокими
+    копиями: вложенные списки и словари вызывающего не меняют кэш в обход записи.
+    """
+
+    def __init__(self, path: str = "fsm.db", flush_interval: float = 0.2,
+                 key_builder: Optional[KeyBuilder] = None, max_cached: int = 100_000):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_cached = max_cached
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        # Все обращения к файлу — из одного потока со своим соединением
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-db")
+        self._conn: Optional[sqlite3.Connection] = None
+        # Ключ кэша — сам StorageKey: строка для файла строится только при записи и промахе
+        self._cache: "OrderedDict[StorageKey, List[Any]]" = OrderedDict()
+        self._dirty: Set[StorageKey] = set()
+        # Ключи, которые сейчас пишутся: не вытесняются, пока запись не удалась
+        self._inflight: Set[StorageKey] = set()
+        self._flusher: Optional[asyncio.Task] = None
+
+    # ---------- интерфейс BaseStorage ----------
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._mark_dirty(key)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._record(key)
+        record[1] = copy.deepcopy(dict(data))
+        self._mark_dirty(key)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._record(key))[1])
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+        record = await self._record(key)
+        record[1].update(copy.deepcopy(dict(data)))
+        self._mark_dirty(key)
+        return copy.deepcopy(record[1])
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        await self._run(self._close_connection)
+        self._executor.shutdown(wait=True)
+
+    # ---------- запись ----------
+    async def flush(self) -> None:
+        """Записать последние значения всех изменённых ключей"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        self._inflight |= dirty
+        upserts: List[Tuple[str, Optional[str], str]] = []
+        deletes: List[Tuple[str]] = []
+        for key in dirty:
+            state, data = self._cache[key]
+            name = self.key_builder.build(key)
+            if state is None and not data:
+                deletes.append((name,))
+            else:
+                upserts.append((name, state, json.dumps(data, ensure_ascii=False)))
+        try:
+            await self._run(self._write_batch, upserts, deletes)
+        except Exception as e:
+            logger.error(f"Ошибка записи FSM ({len(dirty)} ключей): {e}")
+            self._dirty |= dirty
+            return
+        finally:
+            self._inflight -= dirty
+        # Удалённые из файла ключи не держим и в памяти, если их не тронули за время записи
+        for key in dirty:
+            record = self._cache.get(key)
+            if record is not None and key not in self._dirty and record[0] is None and not record[1]:
+                del self._cache[key]
+        self._evict_clean()
+
+    def _mark_dirty(self, key: StorageKey):
+        self._dirty.add(key)
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    # ---------- чтение ----------
+    async def _record(self, key: StorageKey) -> List[Any]:
+        record = self._cache.get(key)
+        if record is not None:
+            self._cache.move_to_end(key)
+            return record
+        row = await self._run(self._read, self.key_builder.build(key))
+        # Пока читали файл, ключ мог появиться в кэше
+        record = self._cache.get(key)
+        if record is None:
+            record = self._cache[key] = [row[0], json.loads(row[1])] if row else [None, {}]
+            self._evict_clean()
+        return record
+
+    def _evict_clean(self):
+        """Вытеснить самые давние записанные ключи сверх max_cached.
+
+        Последний ключ (только что прочитанный) не трогаем: вызывающий
+        сейчас изменит его запись.
+        """
+        excess = len(self._cache) - self.max_cached
+        if excess <= 0:
+            return
+        last = next(reversed(self._cache))
+        clean = []
+        for key in self._cache:
+            if key not in self._dirty and key not in self._inflight and key != last:
+                clean.append(key)
+                if len(clean) == excess:
+                    break
+        for key in clean:
+            del self._cache[key]
+
+    # ---------- поток БД ----------
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            # timeout: файл может быть общим для нескольких процессов-воркеров
+            self._conn = sqlite3.connect(self.path, timeout=10.0)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS fsm (key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL)"
+            )
+        return self._conn
+
+    def _read(self, name: str) -> Optional[Tuple[Optional[str], str]]:
+        return self._connection().execute("SELECT state, data FROM fsm WHERE key = ?", (name,)).fetchone()
+
+    def _write_batch(self, upserts, deletes):
+        conn = self._connection()
+        with conn:
+            if upserts:
+                conn.executemany("INSERT OR REPLACE INTO fsm (key, state, data) VALUES (?, ?, ?)", upserts)
+            if deletes:
+                conn.executemany("DELETE FROM fsm WHERE key = ?", deletes)
+
+    def _close_connection(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+База знаний для AI-консультации
+knowledge_base.json загружается в инвертированный индекс, вопросы
+пользователя ранжируются по BM25 на нормализованных русских токенах.
+Изменения файла подхватываются на лету: новый индекс строится в фоне
+и подменяется одной ссылкой. Для быстрого старта индекс можно заранее
+скомпилировать в бинарный снимок; сборка заодно проверяет, что каждый
+вопрос базы находит свой ответ:
+
+    python knowledge.py [knowledge_base.json] [knowledge_base.kbs]
+"""
+
+import bisect
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import random
+import re
+import struct
+import sys
+import threading
+from array import array
+from collections.abc import Sequence
+from typing import Callable, Dict, FrozenSet, List, NamedTuple, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ============ НОРМАЛИЗАЦИЯ ============
+TOKEN_RE = re.compile(r"[a-zа-я0-9]+")
+
+STOP_WORDS = frozenset("""
+а без более бы был была были было быть в вам вас весь во вот все всё всего всех вы где да даже
+для до его ее её если есть еще ещё же за здесь и из или им их к как когда кто ли либо мне мной
+мы на над нам нас не него нее неё нет ни них но ну о об однако он она они оно от очень по под
+после при про с со так также такой там те тем то того тоже той только том ты у уже чем что
+чтобы эта эти это этот я мой моя мое моё мои твой твоя наш ваш себя свой какой какая какое какие
+каким каких какую
+""".split())
+
+# Окончания от длинных к коротким; основа короче MIN_STEM не обрезается
+ENDINGS = tuple(sorted("""
+иями ями ами ого его ому ему ыми ими ией ией ости ость ться тся ешь ете ишь ите ует уют ают яют ал ала али ало
+ий ый ой ая яя ое ее ие ые ую юю ом ем ам ям ах ях ов ев ей ию ия ью ть ет ит ут ют ат ят им ым их ых
+а я о е ы и у ю ь й
+""".split(), key=len, reverse=True))
+MIN_STEM = 3
+
+
+def stem(word: str) -> str:
+    """Лёгкий стеммер: отрезает одно самое длинное окончание"""
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def normalize(text: str) -> str:
+    return text.lower().replace("ё", "е")
+
+
+def tokenize(text: str) -> List[str]:
+    """Нормализованные токены без стоп-слов"""
+    return [stem(token) for token in TOKEN_RE.findall(normalize(text)) if token not in STOP_WORDS]
+
+
+def question_key(tokens: List[str]) -> str:
+    """Ключ вопроса без учёта порядка и повторов слов и без стоп-слов"""
+    return " ".join(sorted(set(tokens)))
+
+
+# ============ НАМЕРЕНИЯ ============
+class IntentMatcher:
+    """Автомат Ахо-Корасик по всем фразам из patterns.
+
+    Строится один раз при загрузке; поиск всех намерений — один проход
+    по тексту, время линейно по длине сообщения и не зависит от числа фраз.
+    Фраза должна начинаться с начала слова; короткие фразы (до SHORT
+    символов) ещё и заканчиваться на границе слова, чтобы "hi" не
+    находилось внутри "this", а "спасибо" находилось в "спасибочки".
+    """
+
+    SHORT = 3
+
+    def __init__(self, patterns: Dict[str, List[str]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        # Выходы узла: (намерение, длина фразы, нужна ли граница справа)
+        self.output: List[List[Tuple[str, int, bool]]] = [[]]
+        for intent, phrases in patterns.items():
+            for phrase in phrases:
+                phrase = normalize(phrase).strip()
+                if phrase:
+                    self._add(intent, phrase)
+        self.fail = self._link()
+
+    def _add(self, intent: str, phrase: str):
+        node = 0
+        for char in phrase:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = self.goto[node][char] = len(self.goto)
+                self.goto.append({})
+                self.output.append([])
+            node = child
+        self.output[node].append((intent, len(phrase), len(phrase) <= self.SHORT))
+
+    def _link(self) -> List[int]:
+        """Суффиксные ссылки обходом в ширину; выходы наследуются по ним"""
+        fail = [0] * len(self.goto)
+        queue = list(self.goto[0].values())
+        for node in queue:
+            for char, child in self.goto[node].items():
+                state = fail[node]
+                while state and char not in self.goto[state]:
+                    state = fail[state]
+                target = self.goto[state].get(char, 0)
+                fail[child] = target if target != child else 0
+                self.output[child] = self.output[child] + self.output[fail[child]]
+                queue.append(child)
+        return fail
+
+    def match(self, text: str) -> FrozenSet[str]:
+        """Все намерения, фразы которых встречаются в тексте"""
+        text = normalize(text)
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for intent, length, strict in output[state]:
+                start = end - length + 1
+                if start and text[start - 1].isalnum():
+                    continue
+                if strict and end + 1 < len(text) and text[end + 1].isalnum():
+                    continue
+                found.add(intent)
+        return frozenset(found)
+
+
+# ============ ПРОВЕРКА ============
+def validate(data) -> None:
+    """Проверка структуры knowledge_base.json; ValueError с причиной при ошибке"""
+    if not isinstance(data, dict):
+        raise ValueError("корень должен быть объектом")
+    categories = data.get("categories")
+    if not isinstance(categories, dict) or not categories:
+        raise ValueError("нет категорий")
+    for name, content in categories.items():
+        for field in ("questions", "answers"):
+            texts = content.get(field) if isinstance(content, dict) else None
+            if not isinstance(texts, list) or not texts or not all(isinstance(t, str) and t.strip() for t in texts):
+                raise ValueError(f"categories.{name}.{field}: нужен непустой список строк")
+    for section in ("patterns", "generic_responses"):
+        groups = data.get(section, {})
+        if not isinstance(groups, dict):
+            raise ValueError(f"{section} должен быть объектом")
+        for name, texts in groups.items():
+            if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+                raise ValueError(f"{section}.{name}: нужен список строк")
+    if not data.get("generic_responses", {}).get("unknown"):
+        raise ValueError("generic_responses.unknown пуст")
+
+
+# ============ ИНДЕКС ============
+# Порог уверенности ответа по умолчанию: вопросы самой базы набирают от 0.8,
+# посторонние ("сколько стоит айфон") — не больше 0.5
+MIN_SCORE = 0.6
+
+
+class KnowledgeAnswer(NamedTuple):
+    text: str
+    category: str
+    score: float  # уверенность от 0 до 1 (см. KnowledgeIndex.search)
+
+
+def question_owners(answers: List[List[str]], tokens: List[str]) -> List[int]:
+    """Номера ответов категории, за которыми закреплён вопрос с токенами tokens.
+
+    Ответы с наибольшим числом общих токенов, если общих хотя бы половина,
+    иначе — первый (обзорный) ответ категории.
+    """
+    unique = set(tokens)
+    overlaps = [len(unique.intersection(answer)) for answer in answers]
+    best = max(overlaps)
+    if best * 2 < len(unique) or best == 0:
+        return [0]
+    return [answer_id for answer_id, overlap in enumerate(overlaps) if overlap == best]
+
+
+class KnowledgeIndex:
+    """Неизменяемый BM25-индекс по ответам базы знаний.
+
+    Документ — текст ответа и вопросы, на которые он отвечает (см.
+    question_owners). Остальные вопросы категории входят в документ с
+    весом CATEGORY_WEIGHT: тему они подсказывают, но ответ внутри неё не
+    перевешивают. Сами вопросы из базы сверх того лежат в questions
+    (ключ вопроса -> документ) и находят свой ответ без ранжирования:
+    похожие формулировки разных категорий ("подрядчик пропал" и
+    "рабочие пропали") BM25 не всегда разводит.
+    Постинги лежат плоскими массивами: для термина t это позиции
+    offsets[t]..offsets[t + 1] в doc_ids и tfs (tf — взвешенная частота).
+    Те же массивы записываются в снимок и читаются из него через mmap
+    без копирования.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    # Вес вопросов категории, не закреплённых за ответом
+    CATEGORY_WEIGHT = 0.2
+    # Термин с более длинным списком постингов только дополняет оценки уже
+    # найденных кандидатов: "ремонт" есть почти в каждом документе, и обход
+    # всех его постингов на большой базе стоил бы дороже самого поиска
+    MAX_POSTINGS = 512
+
+    def __init__(self, terms: Dict[str, int], offsets, doc_ids, tfs, idf, norm,
+                 docs: Sequence[Tuple[str, str]], questions: Dict[str, int],
+                 patterns: Dict[str, List[str]], generic: Dict[str, List[str]]):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.tfs = tfs
+        self.idf = idf
+        # Знаменатель BM25 без tf, заранее для каждого документа
+        self.norm = norm
+        self.docs = docs  # (категория, текст ответа)
+        self.questions = questions
+        # idf слова, которого нет ни в одном документе (см. search)
+        self.unknown_idf = math.log(1 + (len(docs) + 0.5) / 0.5)
+        self.patterns = patterns
+        self.generic = generic
+        self.intents = IntentMatcher(patterns)
+
+    @classmethod
+    def from_data(cls, data: Dict) -> "KnowledgeIndex":
+        docs: List[Tuple[str, str]] = []
+        doc_weights: List[Dict[str, float]] = []
+        # (токены, документы-владельцы) каждого вопроса в порядке базы
+        curated: List[Tuple[List[str], List[int]]] = []
+        for category, content in data["categories"].items():
+            answers = [tokenize(answer) for answer in content["answers"]]
+            owned: List[List[str]] = [list(tokens) for tokens in answers]
+            category_counts: Dict[str, float] = {}
+            for question in content["questions"]:
+                tokens = tokenize(question)
+                for token in tokens:
+                    category_counts[token] = category_counts.get(token, 0.0) + cls.CATEGORY_WEIGHT
+                owners = question_owners(answers, tokens)
+                for answer_id in owners:
+                    owned[answer_id].extend(tokens)
+                if tokens:
+                    curated.append((tokens, [len(docs) + answer_id for answer_id in owners]))
+            for answer, tokens in zip(content["answers"], owned):
+                weights = dict(category_counts)
+                for token in tokens:
+                    weights[token] = weights.get(token, 0.0) + 1.0
+                docs.append((category, answer))
+                doc_weights.append(weights)
+
+        # Токен -> [(номер документа, вес)], затем в плоские массивы
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for doc_id, weights in enumerate(doc_weights):
+            for token, tf in weights.items():
+                postings.setdefault(token, []).append((doc_id, tf))
+
+        total = len(docs)
+        terms: Dict[str, int] = {}
+        offsets, doc_ids, tfs, idf = array("I", [0]), array("I"), array("d"), array("d")
+        for token, entries in postings.items():
+            terms[token] = len(terms)
+            for doc_id, tf in entries:
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+            offsets.append(len(doc_ids))
+            idf.append(math.log(1 + (total - len(entries) + 0.5) / (len(entries) + 0.5)))
+
+        lengths = [sum(weights.values()) for weights in doc_weights]
+        avg_len = sum(lengths) / len(lengths) if lengths else 1.0
+        norm = array("d", (cls.K1 * (1 - cls.B + cls.B * length / avg_len) for length in lengths))
+
+        patterns = {kind: list(phrases) for kind, phrases in data.get("patterns", {}).items()}
+        generic = {kind: list(texts) for kind, texts in data.get("generic_responses", {}).items()}
+        index = cls(terms, offsets, doc_ids, tfs, idf, norm, docs, {}, patterns, generic)
+        for tokens, owners in curated:
+            # Из нескольких владельцев вопроса — лучший по BM25; повтор вопроса в
+            # другой категории не перебивает первый (его покажет unresolved_questions)
+            if len(owners) > 1:
+                scores = index._rank(set(tokens))[0]
+                owners = sorted(owners, key=lambda doc_id: -scores.get(doc_id, 0.0))
+            index.questions.setdefault(question_key(tokens), owners[0])
+        return index
+
+    @classmethod
+    def from_file(cls, path: str) -> "KnowledgeIndex":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        validate(data)
+        return cls.from_data(data)
+
+    def search(self, question: str) -> Optional[KnowledgeAnswer]:
+        """Лучший ответ или None, если ни один токен не найден.
+
+        score — уверенность от 0 до 1: BM25 ответа, делённый на сумму idf
+        слов вопроса. Ответ, в котором каждое слово вопроса встречается
+        один раз при средней длине, даёт около 1; слово, которого в базе
+        нет, входит в сумму с наибольшим idf и снижает уверенность.
+        Вопрос из самой базы (по question_key) получает свой ответ с 1.0.
+
+        Термины обходятся от редких к частым. Частый термин (длиннее
+        MAX_POSTINGS) не добавляет новых кандидатов, а только дополняет
+        оценки найденных: его вклад ищется бинарным поиском в постингах.
+        Если редких терминов в вопросе нет, полностью обходится самый
+        редкий из частых.
+        """
+        tokens = tokenize(question)
+        doc_id = self.questions.get(question_key(tokens))
+        if doc_id is not None:
+            category, text = self.docs[doc_id]
+            return KnowledgeAnswer(text, category, 1.0)
+        unique = set(tokens)
+        scores, found = self._rank(unique)
+        if not scores:
+            return None
+        doc_id = max(scores, key=scores.get)
+        category, text = self.docs[doc_id]
+        total_idf = sum(self.idf[term] for _, term in found) + self.unknown_idf * (len(unique) - len(found))
+        return KnowledgeAnswer(text, category, min(1.0, scores[doc_id] / total_idf))
+
+    def _rank(self, unique: Set[str]) -> Tuple[Dict[int, float], List[Tuple[int, int]]]:
+        """BM25 документов-кандидатов и найденные термины (число постингов, термин)"""
+        terms, offsets, doc_ids, tfs, norm = self.terms, self.offsets, self.doc_ids, self.tfs, self.norm
+        k1 = self.K1 + 1
+        found = sorted((offsets[term + 1] - offsets[term], term)
+                       for term in (terms.get(token) for token in unique) if term is not None)
+        scores: Dict[int, float] = {}
+        for size, term in found:
+            idf = self.idf[term]
+            start, end = offsets[term], offsets[term + 1]
+            if size <= self.MAX_POSTINGS or not scores:
+                for pos in range(start, end):
+                    doc_id, tf = doc_ids[pos], tfs[pos]
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * k1 / (tf + norm[doc_id])
+                continue
+            for doc_id in scores:
+                pos = bisect.bisect_left(doc_ids, doc_id, start, end)
+                if pos < end and doc_ids[pos] == doc_id:
+                    tf = tfs[pos]
+                    scores[doc_id] += idf * tf * k1 / (tf + norm[doc_id])
+        return scores, found
+
+
+def unresolved_questions(data: Dict, index: KnowledgeIndex, min_score: float) -> List[str]:
+    """Вопросы базы, которые не находят закреплённый за ними ответ с уверенностью от min_score"""
+    failed = []
+    for category, content in data["categories"].items():
+        answers = [tokenize(answer) for answer in content["answers"]]
+        for question in content["questions"]:
+            expected = {content["answers"][answer_id] for answer_id in question_owners(answers, tokenize(question))}
+            found = index.search(question)
+            if found is None or found.category != category or found.text not in expected or found.score < min_score:
+                failed.append(f"{category}: {question}")
+    return failed
+
+
+# ============ СНИМОК ============
+# Снимок — скомпилированный индекс для быстрого старта: массивы постингов
+# отображаются в память как есть, токенизация при загрузке не нужна.
+# Версию увеличивать при любом изменении раскладки файла или токенизатора
+# (normalize, stem, STOP_WORDS): старые снимки тогда отбрасываются.
+SNAPSHOT_MAGIC = b"RKBS"
+SNAPSHOT_VERSION = 3
+# Магия, версия, sha256 исходного JSON, длина метаданных
+SNAPSHOT_HEADER = struct.Struct("<4sI32sQ")
+# Числовые секции в порядке записи
+SNAPSHOT_ARRAYS = (("offsets", "I"), ("doc_ids", "I"), ("tfs", "d"), ("idf", "d"),
+                   ("norm", "d"), ("text_offsets", "I"), ("doc_categories", "I"))
+
+
+def _align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+def source_digest(path: str) -> bytes:
+    """sha256 исходного JSON — по нему снимок проверяется на свежесть"""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).digest()
+
+
+class SnapshotDocs(Sequence):
+    """Тексты ответов из снимка: строка декодируется только при обращении"""
+
+    def __init__(self, blob: memoryview, offsets, doc_categories, categories: List[str]):
+        self.blob = blob
+        self.offsets = offsets
+        self.doc_categories = doc_categories
+        self.categories = categories
+
+    def __len__(self) -> int:
+        return len(self.doc_categories)
+
+    def __getitem__(self, doc_id: int) -> Tuple[str, str]:
+        text = bytes(self.blob[self.offsets[doc_id]:self.offsets[doc_id + 1]]).decode("utf-8")
+        return self.categories[self.doc_categories[doc_id]], text
+
+
+def write_snapshot(index: KnowledgeIndex, digest: bytes, path: str) -> None:
+    """Записать индекс в файл снимка (атомарно, через временный файл)"""
+    categories: List[str] = []
+    doc_categories, text_offsets, texts = array("I"), array("I", [0]), bytearray()
+    for category, text in index.docs:
+        if category not in categories:
+            categories.append(category)
+        doc_categories.append(categories.index(category))
+        texts += text.encode("utf-8")
+        text_offsets.append(len(texts))
+    # Токены состоят из [a-zа-я0-9], так что перевод строки — надёжный разделитель
+    terms = "\n".join(sorted(index.terms, key=index.terms.get)).encode("utf-8")
+
+    arrays = {"offsets": index.offsets, "doc_ids": index.doc_ids, "tfs": index.tfs, "idf": index.idf,
+              "norm": index.norm, "text_offsets": text_offsets, "doc_categories": doc_categories}
+    blobs: List[bytes] = []
+    sections: Dict[str, List[int]] = {}
+    offset = 0
+    for name, blob in [(name, array(code, arrays[name]).tobytes()) for name, code in SNAPSHOT_ARRAYS] + [
+            ("terms", terms), ("texts", bytes(texts))]:
+        sections[name] = [offset, len(blob)]
+        blobs.append(blob + b"\0" * (_align(len(blob)) - len(blob)))
+        offset += _align(len(blob))
+
+    meta = json.dumps({"sections": sections, "categories": categories, "patterns": index.patterns,
+                       "generic": index.generic, "questions": index.questions}, ensure_ascii=False).encode("utf-8")
+    head = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, digest, len(meta)) + meta
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(head + b"\0" * (_align(len(head)) - len(head)))
+        for blob in blobs:
+            f.write(blob)
+    os.replace(tmp_path, path)
+
+
+def load_snapshot(path: str, digest: Optional[bytes] = None) -> Optional[KnowledgeIndex]:
+    """Индекс из снимка через mmap; None, если снимок другой версии или устарел"""
+    if sys.byteorder != "little":
+        return None
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, source, meta_len = SNAPSHOT_HEADER.unpack_from(mapped)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or (digest is not None and source != digest):
+        mapped.close()
+        return None
+    meta = json.loads(mapped[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + meta_len])
+    base = _align(SNAPSHOT_HEADER.size + meta_len)
+    view = memoryview(mapped)
+
+    def section(name: str) -> memoryview:
+        start, size = meta["sections"][name]
+        return view[base + start:base + start + size]
+
+    arrays = {name: section(name).cast(code) for name, code in SNAPSHOT_ARRAYS}
+    terms_blob = bytes(section("terms")).decode("utf-8")
+    terms = {token: term for term, token in enumerate(terms_blob.split("\n"))} if terms_blob else {}
+    docs = SnapshotDocs(section("texts"), arrays["text_offsets"], arrays["doc_categories"], meta["categories"])
+    return KnowledgeIndex(terms, arrays["offsets"], arrays["doc_ids"], arrays["tfs"], arrays["idf"],
+                          arrays["norm"], docs, meta["questions"], meta["patterns"], meta["generic"])
+
+
+def compile_snapshot(json_path: str, snapshot_path: str) -> KnowledgeIndex:
+    """Офлайн-сборка: JSON -> проверка -> индекс -> файл снимка"""
+    index = KnowledgeIndex.from_file(json_path)
+    write_snapshot(index, source_digest(json_path), snapshot_path)
+    return index
+
+
+class KnowledgeBase:
+    """Точка доступа к базе знаний для обработчиков бота.
+
+    Текущий индекс — одна ссылка self.index: поиск берёт её один раз и
+    работает с целым неизменяемым индексом. Перезагрузка строит новый
+    индекс в своём потоке и только затем подменяет ссылку; если файл
+    битый, остаётся прежняя версия. Свежий снимок (snapshot_path)
+    загружается вместо JSON; устаревший игнорируется.
+    digest — хэш исходного JSON опубликованной версии; on_reload()
+    вызывается из потока проверки после публикации новой версии.
+    """
+
+    def __init__(self, path: str, min_score: float = MIN_SCORE, reload_interval: float = 5.0,
+                 snapshot_path: Optional[str] = None):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.min_score = min_score
+        self.reload_interval = reload_interval
+        self.version = 0
+        self.digest = ""
+        self.on_reload: Optional[Callable[[], None]] = None
+        self._signature = self._file_signature()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        try:
+            self.index, self.digest = self._load()
+            self.version = 1
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"❌ База знаний не загружена ({path}): {e}")
+            self.index = KnowledgeIndex.from_data({"categories": {}})
+
+    # ---------- поиск ----------
+    def find(self, question: str) -> Optional[KnowledgeAnswer]:
+        """Ответ из базы знаний, если он достаточно уверенный"""
+        found = self.index.search(question)
+        if found is None or found.score < self.min_score:
+            return None
+        return found
+
+    def intents(self, text: str) -> FrozenSet[str]:
+        """Намерения сообщения по patterns: greeting, thanks, help, cost, time, expert"""
+        return self.index.intents.match(text)
+
+    def generic(self, kind: str) -> str:
+        """Случайный ответ из generic_responses (greeting, thanks, unknown)"""
+        generic = self.index.generic
+        texts = generic.get(kind) or generic.get("unknown")
+        return random.choice(texts) if texts else ""
+
+    def reply(self, question: str) -> str:
+        """Текст ответа на вопрос: найденный в базе или generic_responses.unknown"""
+        found = self.find(question)
+        return found.text if found else self.generic("unknown")
+
+    # ---------- перезагрузка ----------
+    def reload(self) -> bool:
+        """Перестроить индекс из файла; True, если новая версия опубликована"""
+        self._signature = self._file_signature()
+        try:
+            index, digest = self._load()
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"❌ База знаний не обновлена, работает версия {self.version}: {e}")
+            return False
+        self.index, self.digest = index, digest
+        self.version += 1
+        logger.info(f"📚 База знаний обновлена: версия {self.version}, ответов {len(index.docs)}")
+        if self.on_reload is not None:
+            self.on_reload()
+        return True
+
+    def start_watching(self) -> None:
+        """Запустить фоновую проверку файла раз в reload_interval секунд"""
+        if self.reload_interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._stop.clear()
+        self._watcher = threading.Thread(target=self._watch, name="kb-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            if self._file_signature() != self._signature:
+                self.reload()
+
+    def _load(self) -> Tuple[KnowledgeIndex, str]:
+        """Индекс из снимка, если он собран из текущего JSON, иначе из самого JSON; и хэш JSON"""
+        digest = source_digest(self.path)
+        if self.snapshot_path and os.path.exists(self.snapshot_path):
+            try:
+                index = load_snapshot(self.snapshot_path, digest)
+            except (OSError, ValueError, KeyError, struct.error) as e:
+                logger.warning(f"⚠️ Снимок базы знаний не прочитан ({self.snapshot_path}): {e}")
+                index = None
+            if index is not None:
+                return index, digest.hex()
+            logger.warning(f"⚠️ Снимок базы знаний устарел, читаю {self.path}")
+        return KnowledgeIndex.from_file(self.path), digest.hex()
+
+    def _file_signature(self) -> Optional[Tuple[int, int, int]]:
+        """mtime, размер и inode: ловит и правку на месте, и замену файла переименованием"""
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+if __name__ == "__main__":
+    here = os.path.dirname(os.path.abspath(__file__))
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, "knowledge_base.json")
+    target = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(source)[0] + ".kbs"
+    compiled = compile_snapshot(source, target)
+    print(f"✅ Снимок {target}: ответов {len(compiled.docs)}, терминов {len(compiled.terms)}, "
+          f"версия формата {SNAPSHOT_VERSION}")
+    with open(source, "r", encoding="utf-8") as f:
+        unresolved = unresolved_questions(json.load(f), compiled, MIN_SCORE)
+    if unresolved:
+        print(f"❌ Вопросы без своего ответа ({len(unresolved)}):")
+        for question in unresolved:
+            print(f"   {question}")
+        sys.exit(1)
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Журнал заявок: телефоны и вопросы эксперту
+Каждая заявка — строка JSON в файле своего дня (leads-ГГГГ-ММ-ДД.jsonl),
+файлы только дописываются. Обработчик кладёт запись в буфер и сразу
+возвращается; раз в flush_interval секунд буфер уходит на диск одной
+записью и одним fsync в отдельном потоке.
+Выгрузка за период читает только файлы нужных дней и отдаётся потоком
+(JSONL — как есть, CSV — построчно), целиком в память не загружается
+"""
+
+import asyncio
+import csv
+import io
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Any, AsyncGenerator, Dict, Iterator, List, Optional, Set, Tuple
+
+from aiogram import Bot
+from aiogram.types import InputFile
+
+from logpipe import process_log_path
+
+logger = logging.getLogger(__name__)
+
+FILE_PREFIX = "leads-"
+FILE_SUFFIX = ".jsonl"
+# Колонки CSV-выгрузки; остальные поля записи в CSV не попадают
+CSV_FIELDS = ("ts", "kind", "user_id", "username", "name", "phone", "question")
+# Размер куска при чтении файлов выгрузки
+EXPORT_CHUNK_SIZE = 256 * 1024
+
+
+def day_of(path: str) -> Optional[date]:
+    """Дата из имени файла журнала; None — если файл не журнальный"""
+    name = os.path.basename(path)
+    if not (name.startswith(FILE_PREFIX) and name.endswith(FILE_SUFFIX)):
+        return None
+    try:
+        return date.fromisoformat(name[len(FILE_PREFIX):len(FILE_PREFIX) + 10])
+    except ValueError:
+        return None
+
+
+class LeadJournal:
+    """Дописываемый журнал заявок с пакетной записью.
+
+    Дочерние процессы (воркеры sharding.py) пишут в свои файлы того же
+    дня: leads-ГГГГ-ММ-ДД.repair-worker-N.jsonl — так дописывание пачки
+    из нескольких процессов не перемешивает строки.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = 0.5):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        # Один поток на запись и чтение списка файлов: пачки ложатся строго по порядку
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="leads")
+        # (день, строка JSON) в порядке поступления
+        self._pending: List[Tuple[str, str]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        # Файлы, конец которых уже проверен этим процессом (см. _write_batch)
+        self._checked: Set[str] = set()
+        self.written = 0
+        self.batches = 0
+
+    # ---------- запись ----------
+    def record(self, kind: str, **fields) -> None:
+        """Поставить заявку в очередь записи; время и день проставляются здесь"""
+        now = datetime.now()
+        entry = {"ts": now.isoformat(timespec="seconds"), "kind": kind, **fields}
+        self._pending.append((now.date().isoformat(), json.dumps(entry, ensure_ascii=False, default=str)))
+        self._ensure_flusher()
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": len(self._pending), "written": self.written, "batches": self.batches}
+
+    # ---------- жизненный цикл ----------
+    async def start(self):
+        await self._run(os.makedirs, self.directory, 0o777, True)
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        self._executor.shutdown(wait=True)
+
+    async def flush(self):
+        """Записать накопленные заявки: одна запись и один fsync на файл дня"""
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        try:
+            await self._run(self._write_batch, batch)
+        except Exception as e:
+            # Возвращаем пачку в начало очереди, следующий сброс повторит попытку
+            logger.error(f"Ошибка записи журнала заявок ({len(batch)} шт.): {e}")
+            self._pending[:0] = batch
+            return
+        self.written += len(batch)
+        self.batches += 1
+
+    # ---------- выгрузка ----------
+    async def files(self, date_from: Optional[date] = None,
+                    date_to: Optional[date] = None) -> List[Tuple[str, int]]:
+        """(путь, размер) файлов журнала за период (границы включительно), по возрастанию дня"""
+        return await self._run(self._list_files, date_from, date_to)
+
+    # ---------- внутреннее ----------
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _path(self, day: str) -> str:
+        return process_log_path(os.path.join(self.directory, f"{FILE_PREFIX}{day}{FILE_SUFFIX}"))
+
+    def _write_batch(self, batch: List[Tuple[str, str]]):
+        by_day: Dict[str, List[str]] = {}
+        for day, line in batch:
+            by_day.setdefault(day, []).append(line)
+        for day, lines in by_day.items():
+            path = self._path(day)
+            created = not os.path.exists(path)
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            if not created and path not in self._checked and _ends_without_newline(path):
+                # Строку оборвал сбой прошлого процесса — новая начнётся с новой строки, а не склеится с ней
+                data = b"\n" + data
+            with open(path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            if created:
+                _fsync_directory(self.directory)
+            self._checked.add(path)
+
+    def _list_files(self, date_from: Optional[date], date_to: Optional[date]) -> List[Tuple[str, int]]:
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                day = day_of(entry.name)
+                if day is None or (date_from and day < date_from) or (date_to and day > date_to):
+                    continue
+                found.append((day, entry.name, entry.path, entry.stat().st_size))
+        return [(path, size) for _, _, path, size in sorted(found)]
+
+
+def _ends_without_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        if f.seek(0, os.SEEK_END) == 0:
+            return False
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+def _fsync_directory(directory: str):
+    """Новый файл переживёт сбой питания, только если записана и запись каталога"""
+    if not hasattr(os, "O_DIRECTORY"):  # Windows
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+# ============ ВЫГРУЗКА ============
+def iter_jsonl(paths: List[str], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Файлы подряд, как есть: строки не разбираются"""
+    for path in paths:
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+
+def iter_csv(paths: List[str], chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """CSV с BOM (чтобы Excel узнал UTF-8); строки читаются и пишутся пачками по chunk_size"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\r\n")
+    buffer.write("\ufeff")
+    writer.writerow(CSV_FIELDS)
+    for path in paths:
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            while lines := f.readlines(chunk_size):
+                writer.writerows(_csv_rows(lines))
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+
+# raw_decode без обёртки json.loads: строка журнала всегда начинается с "{", хвост "\n" не проверяется
+_decode = json.JSONDecoder().raw_decode
+
+
+def _csv_rows(lines: List[str]) -> Iterator[List[Any]]:
+    for line in lines:
+        try:
+            entry = _decode(line)[0]
+        except ValueError:
+            # Недописанная строка после сбоя — не повод срывать выгрузку
+            continue
+        yield [entry.get(field) for field in CSV_FIELDS]
+
+
+EXPORT_FORMATS = {"jsonl": iter_jsonl, "csv": iter_csv}
+
+
+class LeadExportFile(InputFile):
+    """Файл выгрузки для send_document: куски читаются с диска по мере отправки.
+
+    Чтение идёт в потоке, цикл событий не ждёт диск; в памяти только
+    текущий кусок.
+    """
+
+    def __init__(self, paths: List[str], fmt: str = "csv", filename: Optional[str] = None):
+        super().__init__(filename=filename or f"leads.{fmt}", chunk_size=EXPORT_CHUNK_SIZE)
+        self.paths = paths
+        self.fmt = fmt
+
+    async def read(self, bot: Bot) -> AsyncGenerator[bytes, None]:
+        chunks = EXPORT_FORMATS[self.fmt](self.paths, self.chunk_size)
+        loop = asyncio.get_running_loop()
+        pending: Optional[asyncio.Future] = None
+        try:
+            while True:
+                pending = loop.run_in_executor(None, next, chunks, None)
+                # shield: отмена отправки не должна отменять pending, пока next() ещё идёт в потоке
+                chunk = await asyncio.shield(pending)
+                if chunk is None:
+                    break
+                if chunk:
+                    yield chunk
+        finally:
+            # Отправку могли прервать на середине — файл закрывается сразу, а не сборщиком мусора.
+            # Генератор, занятый в потоке, закрыть нельзя ("generator already executing"):
+            # тогда он закрывается, когда next() вернётся
+            if pending is not None and not pending.done():
+                pending.add_done_callback(lambda _: chunks.close())
+            else:
+                chunks.close()
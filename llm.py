@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Шлюз к LLM для AI-консультаций
+Один общий пул HTTP-соединений на процесс, общий лимит одновременных
+запросов и дедлайн на каждый ответ; ответ стримится правками
+одного сообщения в Telegram
+"""
+
+import asyncio
+import logging
+import time
+from typing import AsyncIterator, Optional
+
+import httpx
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from openai import APIError, AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = (
+    "Ты — эксперт по ремонту квартир с 15-летним опытом. Отвечай по-русски, "
+    "кратко и по делу, на «ты». Если дан фрагмент базы знаний — опирайся на него. "
+    "Не выдумывай цены и нормативы, если не уверен."
+)
+
+# Ошибки LLM, при которых пользователь получает запасной ответ
+LLM_ERRORS = (APIError, httpx.HTTPError, TimeoutError)
+
+# Telegram ограничивает длину сообщения и частоту правок
+MESSAGE_LIMIT = 4096
+EDIT_INTERVAL = 1.0
+CURSOR = " ▌"
+# Ответ модели может содержать незакрытые * и _, поэтому он показывается
+# без разметки — и при стриминге, и при повторной отправке из кэша
+ANSWER_PARSE_MODE = None
+
+
+class LLMGateway:
+    """Асинхронный клиент LLM с общим пулом соединений и лимитом параллельности.
+
+    Сверх max_concurrency запросы ждут своей очереди на семафоре, а не
+    открывают новые сокеты; timeout ограничивает весь ответ целиком,
+    включая ожидание в очереди и стриминг.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, model: str = "gpt-4o-mini",
+                 max_concurrency: int = 8, max_connections: int = 16, timeout: float = 30.0,
+                 connect_timeout: float = 5.0, max_tokens: int = 600, system_prompt: str = SYSTEM_PROMPT):
+        self.model = model
+        self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.system_prompt = system_prompt
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        )
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url or None, http_client=self.http, max_retries=1)
+        self.active = 0
+
+    def _messages(self, question: str, context: Optional[str]):
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if context:
+            messages.append({"role": "system", "content": f"Фрагмент базы знаний: {context}"})
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    async def stream(self, question: str, context: Optional[str] = None) -> AsyncIterator[str]:
+        """Фрагменты ответа по мере генерации; TimeoutError, если дедлайн истёк"""
+        # Дедлайн проверяется на каждом ожидании внутри генератора, а не
+        # одним asyncio.timeout: тот отменял бы и код между фрагментами
+        deadline = time.monotonic() + self.timeout
+        await asyncio.wait_for(self.semaphore.acquire(), self.timeout)
+        self.active += 1
+        response = None
+        try:
+            response = await asyncio.wait_for(self.client.chat.completions.create(
+                model=self.model, messages=self._messages(question, context),
+                max_tokens=self.max_tokens, stream=True,
+            ), deadline - time.monotonic())
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), deadline - time.monotonic())
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            if response is not None:
+                await response.close()
+            self.active -= 1
+            self.semaphore.release()
+
+    async def complete(self, question: str, context: Optional[str] = None) -> str:
+        """Ответ целиком"""
+        return "".join([part async for part in self.stream(question, context)])
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+async def stream_to_chat(bot: Bot, chat_id: int, chunks: AsyncIterator[str], fallback: str,
+                         placeholder: str = "🤖 Думаю над ответом...", prefix: str = "🤖 ",
+                         interval: float = EDIT_INTERVAL) -> Optional[str]:
+    """Отправить заглушку и дописывать в неё ответ правками не чаще interval секунд.
+
+    Текст идёт с ANSWER_PARSE_MODE (без разметки).
+    Если LLM недоступна или не уложилась в дедлайн, в сообщении остаётся
+    уже полученная часть, а если её нет — fallback. Возвращает показанный
+    текст, если модель ответила полностью, иначе None.
+    """
+    sent = await bot.send_message(chat_id, placeholder, parse_mode=ANSWER_PARSE_MODE)
+    shown = placeholder
+    text = ""
+
+    async def show(value: str):
+        nonlocal shown
+        value = value[:MESSAGE_LIMIT]
+        if value == shown:
+            return
+        try:
+            await bot.edit_message_text(value, chat_id=chat_id, message_id=sent.message_id,
+                                        parse_mode=ANSWER_PARSE_MODE)
+            shown = value
+        except TelegramAPIError as e:
+            logger.warning(f"Не удалось обновить ответ в чате {chat_id}: {e}")
+
+    last_edit = time.monotonic()
+    complete = False
+    try:
+        async for part in chunks:
+            text += part
+            if time.monotonic() - last_edit >= interval:
+                await show(prefix + text[:MESSAGE_LIMIT - len(prefix) - len(CURSOR)] + CURSOR)
+                last_edit = time.monotonic()
+        complete = True
+    except LLM_ERRORS as e:
+        logger.warning(f"LLM не ответила в чате {chat_id}: {type(e).__name__}: {e}")
+
+    final = prefix + text.strip() if text.strip() else fallback
+    await show(final)
+    return final if complete and text.strip() else None
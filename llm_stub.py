@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная заглушка OpenAI-совместимого API для тестов AI-консультаций
+Отвечает на POST /v1/chat/completions (обычный ответ и стриминг SSE)
+фиксированным текстом с настраиваемой задержкой между фрагментами
+
+Запуск: python llm_stub.py [порт] [задержка фрагмента, с]
+Бот:    REPAIR_LLM_BASE_URL=http://127.0.0.1:8099/v1 python bot2.py
+"""
+
+import asyncio
+import json
+import sys
+import time
+import uuid
+
+from aiohttp import web
+
+ANSWER = (
+    "Это ответ тестовой заглушки. Начни с обмерочного плана и сметы, "
+    "фиксируй скрытые работы на фото и принимай этапы по актам."
+)
+
+
+def build_app(delay: float = 0.05, answer: str = ANSWER) -> web.Application:
+    """Приложение заглушки; app["requests"] считает принятые запросы"""
+
+    async def completions(request: web.Request) -> web.StreamResponse:
+        request.app["requests"] += 1
+        body = await request.json()
+        question = body["messages"][-1]["content"]
+        text = f"{answer} (Вопрос: {question})"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay)
+            return web.json_response({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = text.split(" ")
+        try:
+            for position, word in enumerate(words):
+                await asyncio.sleep(delay)
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "finish_reason": None,
+                                 "delta": {"content": word if position == 0 else f" {word}"}}],
+                }
+                await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            done = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop", "delta": {}}],
+            }
+            await response.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            await response.write_eof()
+        except ConnectionResetError:
+            # Клиент ушёл по своему дедлайну — для заглушки это нормально
+            pass
+        return response
+
+    async def models(request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+
+    app = web.Application()
+    app["requests"] = 0
+    app.router.add_post("/v1/chat/completions", completions)
+    app.router.add_get("/v1/models", models)
+    return app
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8099
+    delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    web.run_app(build_app(delay), host="127.0.0.1", port=port)
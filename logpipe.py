@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Неблокирующее структурированное логирование
+Вызов logger.* в обработчике только кладёт запись в очередь; форматирование,
+запись на диск, ротация и сжатие идут в отдельном потоке (QueueListener).
+В файл пишутся JSON-строки с контекстом апдейта: пользователь, чат,
+состояние FSM, обработчик и время обработки
+"""
+
+import gzip
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+logger = logging.getLogger(__name__)
+
+CONSOLE_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Поля контекста, которые попадают в JSON-строку, если заданы
+CONTEXT_FIELDS = ("user_id", "chat_id", "state", "handler", "latency_ms")
+
+# Контекст текущего апдейта; выставляется middleware и виден всем логам обработчика
+log_context: ContextVar[Dict[str, Any]] = ContextVar("log_context", default={})
+
+
+class ContextFilter(logging.Filter):
+    """Дописывает в запись контекст апдейта (в потоке, где вызван лог)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        for key, value in log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        for key in CONTEXT_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(QueueHandler):
+    """QueueHandler, который при закрытии дописывает очередь и останавливает поток записи"""
+
+    listener: Optional[QueueListener] = None
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # В отличие от стандартного prepare, трассировка остаётся отдельным
+        # полем, а не склеивается с текстом сообщения
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self) -> None:
+        # Поток записи могли уже остановить вручную через возвращённый listener
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+        self.listener = None
+        super().close()
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """Ротация по размеру и по возрасту файла; архивы сжимаются в .gz.
+
+    Возраст отсчитывается от открытия файла этим процессом. Хранится
+    backup_count архивов: name.1.gz — самый свежий.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 14,
+                 max_age: float = 24 * 3600):
+        super().__init__(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.max_age = max_age
+        self.opened_at = time.time()
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        return bool(self.max_age) and time.time() - self.opened_at >= self.max_age \
+            and os.path.isfile(self.baseFilename) and os.path.getsize(self.baseFilename) > 0
+
+    def doRollover(self) -> None:
+        super().doRollover()
+        self.opened_at = time.time()
+
+
+def process_log_path(path: str) -> str:
+    """Отдельный файл для каждого дочернего процесса: ротация в общем файле
+    из нескольких процессов теряла бы записи"""
+    if multiprocessing.parent_process() is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{multiprocessing.current_process().name}{ext}"
+
+
+def setup_logging(path: Optional[str], level: str = "INFO", max_bytes: int = 10 * 1024 * 1024,
+                  backup_count: int = 14, max_age: float = 24 * 3600, console: bool = True) -> QueueListener:
+    """Настроить корневой логгер: очередь в вызывающем потоке, консоль и JSON-файл в потоке записи.
+
+    Повторный вызов (например, в процессе-воркере после fork) заменяет
+    унаследованную конфигурацию: поток записи родителя в дочерний процесс не переходит.
+    """
+    handlers = []
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(CONSOLE_FORMAT))
+        handlers.append(console_handler)
+    if path:
+        path = process_log_path(path)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        file_handler = CompressingRotatingFileHandler(path, max_bytes, backup_count, max_age)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _QueueHandler(log_queue)
+    queue_handler.addFilter(ContextFilter())
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    queue_handler.listener = listener
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    listener.start()
+    return listener
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """Контекст апдейта для логов обработчика и строка с временем обработки.
+
+    Регистрируется внутренней middleware (dp.message.middleware), чтобы
+    обработчик и состояние FSM были уже известны.
+    """
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        chat = data.get("event_chat")
+        handler_object = data.get("handler")
+        context = {
+            "user_id": user.id if user else None,
+            "chat_id": chat.id if chat else None,
+            "state": data.get("raw_state"),
+            "handler": getattr(getattr(handler_object, "callback", None), "__name__", None),
+        }
+        token = log_context.set(context)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            latency_ms = round((time.perf_counter() - started) * 1000, 2)
+            logger.info(f"Обработано за {latency_ms} мс", extra={"latency_ms": latency_ms})
+            log_context.reset(token)
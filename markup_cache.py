@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Неизменяемые клавиатуры и кэш их сериализации
+Клавиатура строится один раз на набор аргументов, а её JSON
+для reply_markup считается при первой отправке и дальше переиспользуется
+"""
+
+import functools
+from typing import Any, Callable, Dict, TypeVar
+
+from aiohttp import FormData
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.methods import TelegramMethod
+
+MarkupBuilder = TypeVar("MarkupBuilder", bound=Callable[..., Any])
+
+# id клавиатуры -> сама клавиатура (ссылка держит объект живым, id не переиспользуется)
+_FROZEN_MARKUPS: Dict[int, Any] = {}
+
+
+def frozen_markup(builder: MarkupBuilder) -> MarkupBuilder:
+    """Декоратор: одна клавиатура на набор аргументов, помеченная для кэша JSON"""
+
+    @functools.lru_cache(maxsize=None)
+    @functools.wraps(builder)
+    def cached(*args, **kwargs):
+        markup = builder(*args, **kwargs)
+        _FROZEN_MARKUPS[id(markup)] = markup
+        return markup
+
+    return cached
+
+
+def is_frozen(markup: Any) -> bool:
+    return markup is not None and _FROZEN_MARKUPS.get(id(markup)) is markup
+
+
+class CachedMarkupSession(AiohttpSession):
+    """HTTP-сессия, которая не сериализует заново неизменяемые клавиатуры"""
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._markup_json: Dict[int, str] = {}
+
+    def markup_json(self, markup: Any, bot: Bot) -> str:
+        payload = self._markup_json.get(id(markup))
+        if payload is None:
+            payload = self._markup_json[id(markup)] = self.prepare_value(markup, bot=bot, files={})
+        return payload
+
+    def build_form_data(self, bot: Bot, method: TelegramMethod) -> FormData:
+        markup = getattr(method, "reply_markup", None)
+        if not is_frozen(markup):
+            return super().build_form_data(bot, method)
+
+        # То же, что AiohttpSession.build_form_data, но reply_markup берётся готовой строкой
+        form = FormData(quote_fields=False)
+        files: Dict[str, Any] = {}
+        for key, value in method.model_dump(warnings=False, exclude={"reply_markup"}).items():
+            value = self.prepare_value(value, bot=bot, files=files)
+            if not value:
+                continue
+            form.add_field(key, value)
+        form.add_field("reply_markup", self.markup_json(markup, bot))
+        for key, value in files.items():
+            form.add_field(key, value.read(bot), filename=value.filename or key)
+        return form
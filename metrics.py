@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Метрики обработчиков в формате Prometheus
+По каждому обработчику: время работы, время запросов к Telegram, время
+пауз планировщика, число вызовов и ошибок. Отправки и паузы из очереди
+планировщика относятся к обработчику, который их поставил (pacing.job_owner).
+Отдаются текстом на локальном HTTP-эндпоинте /metrics
+"""
+
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiogram.types import TelegramObject
+
+from pacing import job_owner
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм, секунды
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Метка для запросов и пауз вне обработчиков (startup, фоновые задачи)
+NO_HANDLER = "-"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Счётчик с метками"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ("handler",)):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с метками: счётчики по корзинам, сумма и количество"""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ("handler",),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # метки -> [счётчики корзин (последняя — +Inf), сумма, количество]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Metrics:
+    """Набор метрик бота и экспорт в текстовый формат Prometheus"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.handler_seconds = Histogram(
+            "repair_handler_seconds", "Время работы обработчика без отложенных отправок", buckets=buckets)
+        self.telegram_seconds = Histogram(
+            "repair_telegram_request_seconds", "Время запроса к Bot API",
+            labelnames=("handler", "method"), buckets=buckets)
+        self.pacing_seconds = Histogram(
+            "repair_pacing_seconds", "Паузы планировщика сообщений", buckets=buckets)
+        self.handler_calls = Counter("repair_handler_calls_total", "Вызовы обработчика")
+        self.handler_errors = Counter("repair_handler_errors_total", "Обработчик завершился исключением")
+        self.telegram_errors = Counter(
+            "repair_telegram_errors_total", "Ошибки запросов к Bot API", labelnames=("handler", "method"))
+        self._gauges: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+        self._runner: Optional[web.AppRunner] = None
+
+    def observe_pause(self, owner: Optional[str], seconds: float) -> None:
+        """Хук планировщика: MessagePacer.on_pause"""
+        self.pacing_seconds.observe(seconds, owner or NO_HANDLER)
+
+    def add_gauges(self, prefix: str, stats: Callable[[], Dict[str, Any]]) -> None:
+        """Числовые поля stats() отдаются как gauge с именем prefix_поле"""
+        self._gauges.append((prefix, stats))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in (self.handler_seconds, self.telegram_seconds, self.pacing_seconds,
+                       self.handler_calls, self.handler_errors, self.telegram_errors):
+            lines.extend(metric.render())
+        for prefix, stats in self._gauges:
+            for key, value in stats().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"# TYPE {prefix}_{key} gauge")
+                    lines.append(f"{prefix}_{key} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+    # ---------- HTTP ----------
+    async def start_server(self, host: str = "127.0.0.1", port: int = 9108) -> None:
+        """Поднять /metrics; занятый порт не мешает боту работать"""
+
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8",
+                                headers={"X-Content-Type-Options": "nosniff"})
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        try:
+            await web.TCPSite(runner, host=host, port=port).start()
+        except OSError as e:
+            logger.warning(f"⚠️ Метрики не запущены на {host}:{port}: {e}")
+            await runner.cleanup()
+            return
+        self._runner = runner
+        logger.info(f"📈 Метрики: http://{host}:{port}/metrics")
+
+    async def close(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+def handler_name(data: Dict[str, Any]) -> str:
+    """Имя функции-обработчика из данных внутренней middleware"""
+    handler_object = data.get("handler")
+    return getattr(getattr(handler_object, "callback", None), "__name__", None) or NO_HANDLER
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время и исход обработчика; регистрируется внутренней middleware раньше склейки ответов,
+    чтобы отправки из буфера обработчика тоже получили его имя"""
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        name = handler_name(data)
+        token = job_owner.set(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            self.metrics.handler_errors.inc(name)
+            raise
+        finally:
+            self.metrics.handler_seconds.observe(time.perf_counter() - started, name)
+            self.metrics.handler_calls.inc(name)
+            job_owner.reset(token)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Время каждого запроса к Bot API с меткой обработчика.
+
+    Регистрируется после FloodControl: тогда ожидание флуд-лимитов не
+    попадает в время запроса (оно видно в метриках repair_flood_*).
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        owner = job_owner.get() or NO_HANDLER
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception:
+            self.metrics.telegram_errors.inc(owner, method.__api_method__)
+            raise
+        finally:
+            self.metrics.telegram_seconds.observe(time.perf_counter() - started, owner, method.__api_method__)
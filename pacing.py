@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Планировщик отложенных сообщений для бота диагностики
+Обработчик ставит сообщения в очередь чата и сразу возвращается,
+а паузы между сообщениями выдерживает фоновая задача. Анимация
+прогресса — одно сообщение, которое правится кадр за кадром
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+from aiogram import Bot
+from aiogram.enums import ChatAction
+from aiogram.exceptions import TelegramAPIError
+from aiogram.methods import TelegramMethod
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+# Элемент очереди: готовый метод API или функция без аргументов, возвращающая
+# корутину (например, стриминг ответа) — она запускается только в свою очередь
+Job = Union[TelegramMethod, Callable[[], Awaitable]]
+
+# Буфер отправок текущего обработчика (см. coalesce.py): пока он задан,
+# send() копит (chat_id, job, delay) в нём, а не ставит в очередь
+turn_buffer: ContextVar[Optional[List[Tuple[int, Job, float]]]] = ContextVar("pacer_turn_buffer", default=None)
+
+# Кто поставил задачу (имя обработчика): задача выполняется с тем же
+# значением, чтобы её запросы и паузы в метриках относились к нему
+job_owner: ContextVar[Optional[str]] = ContextVar("pacer_job_owner", default=None)
+
+# Индикатор "печатает..." живёт в Telegram около 5 секунд
+TYPING_REFRESH = 4.5
+# Паузы короче этой не сопровождаем индикатором
+TYPING_MIN_DELAY = 0.5
+# Правки одного сообщения чаще раза в секунду Telegram ограничивает
+EDIT_MIN_INTERVAL = 1.0
+
+
+class MessagePacer:
+    """Очередь отложенных отправок: одна FIFO-очередь и одна задача на чат"""
+
+    def __init__(self, bot: Bot, typing: bool = True, time_scale: float = 1.0):
+        self.bot = bot
+        self.typing = typing
+        # Множитель всех пауз: 0 — без пауз (нагрузочные тесты, бенчмарки)
+        self.time_scale = time_scale
+        # on_pause(owner, seconds) вызывается после каждой выдержанной паузы (для метрик)
+        self.on_pause: Optional[Callable[[Optional[str], float], None]] = None
+        self._queues: Dict[int, Deque[Tuple[Job, float, Optional[str]]]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def send(self, chat_id: int, method: Job, delay: float = 0.0) -> None:
+        """Поставить метод API или задачу в очередь чата (выполнится через delay секунд после предыдущего)"""
+        buffer = turn_buffer.get()
+        if buffer is not None:
+            buffer.append((chat_id, method, delay))
+            return
+        self.enqueue(chat_id, method, delay)
+
+    def enqueue(self, chat_id: int, method: Job, delay: float = 0.0) -> None:
+        """Поставить в очередь чата в обход буфера обработчика"""
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+            self._tasks[chat_id] = asyncio.create_task(self._worker(chat_id, queue))
+        queue.append((method, delay * self.time_scale, job_owner.get()))
+
+    def answer(self, message: Message, text: str, delay: float = 0.0, **kwargs) -> None:
+        """Аналог message.answer(), но без ожидания отправки"""
+        self.send(message.chat.id, message.answer(text, **kwargs), delay)
+
+    def animate(self, chat_id: int, frames: Sequence[str], interval: float = 1.5,
+                delay: float = 0.0, final: Optional[str] = None) -> None:
+        """Отправить первый кадр и править его следующими; final — чем анимация закончится.
+
+        Вместо сообщения на каждый кадр — одна отправка и правки не чаще
+        EDIT_MIN_INTERVAL; само сообщение показывает прогресс, поэтому
+        индикатор "печатает..." между кадрами не нужен.
+        """
+        frames = list(frames) + ([final] if final is not None else [])
+        if frames:
+            interval = max(interval, EDIT_MIN_INTERVAL) * self.time_scale
+            self.send(chat_id, lambda: self._animate(chat_id, frames, interval), delay)
+
+    def pending(self, chat_id: int) -> int:
+        """Сколько сообщений ещё ждёт отправки в чате"""
+        queue = self._queues.get(chat_id)
+        return len(queue) if queue else 0
+
+    def cancel(self, chat_id: int) -> None:
+        """Отменить все неотправленные сообщения чата (например, при /start или /cancel)"""
+        buffer = turn_buffer.get()
+        if buffer:
+            buffer[:] = [item for item in buffer if item[0] != chat_id]
+        self._queues.pop(chat_id, None)
+        task = self._tasks.pop(chat_id, None)
+        if task is not None:
+            task.cancel()
+
+    async def drain(self) -> None:
+        """Дождаться отправки всех сообщений во всех чатах"""
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def drain_chat(self, chat_id: int) -> None:
+        """Дождаться отправки всех сообщений одного чата"""
+        while chat_id in self._tasks:
+            await asyncio.gather(self._tasks[chat_id], return_exceptions=True)
+
+    async def close(self) -> None:
+        """Остановить все очереди без отправки оставшихся сообщений"""
+        for chat_id in list(self._tasks):
+            self.cancel(chat_id)
+
+    async def _worker(self, chat_id: int, queue: Deque[Tuple[Job, float, Optional[str]]]):
+        try:
+            while queue:
+                method, delay, owner = queue.popleft()
+                token = job_owner.set(owner)
+                try:
+                    if delay > 0:
+                        await self._wait(chat_id, delay)
+                    await (method() if callable(method) else method)
+                except TelegramAPIError as e:
+                    logger.warning(f"Не удалось отправить сообщение в чат {chat_id}: {e}")
+                except Exception:
+                    logger.exception(f"Ошибка задачи в очереди чата {chat_id}")
+                finally:
+                    job_owner.reset(token)
+        finally:
+            # Очередь могла быть заменена после cancel() — удаляем только свою
+            if self._queues.get(chat_id) is queue:
+                del self._queues[chat_id]
+                del self._tasks[chat_id]
+
+    async def _animate(self, chat_id: int, frames: Sequence[str], interval: float):
+        sent = await self.bot.send_message(chat_id, frames[0])
+        for frame in frames[1:]:
+            await self._sleep(interval)
+            try:
+                await self.bot.edit_message_text(frame, chat_id=chat_id, message_id=sent.message_id)
+            except TelegramAPIError as e:
+                # Сообщение удалили или правка не прошла — кадр уходит новым сообщением
+                logger.warning(f"Не удалось обновить анимацию в чате {chat_id}: {e}")
+                sent = await self.bot.send_message(chat_id, frame)
+
+    async def _sleep(self, delay: float):
+        started = time.monotonic()
+        await asyncio.sleep(delay)
+        if self.on_pause is not None:
+            self.on_pause(job_owner.get(), time.monotonic() - started)
+
+    async def _wait(self, chat_id: int, delay: float):
+        """Пауза перед сообщением с индикатором "печатает..." """
+        if not self.typing or delay < TYPING_MIN_DELAY:
+            await self._sleep(delay)
+            return
+        remaining = delay
+        while remaining > 0:
+            try:
+                await self.bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+            except TelegramAPIError:
+                pass
+            step = min(remaining, TYPING_REFRESH)
+            await self._sleep(step)
+            remaining -= step
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Многопроцессный режим: один приёмник апдейтов и N воркеров
+Приёмник (polling или вебхук) не разбирает апдейты в pydantic, а только
+находит отправителя и отправляет сырой апдейт воркеру user_id % N. Каждый
+воркер — отдельный процесс со своим Dispatcher; апдейты одного
+пользователя всегда попадают к одному воркеру и обрабатываются по порядку.
+Ключ шардирования совпадает с ключом хранилищ: данные пользователя
+(storage.py) хранятся по user_id, FSM — по паре чат + пользователь,
+так что запись пользователя кэширует и пишет только один воркер.
+FSM и данные пользователей — общие файлы SQLite
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import queue as queue_module
+import signal
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional
+
+import aiohttp
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import PRODUCTION, TelegramAPIServer
+from aiogram.types import Update
+
+logger = logging.getLogger(__name__)
+
+# Долгий опрос getUpdates, секунд
+POLL_TIMEOUT = 30
+# Поля апдейта, в которых чат лежит не в самом объекте, а во вложенном сообщении
+NESTED_MESSAGE = "message"
+# Больше стольких перезапусков одного воркера за RESTART_WINDOW секунд — это не сбой, а цикл падений
+MAX_RESTARTS = 3
+RESTART_WINDOW = 60.0
+# Как часто воркер, ждущий апдейтов, проверяет, жив ли приёмник
+PARENT_CHECK_INTERVAL = 1.0
+
+
+class BotApp(NamedTuple):
+    """Что фабрика бота отдаёт воркеру"""
+    dp: Dispatcher
+    bot: Bot
+    pacer: Any = None  # планировщик с drain(): отложенные сообщения дописываются до остановки
+
+
+def shard_key_of(update: Dict[str, Any]) -> int:
+    """Ключ шардирования апдейта без разбора в модели: id отправителя, без него — chat_id
+    (посты каналов); 0 — если нет ни того, ни другого"""
+    for key, payload in update.items():
+        if key == "update_id" or not isinstance(payload, dict):
+            continue
+        sender = payload.get("from") or payload.get("user")
+        if sender:
+            return sender["id"]
+        chat = payload.get("chat") or (payload.get(NESTED_MESSAGE) or {}).get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+class ChatSerializer:
+    """Одна очередь и одна задача на ключ шардирования: апдейты пользователя
+    обрабатываются строго по порядку, а разных пользователей — параллельно"""
+
+    def __init__(self):
+        self._queues: Dict[int, Deque[Callable[[], Awaitable]]] = {}
+        self._tasks: Dict[int, asyncio.Task] = {}
+
+    def submit(self, key: int, job: Callable[[], Awaitable]) -> None:
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._tasks[key] = asyncio.create_task(self._run(key, queue))
+        queue.append(job)
+
+    async def drain(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+    async def _run(self, key: int, queue: Deque[Callable[[], Awaitable]]):
+        try:
+            while queue:
+                try:
+                    await queue.popleft()()
+                except Exception:
+                    logger.exception(f"Ошибка обработки апдейта пользователя {key}")
+        finally:
+            del self._queues[key]
+            del self._tasks[key]
+
+
+# ============ ВОРКЕР ============
+def _worker_main(factory: Callable[[int], BotApp], index: int, queue, ready,
+                 setup: Optional[Callable[[BotApp], None]]):
+    """Точка входа процесса-воркера: сборка бота фабрикой и цикл обработки"""
+    # Ctrl+C получает вся группа процессов; останавливает воркеры приёмник через stop()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    app = factory(index)
+    if setup is not None:
+        setup(app)
+    try:
+        asyncio.run(_worker_loop(app, index, queue, ready))
+    finally:
+        # Процесс multiprocessing завершается без atexit: дописать логи явно
+        logging.shutdown()
+
+
+def _next_item(queue):
+    """Следующий апдейт; None — пора останавливаться (стоп от приёмника или приёмник умер)"""
+    parent = multiprocessing.parent_process()
+    while True:
+        try:
+            return queue.get(timeout=PARENT_CHECK_INTERVAL)
+        except queue_module.Empty:
+            if parent is not None and not parent.is_alive():
+                logger.error("❌ Приёмник завершился без остановки воркеров, воркер останавливается")
+                return None
+
+
+async def _worker_loop(app: BotApp, index: int, queue, ready):
+    dp, bot = app.dp, app.bot
+    loop = asyncio.get_running_loop()
+    # SIGTERM (остановка контейнера, terminate()) — та же мягкая остановка, что и от приёмника:
+    # очередь дорабатывается, shutdown-хуки записывают буферы хранилищ
+    loop.add_signal_handler(signal.SIGTERM, queue.put, None)
+    await dp.emit_startup(bot=bot, bots=[bot], dispatcher=dp)
+    ready.put(index)
+    serializer = ChatSerializer()
+    handled = 0
+    try:
+        while True:
+            item = await loop.run_in_executor(None, _next_item, queue)
+            if item is None:
+                break
+            key, raw = item
+            update = Update.model_validate(raw, context={"bot": bot})
+            serializer.submit(key, lambda update=update: dp.feed_update(bot, update))
+            handled += 1
+        await serializer.drain()
+        # Отложенные сообщения дописываются до остановки, а не отменяются
+        if app.pacer is not None:
+            await app.pacer.drain()
+    finally:
+        await dp.emit_shutdown(bot=bot, bots=[bot], dispatcher=dp)
+        await bot.session.close()
+        logger.info(f"Воркер {index} остановлен, обработано апдейтов: {handled}")
+
+
+class WorkerPool:
+    """Процессы-воркеры и маршрутизация апдейтов между ними по shard_key_of.
+
+    factory(index) вызывается в воркере и собирает BotApp: модуль бота
+    уже загружен в родителе и в воркер переходит через fork, повторный
+    импорт создал бы все его объекты второй раз. setup(app) вызывается в
+    воркере после сборки (например, чтобы подменить сессию в бенчмарке).
+    Упавший воркер перезапускается при следующем апдейте для него; если
+    он падает чаще MAX_RESTARTS раз за RESTART_WINDOW, route() бросает
+    RuntimeError.
+    """
+
+    def __init__(self, factory: Callable[[int], BotApp], workers: int = 2,
+                 setup: Optional[Callable[[BotApp], None]] = None):
+        self.factory = factory
+        self.workers = workers
+        self.setup = setup
+        self._context = multiprocessing.get_context()
+        self._queues: List[Any] = []
+        self._processes: List[multiprocessing.Process] = []
+        self._ready: Optional[Any] = None
+        self._restarts: List[Deque[float]] = [deque() for _ in range(workers)]
+        self.routed = [0] * workers
+        self.restarted = [0] * workers
+
+    def start(self, timeout: float = 60.0) -> None:
+        """Запустить воркеры и дождаться, пока каждый выполнит startup"""
+        ready = self._ready = self._context.Queue()
+        for index in range(self.workers):
+            queue = self._context.Queue()
+            self._queues.append(queue)
+            self._processes.append(self._spawn(index, queue))
+        deadline = time.monotonic() + timeout
+        started = 0
+        while started < self.workers:
+            try:
+                ready.get(timeout=0.5)
+                started += 1
+            except queue_module.Empty:
+                dead = [process.name for process in self._processes if not process.is_alive()]
+                if dead or time.monotonic() > deadline:
+                    self.stop(timeout=1.0)
+                    raise RuntimeError(f"Воркеры не запустились: {', '.join(dead) or 'таймаут'}")
+        logger.info(f"Запущено воркеров: {self.workers}")
+
+    def route(self, update: Dict[str, Any]) -> None:
+        """Отправить сырой апдейт воркеру его пользователя (упавший воркер сначала перезапускается)"""
+        key = shard_key_of(update)
+        index = key % self.workers
+        if not self._processes[index].is_alive():
+            self._restart(index)
+        self._queues[index].put((key, update))
+        self.routed[index] += 1
+
+    def stop(self, timeout: float = 60.0) -> None:
+        """Дать воркерам доработать очередь и остановиться"""
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                # SIGTERM воркер понимает как мягкую остановку — зависший добивается SIGKILL
+                logger.warning(f"Воркер {process.name} не остановился за {timeout} с")
+                process.kill()
+                process.join()
+        self._queues.clear()
+        self._processes.clear()
+
+    def _spawn(self, index: int, queue) -> multiprocessing.Process:
+        process = self._context.Process(
+            target=_worker_main, name=f"repair-worker-{index}", daemon=True,
+            args=(self.factory, index, queue, self._ready, self.setup),
+        )
+        process.start()
+        return process
+
+    def _restart(self, index: int) -> None:
+        dead = self._processes[index]
+        now = time.monotonic()
+        restarts = self._restarts[index]
+        while restarts and now - restarts[0] > RESTART_WINDOW:
+            restarts.popleft()
+        if len(restarts) >= MAX_RESTARTS:
+            raise RuntimeError(f"Воркер {dead.name} падает снова и снова (код {dead.exitcode}), "
+                               f"{len(restarts)} перезапусков за {RESTART_WINDOW:.0f} с")
+        restarts.append(now)
+        # Упавший процесс мог умереть, держа блокировку чтения очереди, — новому воркеру
+        # нужна новая очередь; апдейты, оставшиеся в старой, потеряны
+        logger.error(f"❌ Воркер {dead.name} завершился (код {dead.exitcode}), перезапускаю; "
+                     f"неразобранные апдейты его чатов потеряны")
+        self._queues[index] = self._context.Queue()
+        self._processes[index] = self._spawn(index, self._queues[index])
+        self.restarted[index] += 1
+
+
+# ============ ПРИЁМНИК ============
+async def poll_updates(pool: WorkerPool, token: str, api: TelegramAPIServer = PRODUCTION,
+                       allowed_updates: Optional[List[str]] = None) -> None:
+    """Long polling getUpdates напрямую через HTTP: апдейты уходят воркерам сырыми"""
+    offset = 0
+    params_base = {"timeout": POLL_TIMEOUT}
+    if allowed_updates is not None:
+        params_base["allowed_updates"] = json.dumps(allowed_updates)
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT + 10)) as http:
+        async with http.post(api.api_url(token, "deleteWebhook")):
+            pass
+        while True:
+            try:
+                async with http.get(api.api_url(token, "getUpdates"), params={**params_base, "offset": offset}) as response:
+                    body = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"getUpdates не удался: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not body.get("ok"):
+                retry_after = body.get("parameters", {}).get("retry_after", 1)
+                logger.warning(f"getUpdates: {body.get('description')}")
+                await asyncio.sleep(retry_after)
+                continue
+            for update in body["result"]:
+                pool.route(update)
+                offset = update["update_id"] + 1
+
+
+async def serve_webhook(pool: WorkerPool, token: str, api: TelegramAPIServer = PRODUCTION, *,
+                        base_url: str, path: str, secret: str, host: str = "0.0.0.0", port: int = 8080,
+                        allowed_updates: Optional[List[str]] = None) -> None:
+    """Вебхук-приёмник: проверка секрета, 200 сразу, апдейт — воркеру"""
+    # Воркер в цикле падений останавливает приёмник, как и в режиме polling
+    failed = asyncio.get_running_loop().create_future()
+
+    async def handle(request: web.Request) -> web.Response:
+        if request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401)
+        try:
+            pool.route(await request.json())
+        except RuntimeError as e:
+            if not failed.done():
+                failed.set_exception(e)
+            return web.Response(status=503)
+        return web.Response()
+
+    async def health(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app = web.Application()
+    app.router.add_post(path, handle)
+    app.router.add_get("/health", health)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"Приёмник вебхука слушает {host}:{port}{path}")
+
+    if base_url:
+        bot = Bot(token=token, session=AiohttpSession(api=api))
+        try:
+            await bot.set_webhook(url=base_url.rstrip("/") + path, secret_token=secret,
+                                  allowed_updates=allowed_updates)
+        finally:
+            await bot.session.close()
+    else:
+        logger.warning("Публичный адрес вебхука не задан — setWebhook пропущен")
+    try:
+        await failed
+    finally:
+        await runner.cleanup()
+
+
+def run_sharded(pool: WorkerPool, ingress: Callable[[WorkerPool], Awaitable]) -> None:
+    """Запустить воркеры, обслуживать приёмник до SIGTERM/SIGINT и остановить воркеры.
+
+    Сигнал отменяет приёмник, затем stop() передаёт остановку воркерам и
+    дожидается их: каждый дорабатывает очередь и записывает буферы.
+    Вызывать до запуска цикла событий: воркеры создаются раньше него.
+    """
+    pool.start()
+    try:
+        asyncio.run(_serve_until_signal(ingress(pool)))
+    finally:
+        pool.stop()
+
+
+async def _serve_until_signal(ingress: Awaitable) -> None:
+    task = asyncio.ensure_future(ingress)
+    loop = asyncio.get_running_loop()
+    signals = (signal.SIGTERM, signal.SIGINT)
+    for sig in signals:
+        loop.add_signal_handler(sig, task.cancel)
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.info("Получен сигнал остановки, останавливаю воркеры")
+    finally:
+        for sig in signals:
+            loop.remove_signal_handler(sig)
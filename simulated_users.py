@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Синтетические пользователи для нагрузочных прогонов бота
+Пользователь видит то же, что в Telegram: последнюю клавиатуру бота и
+inline-кнопки последнего сообщения, и жмёт кнопки из них. Поэтому он
+проходит все ветви воронки, не зная её устройства заранее. Используется
+в benchmarks/bench_load.py (без сети) и в telegram_stub.py (по HTTP)
+"""
+
+import random
+from typing import List, Optional, Tuple
+
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+BACK = "◀️ Изменить предыдущий ответ"
+OFFER_MENU = "💳 Купить систему"
+MANUAL_PHONE = "✏️ Ввести номер вручную"
+AI_CONSULTATION = "🤖 Получить AI-консультацию"
+QUESTION_CALLBACKS = ("ask_question", "ask_question_bot")
+QUESTIONS = ["Сколько стоит ремонт двушки?", "Как принимать скрытые работы?", "Какой нужен договор с прорабом?",
+             "Что проверить в смете?", "Когда фотографировать электрику?", "Как выбрать подрядчика?"]
+# Редкий пользователь пишет что-то своё вместо нажатия кнопки
+FREE_TEXT = ["а сколько это стоит", "привет", "как связаться с экспертом", "не понял"]
+FREE_TEXT_RATE = 0.03
+BACK_RATE = 0.12
+MAX_BACKS = 2
+MAX_STEPS = 40
+
+# Шаг пользователя: ("text", текст) | ("contact", телефон) | ("callback", данные)
+Step = Tuple[str, str]
+
+
+class ChatView:
+    """Что пользователь видит в чате: последняя обычная клавиатура и свежие inline-кнопки"""
+
+    __slots__ = ("buttons", "contact_button", "callbacks")
+
+    def __init__(self):
+        self.buttons: List[str] = []
+        self.contact_button = False
+        self.callbacks: List[str] = []
+
+    def show(self, markup) -> None:
+        if isinstance(markup, ReplyKeyboardMarkup):
+            row_buttons = [button for row in markup.keyboard for button in row]
+            self.buttons = [button.text for button in row_buttons if not button.request_contact]
+            self.contact_button = any(button.request_contact for button in row_buttons)
+        elif isinstance(markup, ReplyKeyboardRemove):
+            self.buttons, self.contact_button = [], False
+        # Inline-кнопки под сообщением доступны, пока не пришло следующее сообщение
+        self.callbacks = [button.callback_data for row in markup.inline_keyboard for button in row
+                          if button.callback_data] if isinstance(markup, InlineKeyboardMarkup) else []
+
+
+class SimulatedUser:
+    """Пользователь жмёт кнопки из последней клавиатуры бота; случайность задаёт путь по ветвям.
+
+    Назад — не больше MAX_BACKS раз, меню предложений — один-два захода,
+    после ручного ввода номера и кнопок вопроса — набирает текст.
+    """
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.backs = 0
+        self.offer_visits = 0
+        self.offer_limit = rng.choice((1, 2))
+        self.typing: Optional[str] = None  # что бот попросил набрать: phone | question
+
+    def next_step(self, view: ChatView) -> Optional[Step]:
+        rng = self.rng
+        if self.typing == "phone":
+            self.typing = None
+            return ("text", f"+7 900 {rng.randrange(1000):03d} {rng.randrange(100):02d} 67")
+        if self.typing == "question":
+            self.typing = None
+            return ("text", rng.choice(QUESTIONS))
+        if view.callbacks and rng.random() < 0.5:
+            data = rng.choice(view.callbacks)
+            if data in QUESTION_CALLBACKS:
+                self.typing = "question"
+            return ("callback", data)
+        if rng.random() < FREE_TEXT_RATE:
+            return ("text", rng.choice(FREE_TEXT))
+        if OFFER_MENU in view.buttons:
+            self.offer_visits += 1
+            if self.offer_visits > self.offer_limit:
+                return None
+        if view.contact_button and rng.random() < 0.4:
+            return ("contact", f"+7900{rng.randrange(10 ** 7):07d}")
+        if BACK in view.buttons and self.backs < MAX_BACKS and rng.random() < BACK_RATE:
+            self.backs += 1
+            return ("text", BACK)
+        choices = [text for text in view.buttons if text != BACK]
+        if not choices:
+            return None
+        text = rng.choice(choices)
+        if text == MANUAL_PHONE:
+            self.typing = "phone"
+        elif text == AI_CONSULTATION:
+            self.typing = "question"
+        return ("text", text)
+
+
+def update_payload(update_id: int, user_id: int, step: Step, message_id: Optional[int] = None,
+                   date: int = 0) -> dict:
+    """Апдейт Bot API для шага пользователя в личном чате.
+
+    message_id — сообщение бота, под которым нажата inline-кнопка.
+    """
+    kind, value = step
+    user = {"id": user_id, "is_bot": False, "first_name": "Load"}
+    chat = {"id": user_id, "type": "private", "first_name": "Load"}
+    if kind == "callback":
+        payload = {"callback_query": {
+            "id": str(update_id), "from": user, "chat_instance": str(user_id), "data": value,
+            "message": {"message_id": message_id or update_id, "date": date, "chat": chat, "text": "…"},
+        }}
+    else:
+        message = {"message_id": update_id, "date": date, "chat": chat, "from": user}
+        if kind == "contact":
+            message["contact"] = {"phone_number": value, "first_name": "Load", "user_id": user_id}
+        else:
+            message["text"] = value
+        payload = {"message": message}
+    return {"update_id": update_id, **payload}
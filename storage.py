@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилища данных пользователей бота диагностики
+RepairStorage — в памяти процесса, SQLRepairStorage — в БД через SQLAlchemy
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple, Union
+
+from sqlalchemy import (BigInteger, Column, Integer, MetaData, String, Table, Text,
+                        create_engine, delete, event, func, insert, select)
+from sqlalchemy.exc import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+# ============ ХРАНИЛИЩЕ В ПАМЯТИ ============
+# Поля, под которые в записи сессии есть слот; прочие ключи уходят в extra
+SESSION_FIELDS = (
+    "started_at", "state", "answer",
+    "stage", "stage_text", "area", "area_text",
+    "control", "control_text", "fixation", "fixation_text",
+    "phone", "expert_question", "question_time",
+)
+# Поля с кодами из фиксированного набора (шаг, стадия, площадь...) — только их интернируем:
+# свободный текст пользователя в таблице интернированных строк рос бы без предела
+INTERNED_FIELDS = frozenset(("state", "stage", "area", "control", "fixation"))
+# Ответы в истории — тексты кнопок, одинаковые у всех пользователей: сессия хранит номер
+# текста в общей таблице. Свободный текст, введённый вместо кнопки, тоже попадает
+# в таблицу, поэтому она ограничена: сверх предела ответ хранится самой строкой
+MAX_ANSWER_CODES = 256
+_answer_codes: Dict[str, int] = {}
+_answer_texts: List[str] = []
+
+
+def _encode_answer(answer: Optional[str]):
+    if answer is None:
+        return None
+    code = _answer_codes.get(answer)
+    if code is None:
+        if len(_answer_texts) >= MAX_ANSWER_CODES:
+            return answer
+        code = _answer_codes[answer] = len(_answer_texts)
+        _answer_texts.append(answer)
+    return code
+
+
+def _decode_answer(answer) -> Optional[str]:
+    return _answer_texts[answer] if isinstance(answer, int) else answer
+
+
+class Session:
+    """Компактная запись сессии: слоты вместо словаря, история — кортежи
+    (шаг, номер ответа в общей таблице или строка, unix-время в секундах)"""
+
+    __slots__ = SESSION_FIELDS + ("extra", "history", "touched")
+
+    def __init__(self, touched: float):
+        for name in SESSION_FIELDS:
+            setattr(self, name, None)
+        self.extra: Optional[Dict] = None
+        self.history: List[Tuple[Optional[str], Union[int, str, None], int]] = []
+        self.touched = touched
+
+    def update(self, data: dict):
+        for key, value in data.items():
+            # Коды повторяются у всех пользователей — храним одну копию
+            if key in INTERNED_FIELDS and isinstance(value, str):
+                value = sys.intern(value)
+            if key in SESSION_FIELDS:
+                setattr(self, key, value)
+            elif key != "history":
+                if self.extra is None:
+                    self.extra = {}
+                self.extra[key] = value
+
+    def as_dict(self) -> Dict:
+        data = {name: getattr(self, name) for name in SESSION_FIELDS if getattr(self, name) is not None}
+        if self.extra:
+            data.update(self.extra)
+        data["history"] = self.history_dicts()
+        return data
+
+    def history_dicts(self) -> List[Dict]:
+        return [
+            {"state": state, "answer": _decode_answer(answer), "timestamp": datetime.fromtimestamp(ts).isoformat()}
+            for state, answer, ts in self.history
+        ]
+
+    def size(self) -> int:
+        """Оценка занимаемой памяти в байтах (общие интернированные коды, таблица ответов
+        и малые целые из кэша интерпретатора не считаются)"""
+        total = sys.getsizeof(self) + sys.getsizeof(self.history)
+        for entry in self.history:
+            # Время — отдельный объект int; строкой хранится только ответ, не попавший в таблицу
+            total += sys.getsizeof(entry) + sys.getsizeof(entry[2])
+            if isinstance(entry[1], str):
+                total += sys.getsizeof(entry[1])
+        for name in SESSION_FIELDS:
+            value = getattr(self, name)
+            if isinstance(value, str) and name not in INTERNED_FIELDS:
+                total += sys.getsizeof(value)
+        if self.extra:
+            total += sys.getsizeof(self.extra)
+        return total
+
+
+class RepairStorage:
+    """Хранилище сессий в памяти с ограничением размера.
+
+    Сессии лежат в порядке последнего обращения: при переполнении
+    вытесняется самая давняя, а сессии без обращений дольше ttl
+    удаляются при очередной записи.
+    """
+
+    def __init__(self, max_entries: int = 100_000, ttl: float = 14 * 24 * 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.user_data: "OrderedDict[int, Session]" = OrderedDict()
+
+    async def save(self, user_id: int, data: dict):
+        now = time.time()
+        session = self._touch(user_id, now)
+        if session is None:
+            session = self.user_data[user_id] = Session(now)
+            self._evict(now)
+        session.update(data)
+        if "answer" in data:
+            step = data.get("state")
+            session.history.append((sys.intern(step) if isinstance(step, str) else step,
+                                    _encode_answer(data["answer"]), int(now)))
+
+    async def get(self, user_id: int) -> Optional[Dict]:
+        session = self._touch(user_id, time.time())
+        return session.as_dict() if session else None
+
+    async def get_history(self, user_id: int) -> List:
+        session = self._touch(user_id, time.time())
+        return session.history_dicts() if session else []
+
+    async def clear_last_answer(self, user_id: int):
+        """Удалить последний ответ из истории"""
+        session = self._touch(user_id, time.time())
+        if session and session.history:
+            session.history.pop()
+
+    def stats(self) -> Dict[str, int]:
+        """Количество сессий и оценка занимаемой ими памяти"""
+        size = sys.getsizeof(self.user_data)
+        size += sum(session.size() for session in self.user_data.values())
+        return {"entries": len(self.user_data), "bytes": size}
+
+    def _touch(self, user_id: int, now: float) -> Optional[Session]:
+        session = self.user_data.get(user_id)
+        if session is None:
+            return None
+        if now - session.touched > self.ttl:
+            del self.user_data[user_id]
+            return None
+        session.touched = now
+        self.user_data.move_to_end(user_id)
+        return session
+
+    def _evict(self, now: float):
+        # Самые давние сессии — в начале словаря
+        while len(self.user_data) > self.max_entries:
+            self.user_data.popitem(last=False)
+        while self.user_data:
+            session = next(iter(self.user_data.values()))
+            if now - session.touched <= self.ttl:
+                break
+            self.user_data.popitem(last=False)
+
+
+# ============ ХРАНИЛИЩЕ В БД ============
+metadata = MetaData()
+
+users_table = Table(
+    "repair_users", metadata,
+    Column("user_id", BigInteger, primary_key=True),
+    Column("data", Text, nullable=False),
+    Column("updated_at", String(32), nullable=False),
+)
+
+history_table = Table(
+    "repair_history", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", BigInteger, nullable=False, index=True),
+    Column("state", String(32)),
+    Column("answer", Text),
+    Column("timestamp", String(32), nullable=False),
+)
+
+
+class SQLRepairStorage:
+    """Хранилище в БД с отложенной записью.
+
+    Чтения обслуживаются из памяти, а изменения копятся в очереди
+    и раз в flush_interval секунд сбрасываются в БД одной транзакцией
+    в отдельном потоке — обработчики никогда не ждут диск.
+    Список user_id из БД читается один раз при старте: за пользователем,
+    которого там нет, в БД не ходим — первая запись нового пользователя
+    не ждёт чтения за очередным сбросом. Воркеры делят пользователей по
+    chat_id, поэтому чужой процесс такого пользователя не создаст.
+    """
+
+    def __init__(self, url: str = "sqlite:///repair_bot.db", flush_interval: float = 0.5,
+                 max_cached: int = 100_000):
+        self.url = url
+        self.flush_interval = flush_interval
+        self.max_cached = max_cached
+        self.engine = create_engine(url)
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", _sqlite_pragmas)
+        # Один поток на все обращения к БД: запись идёт строго по порядку
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="repair-db")
+        self._schema_ready = False
+        # Кэш в порядке последнего обращения; вытесняются только уже записанные в БД
+        self.user_data: "OrderedDict[int, Dict]" = OrderedDict()
+        self._dirty: Set[int] = set()
+        # Пользователи, которые сейчас пишутся: не вытесняются, пока запись не удалась
+        self._inflight: Set[int] = set()
+        self._history_ops: List[Tuple] = []
+        self._flusher: Optional[asyncio.Task] = None
+        # user_id, у которых есть строка в БД или запись в кэше; None — до start()
+        self._known: Optional[Set[int]] = None
+
+    # ---------- интерфейс RepairStorage ----------
+    async def save(self, user_id: int, data: dict):
+        record = await self._load(user_id)
+        if record is None:
+            record = self.user_data[user_id] = {"history": []}
+            if self._known is not None:
+                self._known.add(user_id)
+        record.update(data)
+        if "answer" in data:
+            entry = {
+                "state": data.get("state"),
+                "answer": data.get("answer"),
+                "timestamp": datetime.now().isoformat()
+            }
+            record["history"].append(entry)
+            self._history_ops.append(("add", user_id, entry))
+        self._dirty.add(user_id)
+        self._evict_clean()
+        self._ensure_flusher()
+
+    async def get(self, user_id: int) -> Optional[Dict]:
+        return await self._load(user_id)
+
+    async def get_history(self, user_id: int) -> List:
+        data = await self.get(user_id)
+        return data.get("history", []) if data else []
+
+    async def clear_last_answer(self, user_id: int):
+        """Удалить последний ответ из истории"""
+        record = await self._load(user_id)
+        if record and record["history"]:
+            record["history"].pop()
+            self._history_ops.append(("pop", user_id, None))
+            self._ensure_flusher()
+
+    # ---------- жизненный цикл ----------
+    async def start(self):
+        await self._run(self._create_schema)
+        self._known = await self._run(self._read_user_ids)
+        logger.info(f"💾 Пользователей в БД: {len(self._known)}")
+        self._ensure_flusher()
+
+    async def close(self):
+        if self._flusher is not None:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        await self._run(self.engine.dispose)
+        self._executor.shutdown(wait=True)
+
+    async def flush(self):
+        """Записать накопленные изменения одной транзакцией"""
+        if not self._dirty and not self._history_ops:
+            return
+        dirty, self._dirty = self._dirty, set()
+        ops, self._history_ops = self._history_ops, []
+        self._inflight |= dirty
+        now = datetime.now().isoformat()
+        rows = [
+            {"user_id": user_id, "data": _dump_record(self.user_data[user_id]), "updated_at": now}
+            for user_id in dirty if user_id in self.user_data
+        ]
+        try:
+            await self._run(self._write_batch, rows, ops)
+        except Exception as e:
+            # Возвращаем пачку в очередь, следующий сброс повторит попытку
+            logger.error(f"Ошибка записи в БД ({len(rows)} пользователей, {len(ops)} ответов): {e}")
+            self._dirty |= dirty
+            self._history_ops[:0] = ops
+            return
+        finally:
+            self._inflight -= dirty
+        self._evict_clean()
+
+    # ---------- внутреннее ----------
+    def _ensure_flusher(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _evict_clean(self):
+        excess = len(self.user_data) - self.max_cached
+        if excess <= 0:
+            return
+        clean = []
+        for user_id in self.user_data:
+            if user_id not in self._dirty and user_id not in self._inflight:
+                clean.append(user_id)
+                if len(clean) == excess:
+                    break
+        for user_id in clean:
+            del self.user_data[user_id]
+
+    async def _load(self, user_id: int) -> Optional[Dict]:
+        record = self.user_data.get(user_id)
+        if record is not None:
+            self.user_data.move_to_end(user_id)
+        elif self._known is not None and user_id not in self._known:
+            # Нового пользователя нет ни в кэше, ни в БД — читать нечего
+            return None
+        else:
+            record = await self._run(self._read_user, user_id)
+            # Пока ждали БД, запись могла появиться в памяти
+            if user_id in self.user_data:
+                return self.user_data[user_id]
+            if record is not None:
+                self.user_data[user_id] = record
+                # Одни чтения тоже наполняют кэш, а сброс без изменений его не чистит
+                self._evict_clean()
+        return record
+
+    def _create_schema(self):
+        if not self._schema_ready:
+            try:
+                metadata.create_all(self.engine)
+            except OperationalError:
+                # Воркеры на пустой БД создают таблицы одновременно: проигравший видит
+                # "table already exists"; повтор уже найдёт таблицы и ничего не создаст
+                metadata.create_all(self.engine)
+            self._schema_ready = True
+
+    def _read_user_ids(self) -> Set[int]:
+        self._create_schema()
+        with self.engine.connect() as conn:
+            return set(conn.execute(select(users_table.c.user_id)).scalars())
+
+    def _read_user(self, user_id: int) -> Optional[Dict]:
+        self._create_schema()
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(users_table.c.data).where(users_table.c.user_id == user_id)
+            ).first()
+            if row is None:
+                return None
+            history = conn.execute(
+                select(history_table.c.state, history_table.c.answer, history_table.c.timestamp)
+                .where(history_table.c.user_id == user_id)
+                .order_by(history_table.c.id)
+            ).all()
+        record = json.loads(row.data)
+        record["history"] = [
+            {"state": h.state, "answer": h.answer, "timestamp": h.timestamp} for h in history
+        ]
+        return record
+
+    def _write_batch(self, rows: List[Dict], ops: List[Tuple]):
+        self._create_schema()
+        with self.engine.begin() as conn:
+            if rows:
+                conn.execute(delete(users_table).where(
+                    users_table.c.user_id.in_([row["user_id"] for row in rows])))
+                conn.execute(insert(users_table), rows)
+            # Подряд идущие ответы вставляем одним executemany
+            added: List[Dict] = []
+            for op, user_id, entry in ops:
+                if op == "add":
+                    added.append({"user_id": user_id, **entry})
+                    continue
+                if added:
+                    conn.execute(insert(history_table), added)
+                    added = []
+                last_id = select(func.max(history_table.c.id)).where(
+                    history_table.c.user_id == user_id).scalar_subquery()
+                conn.execute(delete(history_table).where(history_table.c.id == last_id))
+            if added:
+                conn.execute(insert(history_table), added)
+
+
+def _dump_record(record: Dict) -> str:
+    return json.dumps({k: v for k, v in record.items() if k != "history"}, ensure_ascii=False)
+
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL: читатели не блокируют писателя, fsync только на чекпоинтах
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Файл может быть общим для нескольких процессов-воркеров: ждём блокировку, а не падаем
+    cursor.execute("PRAGMA busy_timeout=10000")
+    cursor.close()
@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Локальная заглушка Telegram Bot API для нагрузочных прогонов по HTTP
+Отвечает на методы, которыми пользуется бот (getMe, getUpdates,
+sendMessage, editMessageText, answerCallbackQuery и др.), с настраиваемой
+задержкой и ответами 429. Синтетические пользователи (simulated_users.py)
+пишут боту и жмут кнопки из его клавиатур; апдейты отдаются через
+getUpdates или доставляются на вебхук, если бот его установил
+
+Запуск: python telegram_stub.py [--port 8081] [--users 100] [--latency 0.05] [--flood-rate 0.01]
+Бот:    TELEGRAM_API_URL=http://127.0.0.1:8081 REPAIR_BOT_TOKEN=123456:STUB python bot2.py
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+from aiogram.types import InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+from flood import GLOBAL_BURST, GLOBAL_RATE, PRIVATE_BURST, PRIVATE_RATE, TokenBucket
+from simulated_users import MAX_STEPS, ChatView, SimulatedUser, Step, update_payload
+
+logger = logging.getLogger(__name__)
+
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Repair Stub", "username": "repair_stub_bot",
+            "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+# Методы, на которые могут прийти 429 (случайные или по лимитам)
+FLOODABLE = frozenset({"sendMessage", "editMessageText", "sendChatAction", "answerCallbackQuery"})
+# Методы, которые считаются сообщением в чат для лимитов Telegram
+LIMITED = frozenset({"sendMessage", "editMessageText"})
+
+# Первый ID синтетического пользователя
+FIRST_USER_ID = 100000
+
+# Повторы доставки на вебхук: число попыток и шаг паузы между ними, с
+WEBHOOK_ATTEMPTS = 5
+WEBHOOK_RETRY_DELAY = 0.5
+
+
+def _markup(value: Any):
+    """reply_markup из формы (JSON-строка) в объект aiogram для ChatView"""
+    if isinstance(value, str):
+        value = json.loads(value)
+    if not isinstance(value, dict):
+        return None
+    if "inline_keyboard" in value:
+        return InlineKeyboardMarkup.model_validate(value)
+    if "keyboard" in value:
+        return ReplyKeyboardMarkup.model_validate(value)
+    if value.get("remove_keyboard"):
+        return ReplyKeyboardRemove.model_validate(value)
+    return None
+
+
+class ApiError(Exception):
+    """Ошибка метода API с кодом Telegram (400, 409, ...)"""
+
+    def __init__(self, code: int, description: str):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+
+
+class ChatState:
+    """Что заглушка знает о личном чате синтетического пользователя"""
+
+    __slots__ = ("view", "message_ids", "inline_message_id", "last_message_at", "replied", "waiting_since")
+
+    def __init__(self):
+        self.view = ChatView()
+        self.message_ids = 0
+        self.inline_message_id: Optional[int] = None
+        self.last_message_at = 0.0
+        self.replied = asyncio.Event()
+        self.waiting_since = 0.0
+
+
+class FakeTelegram:
+    """Состояние заглушки: очередь апдейтов, вебхук, чаты, пользователи и статистика.
+
+    latency ± jitter — задержка каждого ответа API; flood_rate — доля
+    запросов FLOODABLE, на которые приходит 429 с retry_after; limits —
+    ещё и настоящие лимиты Telegram (1 сообщение в секунду в чат с
+    небольшим всплеском, 30 в секунду на бота). users пользователей
+    начинают писать, когда бот впервые запросит апдейты или установит
+    вебхук; одновременно в диалоге не больше concurrency. Следующий шаг
+    пользователь делает, когда бот ответил и think секунд молчит.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, flood_rate: float = 0.0, retry_after: int = 1,
+                 limits: bool = False, users: int = 0, concurrency: int = 100, think: float = 1.2,
+                 reply_timeout: float = 30.0, seed: int = 1):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.retry_after = retry_after
+        self.limits = limits
+        self.users = users
+        self.concurrency = concurrency
+        self.think = think
+        self.reply_timeout = reply_timeout
+        self.rng = random.Random(seed)
+
+        self.updates: Deque[dict] = deque()
+        self.next_update_id = 1
+        self._new_updates = asyncio.Event()
+        self.webhook_url = ""
+        self.webhook_secret = ""
+        self._webhook_queue: "asyncio.Queue[dict]" = asyncio.Queue()
+        self._webhook_tasks: List[asyncio.Task] = []
+        self._http: Optional[aiohttp.ClientSession] = None
+
+        self.chats: Dict[int, ChatState] = {}
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST, time.monotonic())
+        self._users_task: Optional[asyncio.Task] = None
+        self.done = asyncio.Event()
+
+        # Статистика
+        self.requests: Counter = Counter()
+        self.flood_injected = 0
+        self.flood_limited = 0
+        self.pushed = 0
+        self.delivered = 0
+        self.webhook_errors = 0
+        self.finished_users = 0
+        self.lost_users = 0
+        self.reply_latencies: List[float] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    # ---------- HTTP ----------
+    def build_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self.handle_api)
+        app.router.add_get("/stats", self.handle_stats)
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response(self.stats())
+
+    async def handle_api(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params: Dict[str, Any] = dict(request.query)
+        if request.content_type == "application/json":
+            params.update(await request.json())
+        elif request.can_read_body:
+            params.update(await request.post())
+        self.requests[method] += 1
+
+        if method != "getUpdates":
+            await self._delay()
+        if method in FLOODABLE:
+            retry_after = self._flood_check(method, params)
+            if retry_after:
+                return web.json_response({
+                    "ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {retry_after}",
+                    "parameters": {"retry_after": retry_after},
+                }, status=429)
+
+        handler = getattr(self, f"_api_{method}", None)
+        try:
+            result = await handler(params) if handler else True
+        except ApiError as e:
+            return web.json_response({"ok": False, "error_code": e.code, "description": e.description},
+                                     status=e.code)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _delay(self):
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+    def _flood_check(self, method: str, params: Dict[str, Any]) -> int:
+        """retry_after, если запрос отклоняется с 429; 0 — пропустить"""
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.flood_injected += 1
+            return self.retry_after
+        if not self.limits or method not in LIMITED:
+            return 0
+        now = time.monotonic()
+        chat_id = int(params.get("chat_id", 0))
+        chat_bucket = self._chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self._chat_buckets[chat_id] = TokenBucket(PRIVATE_RATE, PRIVATE_BURST, now)
+        for bucket in (chat_bucket, self._global_bucket):
+            wait = bucket.reserve(now)
+            if wait > 0:
+                # Отклонённый запрос токен не тратит
+                bucket.tokens += 1
+                if bucket is self._global_bucket:
+                    chat_bucket.tokens += 1
+                self.flood_limited += 1
+                return max(1, math.ceil(wait))
+        return 0
+
+    # ---------- методы API ----------
+    async def _api_getMe(self, params):
+        return BOT_USER
+
+    async def _api_getUpdates(self, params):
+        if self.webhook_url:
+            raise ApiError(409, "Conflict: can't use getUpdates method while webhook is active; "
+                                "use deleteWebhook to delete the webhook first")
+        self._start_users()
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        timeout = float(params.get("timeout", 0))
+        while self.updates and self.updates[0]["update_id"] < offset:
+            self.updates.popleft()
+        if not self.updates and timeout > 0:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch = [update for _, update in zip(range(limit), self.updates)]
+        self.delivered += len(batch)
+        return batch
+
+    async def _api_setWebhook(self, params):
+        self.webhook_url = params.get("url", "")
+        self.webhook_secret = params.get("secret_token", "")
+        if self.webhook_url:
+            # Апдейты, накопленные для getUpdates, уходят на вебхук
+            while self.updates:
+                self._webhook_queue.put_nowait(self.updates.popleft())
+            connections = int(params.get("max_connections", 40))
+            self._stop_webhook_senders()
+            self._webhook_tasks = [asyncio.create_task(self._webhook_sender()) for _ in range(connections)]
+            self._start_users()
+        logger.info(f"Вебхук: {self.webhook_url or 'снят'}")
+        return True
+
+    async def _api_deleteWebhook(self, params):
+        self.webhook_url = ""
+        self._stop_webhook_senders()
+        return True
+
+    async def _api_getWebhookInfo(self, params):
+        return {"url": self.webhook_url, "has_custom_certificate": False,
+                "pending_update_count": len(self.updates) + self._webhook_queue.qsize()}
+
+    async def _api_sendMessage(self, params):
+        chat_id = int(params["chat_id"])
+        chat = self._chat(chat_id)
+        chat.message_ids += 1
+        message = {"message_id": chat.message_ids, "date": int(time.time()), "from": BOT_USER,
+                   "chat": {"id": chat_id, "type": "private", "first_name": "Load"}, "text": params.get("text", "")}
+        markup = _markup(params.get("reply_markup"))
+        chat.view.show(markup)
+        if isinstance(markup, InlineKeyboardMarkup):
+            chat.inline_message_id = chat.message_ids
+            message["reply_markup"] = markup.model_dump(exclude_none=True)
+        self._bot_replied(chat)
+        return message
+
+    async def _api_editMessageText(self, params):
+        if "chat_id" not in params:
+            return True
+        chat_id = int(params["chat_id"])
+        chat = self._chat(chat_id)
+        self._bot_replied(chat)
+        return {"message_id": int(params["message_id"]), "date": int(time.time()), "edit_date": int(time.time()),
+                "from": BOT_USER, "chat": {"id": chat_id, "type": "private", "first_name": "Load"},
+                "text": params.get("text", "")}
+
+    # ---------- апдейты ----------
+    def push_update(self, payload_for_id) -> None:
+        """Поставить апдейт в доставку; payload_for_id(update_id) строит его тело"""
+        update = payload_for_id(self.next_update_id)
+        self.next_update_id += 1
+        self.pushed += 1
+        if self.webhook_url:
+            self._webhook_queue.put_nowait(update)
+        else:
+            self.updates.append(update)
+            self._new_updates.set()
+
+    async def _webhook_sender(self):
+        if self._http is None:
+            self._http = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        while True:
+            update = await self._webhook_queue.get()
+            headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+            # Как и Telegram, повторяем доставку, пока вебхук не примет апдейт
+            for attempt in range(WEBHOOK_ATTEMPTS):
+                try:
+                    async with self._http.post(self.webhook_url, json=update, headers=headers) as response:
+                        if response.status == 200:
+                            self.delivered += 1
+                            break
+                        error = f"HTTP {response.status}"
+                except aiohttp.ClientError as e:
+                    error = str(e)
+                self.webhook_errors += 1
+                logger.warning(f"Вебхук не принял апдейт {update['update_id']} ({error}), попытка {attempt + 1}")
+                await asyncio.sleep(WEBHOOK_RETRY_DELAY * (attempt + 1))
+
+    def _stop_webhook_senders(self):
+        for task in self._webhook_tasks:
+            task.cancel()
+        self._webhook_tasks = []
+
+    # ---------- пользователи ----------
+    def _chat(self, chat_id: int) -> ChatState:
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = ChatState()
+        return chat
+
+    def _bot_replied(self, chat: ChatState) -> None:
+        now = time.monotonic()
+        chat.last_message_at = now
+        if not chat.replied.is_set():
+            if chat.waiting_since:
+                self.reply_latencies.append(now - chat.waiting_since)
+            chat.replied.set()
+
+    def _start_users(self) -> None:
+        if self.users and self._users_task is None:
+            self._users_task = asyncio.create_task(self._run_users())
+
+    async def _run_users(self):
+        self.started_at = time.monotonic()
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def limited(user_id: int, user: SimulatedUser):
+            async with semaphore:
+                await self._simulate(user_id, user)
+
+        users = [SimulatedUser(random.Random(self.rng.random())) for _ in range(self.users)]
+        await asyncio.gather(*(limited(FIRST_USER_ID + index, user) for index, user in enumerate(users)))
+        self.finished_at = time.monotonic()
+        self.done.set()
+        logger.info(f"Пользователи закончили: {json.dumps(self.stats(), ensure_ascii=False)}")
+
+    async def _simulate(self, user_id: int, user: SimulatedUser):
+        chat = self._chat(user_id)
+        step: Optional[Step] = ("text", "/start")
+        for _ in range(MAX_STEPS):
+            chat.replied.clear()
+            chat.waiting_since = time.monotonic()
+            message_id = chat.inline_message_id
+            self.push_update(lambda update_id: update_payload(update_id, user_id, step, message_id, int(time.time())))
+            try:
+                await asyncio.wait_for(chat.replied.wait(), self.reply_timeout)
+            except asyncio.TimeoutError:
+                self.lost_users += 1
+                logger.warning(f"Бот не ответил пользователю {user_id} за {self.reply_timeout} с")
+                return
+            # Бот может отвечать несколькими сообщениями — ждём, пока замолчит
+            while (quiet := time.monotonic() - chat.last_message_at) < self.think:
+                await asyncio.sleep(self.think - quiet)
+            step = user.next_step(chat.view)
+            if step is None:
+                break
+        self.finished_users += 1
+
+    # ---------- итоги ----------
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self.reply_latencies)
+
+        def percentile(share: float) -> Optional[float]:
+            return round(latencies[min(len(latencies) - 1, int(len(latencies) * share))], 4) if latencies else None
+
+        elapsed = ((self.finished_at or time.monotonic()) - self.started_at) if self.started_at else 0.0
+        return {
+            "users_finished": self.finished_users, "users_lost": self.lost_users,
+            "updates_pushed": self.pushed, "updates_delivered": self.delivered,
+            "updates_per_second": round(self.pushed / elapsed, 1) if elapsed else 0.0,
+            "reply_p50": percentile(0.5), "reply_p99": percentile(0.99),
+            "flood_injected": self.flood_injected, "flood_limited": self.flood_limited,
+            "webhook_errors": self.webhook_errors, "elapsed": round(elapsed, 2),
+            "requests": dict(self.requests),
+        }
+
+    async def _cleanup(self, app: web.Application):
+        self._stop_webhook_senders()
+        if self._users_task is not None:
+            self._users_task.cancel()
+        if self._http is not None:
+            await self._http.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заглушка Telegram Bot API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа API, с")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки ±, с")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="доля отправок, получающих 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--limits", action="store_true", help="отвечать 429 при превышении лимитов Telegram")
+    parser.add_argument("--users", type=int, default=0, help="синтетических пользователей")
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--think", type=float, default=1.2, help="сколько бот должен молчать, чтобы пользователь ответил, с")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    async def serve():
+        fake = FakeTelegram(latency=args.latency, jitter=args.jitter, flood_rate=args.flood_rate,
+                            retry_after=args.retry_after, limits=args.limits, users=args.users,
+                            concurrency=args.concurrency, think=args.think, seed=args.seed)
+        runner = web.AppRunner(fake.build_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host=args.host, port=args.port).start()
+        print(f"🧪 Заглушка Bot API: http://{args.host}:{args.port} (итоги: /stats)")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
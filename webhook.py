@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Режим вебхука для бота диагностики
+Встроенный aiohttp-сервер принимает обновления от Telegram,
+проверяет секретный токен, сразу отвечает 200 и обрабатывает апдейт в фоне
+"""
+
+import asyncio
+import hashlib
+import logging
+import signal
+from contextlib import suppress
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+logger = logging.getLogger(__name__)
+
+
+def derive_secret(token: str) -> str:
+    """Секрет вебхука из токена: одинаковый на всех инстансах за балансировщиком"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def _health(request: web.Request) -> web.Response:
+    return web.Response(text="ok")
+
+
+def build_app(dispatcher: Dispatcher, bot: Bot, path: str, secret: str) -> web.Application:
+    """aiohttp-приложение с обработчиком вебхука и проверкой живости"""
+    app = web.Application()
+    # handle_in_background: Telegram получает 200 сразу, апдейт обрабатывается отдельной задачей
+    SimpleRequestHandler(
+        dispatcher=dispatcher,
+        bot=bot,
+        secret_token=secret,
+        handle_in_background=True,
+    ).register(app, path=path)
+    app.router.add_get("/health", _health)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, *, base_url: str, path: str,
+                      secret: str, host: str = "0.0.0.0", port: int = 8080):
+    """Поднять сервер и только затем зарегистрировать вебхук; обслуживать до SIGTERM/SIGINT.
+
+    setWebhook вызывается после site.start(): иначе Telegram начинает слать
+    апдейты на ещё закрытый порт и откладывает повторы. Сигнал остановки
+    (как handle_signals в start_polling) завершает ожидание, и
+    runner.cleanup() выполняет shutdown-хуки диспетчера — буферы
+    хранилищ и журнала заявок успевают записаться.
+    """
+    url = base_url.rstrip("/") + path
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    signals = (signal.SIGTERM, signal.SIGINT)
+    for sig in signals:
+        with suppress(NotImplementedError):  # Windows
+            loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(build_app(dispatcher, bot, path, secret))
+    # setup() выполняет startup-хуки диспетчера
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=port)
+    await site.start()
+    logger.info(f"Вебхук-сервер слушает {host}:{port}{path}")
+    try:
+        if base_url:
+            await bot.set_webhook(
+                url=url,
+                secret_token=secret,
+                allowed_updates=dispatcher.resolve_used_update_types(),
+            )
+            logger.info(f"Вебхук установлен: {url}")
+        else:
+            logger.warning("Публичный адрес вебхука не задан — setWebhook пропущен")
+        await stop.wait()
+        logger.info("Получен сигнал остановки, вебхук-сервер завершается")
+    finally:
+        for sig in signals:
+            with suppress(NotImplementedError):
+                loop.remove_signal_handler(sig)
+        await runner.cleanup()